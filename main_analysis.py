@@ -6,11 +6,28 @@ Cyclistic Bike-Share Analysis - Main Script
 This script runs the complete Cyclistic bike-share analysis pipeline.
 
 Usage:
-    python main_analysis.py [--sample] [--output-dir OUTPUT_DIR]
+    python main_analysis.py [--sample] [--output-dir OUTPUT_DIR] [--chunksize N]
+                            [--no-cache] [--rebuild-cache] [--compact]
+                            [--files PATTERN] [--workers N] [--incremental]
+                            [--watch] [--poll-interval SECONDS] [--sqlite PATH]
+                            [--column-store DIR] [--parallel]
 
 Options:
     --sample        Use sample data instead of original files
     --output-dir    Directory to save results (default: results/)
+    --chunksize     Stream the CSV files in chunks of N rows
+    --no-cache      Do not read or write the cleaned-data cache
+    --rebuild-cache Ignore the cleaned-data cache and rebuild it
+    --compact       Store the prepared data with compact dtypes
+    --files         Glob pattern or directory of trip files to analyze
+    --workers       Number of worker processes used with --files
+    --incremental   Merge only new or changed --files into the saved state
+    --watch         Keep refreshing the results as trip files land in data/raw/
+    --poll-interval Seconds between checks for new files in --watch mode
+    --sqlite        Keep the prepared trips in a SQLite database at PATH
+    --column-store  Reopen the prepared trips memory-mapped from DIR while
+                    the source files are unchanged
+    --parallel      Prepare the 2019 and 2020 files in parallel processes
 
 Author: Muhammad Baihaqi
 License: MIT
@@ -18,15 +35,18 @@ License: MIT
 
 import argparse
 import sys
+import time
 from pathlib import Path
 import warnings
 
 # Add src directory to path for imports
 sys.path.append(str(Path(__file__).parent / 'src'))
 
-from src.cyclistic_analyzer import CyclisticAnalyzer
+from src.cyclistic_analyzer import CyclisticAnalyzer, PIPELINE_VERSION
 from src.visualizations import CyclisticVisualizer
-from src.data_utils import DataManager
+from src.data_utils import DataManager, find_trip_files, trip_file_root
+from src.analysis_state import STATE_FILE
+from src.column_store import MANIFEST_FILE, read_source_key
 
 warnings.filterwarnings('ignore')
 
@@ -40,6 +60,43 @@ def main():
                        help='Directory to save results (default: results/)')
     parser.add_argument('--no-visualizations', action='store_true',
                        help='Skip generating visualizations')
+    parser.add_argument('--chunksize', type=int, default=None,
+                       help='Stream the CSV files in chunks of this many rows '
+                            'to bound memory use')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Do not read or write the cleaned-data cache in data/processed/')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                       help='Ignore the cleaned-data cache and rebuild it')
+    parser.add_argument('--compact', action='store_true',
+                       help='Store the prepared data with categorical and narrow numeric dtypes')
+    parser.add_argument('--files', default=None,
+                       help='Glob pattern or directory of Divvy trip files to analyze '
+                            '(e.g. "data/raw/*.csv"); formats are detected per file')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Number of worker processes used with --files (default: CPU count)')
+    parser.add_argument('--incremental', action='store_true',
+                       help='With --files, prepare only new or changed files and merge them '
+                            'into the analysis state saved in data/processed/')
+    parser.add_argument('--watch', action='store_true',
+                       help='Keep running and refresh the results whenever a trip file is '
+                            'added to or changed in data/raw/ (or --files); implies --incremental')
+    parser.add_argument('--poll-interval', type=float, default=2.0,
+                       help='Seconds between checks for new files in --watch mode (default: 2)')
+    parser.add_argument('--sqlite', default=None, metavar='PATH',
+                       help='Move the prepared trips into a SQLite database at PATH and '
+                            'run the analyses as SQL instead of in memory')
+    parser.add_argument('--column-store', default=None, metavar='DIR',
+                       help='Open the prepared trips memory-mapped from the column store in DIR '
+                            'if it was written from the same source files, otherwise prepare '
+                            'them and save them there (use --rebuild-cache to refresh it)')
+    parser.add_argument('--parallel', action='store_true',
+                       help='Prepare the 2019 and 2020 files in parallel worker processes')
+    parser.add_argument('--lazy-columns', action='store_true',
+                       help='Derive calendar columns only when an analysis or chart needs them')
+    parser.add_argument('--parallel-charts', action='store_true',
+                       help='Render the charts concurrently in worker processes')
+    parser.add_argument('--rerender-charts', action='store_true',
+                       help='Redraw every chart even if its inputs have not changed')
     
     args = parser.parse_args()
     
@@ -57,94 +114,58 @@ def main():
     # Initialize data manager
     print("Setting up data...")
     data_manager = DataManager()
+    state_path = data_manager.processed_dir / STATE_FILE
+    if args.watch:
+        args.files = args.files or str(data_manager.raw_dir)
+        args.incremental = True
     
     try:
-        # Setup data
-        file_2019, file_2020, is_sample = data_manager.setup_data(force_sample=args.sample)
-        
-        if is_sample:
-            print("📊 Using sample data for demonstration")
-        else:
-            print("📊 Using original Divvy trip data")
-        
-        print(f"Data files:")
-        print(f"  - 2019 Q1: {file_2019}")
-        print(f"  - 2020 Q1: {file_2020}")
-        print()
-        
-        # Initialize analyzer
-        print("Initializing analyzer...")
-        analyzer = CyclisticAnalyzer()
-        
-        # Prepare data
-        print("Preparing data...")
-        if file_2019.exists() and file_2020.exists():
-            analyzer.prepare_data(str(file_2019), str(file_2020))
-        else:
-            analyzer.prepare_data()  # Use built-in sample data
-        
-        print()
-        
-        # Run analysis
-        print("Running comprehensive analysis...")
-        results = analyzer.run_complete_analysis()
-        
-        if results:
-            # Save results to file
-            results_file = output_dir / 'analysis_results.txt'
-            with open(results_file, 'w') as f:
-                f.write("CYCLISTIC BIKE-SHARE ANALYSIS RESULTS\n")
-                f.write("="*50 + "\n\n")
-                
-                for key, value in results.items():
-                    if isinstance(value, (int, float)):
-                        if isinstance(value, float):
-                            f.write(f"{key}: {value:.2f}\n")
-                        else:
-                            f.write(f"{key}: {value:,}\n")
-                    else:
-                        f.write(f"{key}: {value}\n")
-            
-            print(f"\n📄 Analysis results saved to: {results_file}")
-        
-        # Generate summary report
-        print("\n" + "="*60)
-        analyzer.generate_summary_report()
-        
-        # Generate visualizations
-        if not args.no_visualizations:
-            print("\n" + "="*60)
-            print("GENERATING VISUALIZATIONS")
-            print("="*60)
+        store_key = column_store_source_key(args, data_manager) if args.column_store else None
+        opened_store = (args.column_store and not args.watch and not args.rebuild_cache
+                        and read_source_key(args.column_store) == store_key)
+        if args.column_store and not opened_store and (Path(args.column_store) / MANIFEST_FILE).exists():
+            print(f"Column store {args.column_store} is out of date with the source files; rebuilding it")
+        if opened_store:
+            print(f"📊 Using prepared trips from column store: {args.column_store}")
+            print()
             
-            # Initialize visualizer
-            visualizer = CyclisticVisualizer(analyzer)
+            print("Initializing analyzer...")
+            analyzer = CyclisticAnalyzer(lazy_columns=args.lazy_columns)
+            analyzer.open_column_store(args.column_store)
+        elif args.files:
+            print(f"📊 Using trip files matching: {args.files}")
+            print()
             
-            # Create visualization output directory
-            viz_dir = output_dir / "visualizations"
-            viz_dir.mkdir(exist_ok=True)
+            print("Initializing analyzer...")
+            analyzer = CyclisticAnalyzer(lazy_columns=args.lazy_columns)
             
-            try:
-                # Generate all visualizations
-                visualizer.generate_all_visualizations(str(viz_dir))
-                print(f"📊 Visualizations saved to: {viz_dir}")
-            except Exception as e:
-                print(f"⚠️  Error generating visualizations: {e}")
-                print("This might be due to missing display or matplotlib backend issues.")
+            print("Preparing data...")
+            if args.incremental:
+                analyzer.update_state(args.files, state_path, max_workers=args.workers,
+                                      chunksize=args.chunksize, root=trip_file_root(args.files))
+                if not analyzer.get_aggregates().total_rides and not args.watch:
+                    sys.exit(1)
+            elif not analyzer.prepare_files(args.files, max_workers=args.workers,
+                                            keep_rows=args.chunksize is None,
+                                            chunksize=args.chunksize):
+                sys.exit(1)
+            if args.compact and analyzer.df_combined is not None:
+                analyzer.df_combined = analyzer.optimize_dtypes(analyzer.df_combined)
+        else:
+            analyzer = prepare_default_data(args, data_manager)
         
-        # Generate business recommendations
-        print("\n" + "="*60)
-        print("BUSINESS RECOMMENDATIONS")
-        print("="*60)
+        if args.column_store and not opened_store and analyzer.df_combined is not None:
+            # Keyed again, since setting up the data may have created the sample files
+            analyzer.save_column_store(args.column_store,
+                                       source_key=column_store_source_key(args, data_manager))
         
-        recommendations = generate_recommendations(results)
+        if args.sqlite and analyzer.df_combined is not None:
+            analyzer.use_sqlite(args.sqlite)
         
-        # Save recommendations
-        recommendations_file = output_dir / 'business_recommendations.md'
-        with open(recommendations_file, 'w') as f:
-            f.write(recommendations)
+        print()
         
-        print(f"💡 Business recommendations saved to: {recommendations_file}")
+        if analyzer.get_aggregates().total_rides:
+            publish_results(analyzer, args, output_dir)
         
         print("\n" + "="*60)
         print("ANALYSIS COMPLETE")
@@ -156,12 +177,216 @@ def main():
         if not args.no_visualizations:
             print(f"  - visualizations/ (PNG files)")
         
+        if args.watch:
+            watch_trip_files(analyzer, args, state_path, output_dir)
+        
     except Exception as e:
         print(f"❌ Error during analysis: {e}")
         print("\nPlease check your data files and try again.")
         sys.exit(1)
 
 
+def publish_results(analyzer, args, output_dir):
+    """
+    Run the analysis and write the results, charts and recommendations.
+    
+    Charts whose inputs did not change since the last run are kept as they
+    are unless ``--rerender-charts`` is given.
+    
+    Args:
+        analyzer (CyclisticAnalyzer): Analyzer with prepared data
+        args (Namespace): Parsed command-line arguments
+        output_dir (Path): Directory to save results
+    """
+    # Run analysis
+    print("Running comprehensive analysis...")
+    results = analyzer.run_complete_analysis()
+    
+    if results:
+        # Save results to file
+        results_file = output_dir / 'analysis_results.txt'
+        with open(results_file, 'w') as f:
+            f.write("CYCLISTIC BIKE-SHARE ANALYSIS RESULTS\n")
+            f.write("="*50 + "\n\n")
+            
+            for key, value in results.items():
+                if isinstance(value, (int, float)):
+                    if isinstance(value, float):
+                        f.write(f"{key}: {value:.2f}\n")
+                    else:
+                        f.write(f"{key}: {value:,}\n")
+                else:
+                    f.write(f"{key}: {value}\n")
+        
+        print(f"\n📄 Analysis results saved to: {results_file}")
+    
+    # Generate summary report
+    print("\n" + "="*60)
+    analyzer.generate_summary_report()
+    
+    # Generate visualizations
+    if not args.no_visualizations:
+        print("\n" + "="*60)
+        print("GENERATING VISUALIZATIONS")
+        print("="*60)
+        
+        # Initialize visualizer; charts are only saved, so render headlessly
+        visualizer = CyclisticVisualizer(analyzer, headless=True)
+        
+        # Create visualization output directory
+        viz_dir = output_dir / "visualizations"
+        viz_dir.mkdir(exist_ok=True)
+        
+        try:
+            # Generate all visualizations
+            visualizer.generate_all_visualizations(str(viz_dir), parallel=args.parallel_charts,
+                                              use_cache=not args.rerender_charts)
+            print(f"📊 Visualizations saved to: {viz_dir}")
+        except Exception as e:
+            print(f"⚠️  Error generating visualizations: {e}")
+            print("This might be due to missing display or matplotlib backend issues.")
+    
+    # Generate business recommendations
+    print("\n" + "="*60)
+    print("BUSINESS RECOMMENDATIONS")
+    print("="*60)
+    
+    recommendations = generate_recommendations(results)
+    
+    # Save recommendations
+    recommendations_file = output_dir / 'business_recommendations.md'
+    with open(recommendations_file, 'w') as f:
+        f.write(recommendations)
+    
+    print(f"💡 Business recommendations saved to: {recommendations_file}")
+
+
+def column_store_source_key(args, data_manager):
+    """
+    Key of the source files and pipeline that the column store must match.
+    
+    Covers the ``--files`` trip files, or the Q1 files the default run
+    would prepare, like the cleaned-data cache key.
+    
+    Args:
+        args (Namespace): Parsed command-line arguments
+        data_manager (DataManager): Data manager for file setup and caching
+        
+    Returns:
+        str: Hexadecimal source key
+    """
+    if args.files:
+        paths = find_trip_files(args.files)
+    else:
+        availability = data_manager.check_data_availability()
+        use_sample = args.sample or not all(availability['raw_data'].values())
+        paths = [path for path in data_manager.get_file_paths(use_sample=use_sample) if path.exists()]
+    pipeline_version = PIPELINE_VERSION + ('-compact' if args.compact else '')
+    return data_manager.get_cache_key(paths, pipeline_version)
+
+
+def watch_trip_files(analyzer, args, state_path, output_dir):
+    """
+    Poll the trip files and refresh the results whenever one lands or changes.
+    
+    Only the new or changed files are prepared and merged into the analysis
+    state; the results file and the charts whose inputs changed are then
+    rewritten. A file is picked up once its size and modification time are
+    the same on two consecutive polls, so files that are still being copied
+    are not read half written, and a deleted file is dropped from the state.
+    Runs until interrupted with Ctrl+C.
+    
+    Args:
+        analyzer (CyclisticAnalyzer): Analyzer holding the current state
+        args (Namespace): Parsed command-line arguments
+        state_path (Path): Path of the saved analysis state
+        output_dir (Path): Directory to save results
+    """
+    print(f"\n👀 Watching {args.files} for new or changed trip files (Ctrl+C to stop)...")
+    root = trip_file_root(args.files)
+    seen = {}
+    processed = {}
+    
+    try:
+        while True:
+            time.sleep(args.poll_interval)
+            
+            current = {}
+            for path in find_trip_files(args.files):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                current[path] = (stat.st_size, stat.st_mtime_ns)
+            
+            settled = [path for path, signature in current.items()
+                       if seen.get(path) == signature and processed.get(path) != signature]
+            deleted = [path for path in processed if path not in current]
+            seen = current
+            if not settled and not deleted:
+                continue
+            
+            for path in deleted:
+                del processed[path]
+            try:
+                started = time.perf_counter()
+                if analyzer.update_state(settled, state_path, max_workers=args.workers,
+                                         chunksize=args.chunksize, root=root):
+                    publish_results(analyzer, args, output_dir)
+                    print(f"\n🔄 Results refreshed in {time.perf_counter() - started:.1f}s")
+            except Exception as e:
+                print(f"⚠️  Error refreshing results: {e}")
+            # Failed files are retried once they change again
+            processed.update((path, current[path]) for path in settled)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+
+def prepare_default_data(args, data_manager):
+    """
+    Prepare the Q1 2019 and Q1 2020 files, falling back to sample data.
+    
+    Args:
+        args (Namespace): Parsed command-line arguments
+        data_manager (DataManager): Data manager for file setup and caching
+        
+    Returns:
+        CyclisticAnalyzer: Analyzer with prepared data
+    """
+    # Setup data
+    file_2019, file_2020, is_sample = data_manager.setup_data(force_sample=args.sample)
+    
+    if is_sample:
+        print("📊 Using sample data for demonstration")
+    else:
+        print("📊 Using original Divvy trip data")
+    
+    print(f"Data files:")
+    print(f"  - 2019 Q1: {file_2019}")
+    print(f"  - 2020 Q1: {file_2020}")
+    print()
+    
+    # Initialize analyzer
+    print("Initializing analyzer...")
+    analyzer = CyclisticAnalyzer(lazy_columns=args.lazy_columns)
+    
+    # Prepare data
+    print("Preparing data...")
+    if file_2019.exists() and file_2020.exists():
+        analyzer.prepare_data(
+            str(file_2019), str(file_2020),
+            chunksize=args.chunksize,
+            data_manager=None if args.no_cache else data_manager,
+            rebuild_cache=args.rebuild_cache,
+            compact=args.compact,
+            parallel=args.parallel
+        )
+    else:
+        analyzer.prepare_data()  # Use built-in sample data
+    
+    return analyzer
+
+
 def generate_recommendations(results):
     """
     Generate business recommendations based on analysis results.
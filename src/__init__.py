@@ -15,5 +15,12 @@ __email__ = "bhqmuhammad@example.com"
 from .cyclistic_analyzer import CyclisticAnalyzer
 from .visualizations import CyclisticVisualizer
 from .data_utils import DataManager
+from .aggregates import TripAggregates
+from .sketches import DurationSketch
+from .stations import StationDimension, StationFlows
+from .analysis_state import AnalysisState
+from .sql_backend import SQLiteTripStore
+from .trip_index import TripIndex
+from .column_store import write_column_store, read_column_store, read_source_key
 
-__all__ = ['CyclisticAnalyzer', 'CyclisticVisualizer', 'DataManager']
\ No newline at end of file
+__all__ = ['CyclisticAnalyzer', 'CyclisticVisualizer', 'DataManager', 'TripAggregates', 'DurationSketch', 'StationDimension', 'StationFlows', 'AnalysisState', 'SQLiteTripStore', 'TripIndex', 'write_column_store', 'read_column_store', 'read_source_key']
\ No newline at end of file
@@ -0,0 +1,377 @@
+"""
+Running Aggregates for Cyclistic Analysis
+=======================================
+
+This module provides mergeable, fixed-size aggregates of trip data so that
+large datasets can be analyzed chunk by chunk without keeping every trip
+in memory.
+
+Author: Muhammad Baihaqi
+License: MIT
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .sketches import DurationSketch
+except ImportError:  # Imported as a top-level module with src/ on sys.path
+    from sketches import DurationSketch
+
+USER_TYPES = ['casual', 'member']
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+N_USERS, N_DAYS, N_HOURS, N_MONTHS = len(USER_TYPES), 7, 24, 12
+CUBE_SHAPE = (N_USERS, N_DAYS, N_HOURS, N_MONTHS)
+
+
+def pool_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """
+    Pool the counts, means and sums of squared deviations of two samples.
+    
+    Uses the pairwise update of Chan, Golub and LeVeque, which stays
+    accurate when the means are large compared to the spread, unlike
+    differencing a sum of squares. Works elementwise on arrays.
+    
+    Args:
+        n_a (ndarray): Sizes of the first samples
+        mean_a (ndarray): Means of the first samples
+        m2_a (ndarray): Sums of squared deviations of the first samples
+        n_b (ndarray): Sizes of the second samples
+        mean_b (ndarray): Means of the second samples
+        m2_b (ndarray): Sums of squared deviations of the second samples
+        
+    Returns:
+        tuple: (n, mean, m2) of the pooled samples
+    """
+    n = n_a + n_b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = mean_b - mean_a
+        weight = np.where(n > 0, n_b / n, 0.0)
+        mean = np.where(n_b > 0, mean_a + delta * weight, mean_a)
+        m2 = np.where(n_b > 0, m2_a + m2_b + delta * delta * n_a * weight, m2_a)
+    return n, mean, m2
+
+
+class TripAggregates:
+    """
+    Ride counts and duration moments keyed by user type, day of week,
+    start hour and month.
+    
+    Every cell holds the number of rides and the sum and sum of squares of
+    ``ride_length``, which is enough to rebuild counts, means and standard
+    deviations for any roll-up of the four dimensions. The per-user-type
+    mean and sum of squared deviations are also kept separately and pooled
+    with ``pool_moments``, so the headline duration statistics stay exact
+    however many chunks or partitions are merged.
+    """
+    
+    def __init__(self):
+        """Initialize empty aggregates."""
+        self.count = np.zeros(CUBE_SHAPE, dtype=np.int64)
+        self.sum = np.zeros(CUBE_SHAPE, dtype=np.float64)
+        self.sumsq = np.zeros(CUBE_SHAPE, dtype=np.float64)
+        self.min = np.full(N_USERS, np.inf)
+        self.max = np.full(N_USERS, -np.inf)
+        self.mean = np.zeros(N_USERS)
+        self.m2 = np.zeros(N_USERS)
+        self.durations = DurationSketch(N_USERS)
+        self.first_start = None
+        self.last_start = None
+    
+    @property
+    def total_rides(self):
+        """int: Total number of rides folded into the aggregates."""
+        return int(self.count.sum())
+    
+    def update(self, df):
+        """
+        Fold a prepared chunk of trips into the aggregates.
+        
+        Args:
+            df (DataFrame): Trips with ``member_casual``, ``ride_length``,
+                ``day_of_week``, ``start_hour``, ``month`` and ``started_at``
+        
+        Returns:
+            TripAggregates: self, to allow chaining
+        """
+        if len(df) == 0:
+            return self
+        
+        user = pd.Categorical(df['member_casual'], categories=USER_TYPES).codes.astype(np.int64)
+        valid = user >= 0
+        return self.update_arrays(
+            user[valid],
+            df['day_of_week'].to_numpy(dtype=np.int64)[valid],
+            df['start_hour'].to_numpy(dtype=np.int64)[valid],
+            df['month'].to_numpy(dtype=np.int64)[valid],
+            df['ride_length'].to_numpy(dtype=np.float64)[valid],
+            df['started_at'].min(), df['started_at'].max()
+        )
+    
+    def update_arrays(self, user, day, hour, month, length, first_start=None, last_start=None):
+        """
+        Fold trips given as parallel arrays into the aggregates.
+        
+        Args:
+            user (ndarray): User type codes (positions in ``USER_TYPES``)
+            day (ndarray): Day of week (Monday=0)
+            hour (ndarray): Start hour (0-23)
+            month (ndarray): Month number (1-12)
+            length (ndarray): Ride lengths in minutes
+            first_start (Timestamp): Earliest start time of the trips
+            last_start (Timestamp): Latest start time of the trips
+        
+        Returns:
+            TripAggregates: self, to allow chaining
+        """
+        if len(user) == 0:
+            return self
+        
+        user = np.asarray(user, dtype=np.int64)
+        length = np.asarray(length, dtype=np.float64)
+        
+        # One flat cell index per ride, then a single bincount per measure
+        key = np.ravel_multi_index((user, day, hour, np.asarray(month) - 1), CUBE_SHAPE)
+        size = self.count.size
+        self.count += np.bincount(key, minlength=size).reshape(CUBE_SHAPE)
+        self.sum += np.bincount(key, weights=length, minlength=size).reshape(CUBE_SHAPE)
+        self.sumsq += np.bincount(key, weights=length * length, minlength=size).reshape(CUBE_SHAPE)
+        self.durations.update(user, length)
+        
+        n = np.bincount(user, minlength=N_USERS)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(user, weights=length, minlength=N_USERS) / n
+        deviation = length - mean[user]
+        m2 = np.bincount(user, weights=deviation * deviation, minlength=N_USERS)
+        self._pool(self.count.sum(axis=(1, 2, 3)) - n, n, mean, m2)
+        
+        for code in range(N_USERS):
+            user_lengths = length[user == code]
+            if len(user_lengths):
+                self.min[code] = min(self.min[code], user_lengths.min())
+                self.max[code] = max(self.max[code], user_lengths.max())
+        
+        self._update_date_range(first_start, last_start)
+        return self
+    
+    def merge(self, other):
+        """
+        Merge another set of aggregates into this one.
+        
+        Args:
+            other (TripAggregates): Aggregates from another chunk or file
+        
+        Returns:
+            TripAggregates: self, to allow chaining
+        """
+        self._pool(self.count.sum(axis=(1, 2, 3)), other.count.sum(axis=(1, 2, 3)),
+                   other.mean, other.m2)
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.durations.merge(other.durations)
+        self._update_date_range(other.first_start, other.last_start)
+        return self
+    
+    def _pool(self, n_self, n_other, mean, m2):
+        """Pool another sample's per-user moments into ``mean`` and ``m2``."""
+        _, self.mean, self.m2 = pool_moments(n_self, self.mean, self.m2, n_other,
+                                             np.nan_to_num(mean), m2)
+    
+    def _update_date_range(self, first, last):
+        """Widen the covered date range to include ``first`` and ``last``."""
+        if first is not None and not pd.isna(first):
+            self.first_start = first if self.first_start is None else min(self.first_start, first)
+        if last is not None and not pd.isna(last):
+            self.last_start = last if self.last_start is None else max(self.last_start, last)
+    
+    def to_arrays(self):
+        """
+        Export the aggregates as plain arrays, e.g. for ``numpy.savez``.
+        
+        Returns:
+            dict: Array per field; restore with ``from_arrays``
+        """
+        return {
+            'count': self.count, 'sum': self.sum, 'sumsq': self.sumsq,
+            'min': self.min, 'max': self.max, 'mean': self.mean, 'm2': self.m2,
+            'durations': self.durations.counts,
+            'bin_width': np.float64(self.durations.bin_width),
+            'max_duration': np.float64(self.durations.max_duration),
+            'date_range': np.array(['' if value is None else pd.Timestamp(value).isoformat()
+                                    for value in [self.first_start, self.last_start]])
+        }
+    
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Rebuild aggregates exported with ``to_arrays``.
+        
+        Args:
+            arrays (dict): Arrays returned by ``to_arrays``
+            
+        Returns:
+            TripAggregates: Restored aggregates
+        """
+        aggregates = cls()
+        for field in ['count', 'sum', 'sumsq', 'min', 'max', 'mean', 'm2']:
+            setattr(aggregates, field, np.array(arrays[field]))
+        aggregates.durations = DurationSketch(N_USERS, float(arrays['bin_width']),
+                                              float(arrays['max_duration']))
+        aggregates.durations.counts = np.array(arrays['durations'])
+        first, last = [pd.Timestamp(str(value)) if value else None for value in arrays['date_range']]
+        aggregates.first_start, aggregates.last_start = first, last
+        return aggregates
+    
+    def user_counts(self):
+        """
+        Count rides per user type.
+        
+        Returns:
+            Series: Ride counts indexed by user type
+        """
+        return pd.Series(self.count.sum(axis=(1, 2, 3)), index=USER_TYPES)
+    
+    def duration_stats(self):
+        """
+        Duration statistics by user type.
+        
+        The median cannot be recovered from moments, so it is estimated
+        from the duration sketch (see ``duration_quantiles``).
+        
+        Returns:
+            DataFrame: count, mean, median, std, min and max per user type
+        """
+        n = self.count.sum(axis=(1, 2, 3)).astype(np.float64)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(n > 0, self.mean, np.nan)
+            # Sample variance, matching pandas' default ddof=1
+            var = self.m2 / (n - 1)
+        std = np.sqrt(np.clip(var, 0, None))
+        
+        stats = pd.DataFrame({
+            'count': n.astype(np.int64),
+            'mean': mean,
+            'median': self.duration_quantiles()['median'].to_numpy(),
+            'std': std,
+            'min': np.where(n > 0, self.min, np.nan),
+            'max': np.where(n > 0, self.max, np.nan)
+        }, index=pd.Index(USER_TYPES, name='member_casual'))
+        return stats[stats['count'] > 0]
+    
+    def duration_quantiles(self):
+        """
+        Approximate duration quantiles by user type.
+        
+        Estimates come from the mergeable duration sketch and are within
+        half a sketch bin (3 seconds by default) of the exact values; they
+        are clamped to the exact minimum and maximum.
+        
+        Returns:
+            DataFrame: p25, median, p75, p90, p99 and iqr per user type
+        """
+        estimates = self.durations.quantiles([0.25, 0.5, 0.75, 0.9, 0.99])
+        estimates = np.clip(estimates, self.min[:, None], self.max[:, None])
+        quantiles = pd.DataFrame(estimates, columns=['p25', 'median', 'p75', 'p90', 'p99'],
+                                 index=pd.Index(USER_TYPES, name='member_casual'))
+        quantiles['iqr'] = quantiles['p75'] - quantiles['p25']
+        return quantiles
+    
+    def duration_box_stats(self, whis=1.5):
+        """
+        Box plot statistics by user type, ready for ``Axes.bxp``.
+        
+        Args:
+            whis (float): Whisker reach in interquartile ranges
+            
+        Returns:
+            list: One dict per user type with rides (label, q1, med, q3,
+            whislo, whishi and fliers)
+        """
+        stats = self.durations.box_stats(whis)
+        boxes = []
+        for code, user_type in enumerate(USER_TYPES):
+            if self.count[code].sum() == 0:
+                continue
+            low, high = self.min[code], self.max[code]
+            box = {'label': user_type, 'fliers': np.clip(stats['fliers'][code], low, high)}
+            for key in ['q1', 'med', 'q3', 'whislo', 'whishi']:
+                box[key] = float(np.clip(stats[key][code], low, high))
+            boxes.append(box)
+        return boxes
+    
+    def duration_histogram(self, bins=50, range=None, density=False):
+        """
+        Duration histogram by user type, like ``Axes.hist`` on the trips.
+        
+        Args:
+            bins (int): Number of equal-width bins
+            range (tuple): (lower, upper) edges in minutes (default: the
+                observed minimum and maximum duration)
+            density (bool): Normalize each user type to unit area
+            
+        Returns:
+            tuple: (edges, DataFrame of counts or densities, one column per
+            user type with rides)
+        """
+        if range is None:
+            range = (self.min.min(), self.max.max())
+        edges, counts = self.durations.histogram(bins, range)
+        values = counts.astype(np.float64)
+        if density:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                values = values / (values.sum(axis=1, keepdims=True) * np.diff(edges))
+        
+        histogram = pd.DataFrame(values.T, index=pd.Index(edges[:-1], name='ride_length'),
+                                 columns=pd.Index(USER_TYPES, name='member_casual'))
+        present = [user for user in USER_TYPES if self.user_counts()[user] > 0]
+        return edges, histogram[present]
+    
+    def weekly_counts(self):
+        """
+        Ride counts by day of week and user type.
+        
+        Returns:
+            DataFrame: Counts indexed by day name (Monday first)
+        """
+        counts = self.count.sum(axis=(2, 3)).T
+        return self._pivot(counts, pd.Index(DAY_NAMES, name='day_name'))
+    
+    def hourly_counts(self):
+        """
+        Ride counts by start hour and user type.
+        
+        Returns:
+            DataFrame: Counts indexed by start hour (0-23)
+        """
+        counts = self.count.sum(axis=(1, 3)).T
+        return self._pivot(counts, pd.Index(range(N_HOURS), name='start_hour'))
+    
+    def monthly_counts(self):
+        """
+        Ride counts by month and user type, for months that have rides.
+        
+        Returns:
+            DataFrame: Counts indexed by month number (1-12)
+        """
+        counts = self.count.sum(axis=(1, 2)).T
+        pivot = self._pivot(counts, pd.Index(range(1, N_MONTHS + 1), name='month'))
+        return pivot[pivot.sum(axis=1) > 0]
+    
+    def weekend_counts(self):
+        """
+        Weekend ride counts by user type.
+        
+        Returns:
+            Series: Saturday and Sunday ride counts indexed by user type
+        """
+        return pd.Series(self.count[:, 5:].sum(axis=(1, 2, 3)), index=USER_TYPES)
+    
+    def _pivot(self, counts, index):
+        """Wrap a (dimension x user) count array in a pivot-style DataFrame."""
+        pivot = pd.DataFrame(counts, index=index, columns=pd.Index(USER_TYPES, name='member_casual'))
+        present = [user for user in USER_TYPES if self.user_counts()[user] > 0]
+        return pivot[present]
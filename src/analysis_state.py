@@ -0,0 +1,236 @@
+"""
+Persisted Analysis State for Cyclistic Analysis
+==============================================
+
+This module keeps one set of mergeable aggregates per trip file on disk, so
+that a new quarter is folded into the analysis by preparing only that file
+instead of re-running the whole pipeline over every trip.
+
+Author: Muhammad Baihaqi
+License: MIT
+"""
+
+import json
+import os
+import numpy as np
+from pathlib import Path
+
+try:
+    from .aggregates import TripAggregates
+    from .data_utils import file_digest
+except ImportError:  # Imported as a top-level module with src/ on sys.path
+    from aggregates import TripAggregates
+    from data_utils import file_digest
+
+STATE_FILE = 'analysis_state.npz'
+DEFAULT_STATE_PATH = Path('data') / 'processed' / STATE_FILE
+
+
+class AnalysisState:
+    """
+    Per-partition trip aggregates with the signature of their source file.
+    
+    Each partition holds the ``TripAggregates`` (counts, sums, sums of
+    squares, pooled moments, weekday/hour/month cube and duration sketch)
+    and the cleaning statistics of one trip file. Partitions are merged on
+    demand, so the result matches preparing all files in one run.
+    """
+    
+    def __init__(self, pipeline_version, root=None):
+        """
+        Initialize an empty state.
+        
+        Args:
+            pipeline_version (str): Preparation pipeline version; a state saved
+                by another version is discarded on load
+            root (str): Directory the trip files are located under; partitions
+                are keyed by their path relative to it, and it is saved with
+                the state so later runs read the keys against the same place
+        """
+        self.pipeline_version = pipeline_version
+        self.root = None if root is None else Path(root).resolve()
+        self.partitions = {}
+    
+    def __len__(self):
+        return len(self.partitions)
+    
+    def partition_name(self, path):
+        """
+        Key of a trip file's partition.
+        
+        Files are keyed by their path relative to ``root``, so files of the
+        same name in different directories get separate partitions. Files
+        outside ``root`` are keyed by their absolute path.
+        
+        Args:
+            path (str): Path to a trip file
+        
+        Returns:
+            str: Partition name
+        """
+        path = Path(path).resolve()
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+    
+    def prune(self):
+        """
+        Remove the partitions of trip files that no longer exist.
+        
+        Returns:
+            list: Names of the removed partitions
+        """
+        removed = [name for name in sorted(self.partitions) if not (self.root / name).exists()]
+        for name in removed:
+            del self.partitions[name]
+        return removed
+    
+    def is_current(self, path):
+        """
+        Check whether a file's partition is up to date.
+        
+        The size and modification time are compared first; the content is
+        hashed only when they differ, so touching a file does not force it
+        to be prepared again.
+        
+        Args:
+            path (str): Path to a trip file
+        
+        Returns:
+            bool: True if the stored partition was built from this content
+        """
+        partition = self.partitions.get(self.partition_name(path))
+        if partition is None:
+            return False
+        
+        stat = Path(path).stat()
+        signature = partition['signature']
+        if signature['size'] == stat.st_size and signature['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        if signature['size'] != stat.st_size or signature['digest'] != file_digest(path).hex():
+            return False
+        
+        signature['mtime_ns'] = stat.st_mtime_ns
+        return True
+    
+    def add_partition(self, path, stats, aggregates):
+        """
+        Store or replace the partition of one trip file.
+        
+        Args:
+            path (str): Path to the trip file
+            stats (dict): Cleaning statistics of the file
+            aggregates (TripAggregates): Aggregates of the file's cleaned trips
+        """
+        stat = Path(path).stat()
+        self.partitions[self.partition_name(path)] = {
+            'signature': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                          'digest': file_digest(path).hex()},
+            'stats': stats,
+            'aggregates': aggregates
+        }
+    
+    def aggregates(self):
+        """
+        Merge the partitions into aggregates over every stored trip.
+        
+        Returns:
+            TripAggregates: Merged aggregates, in partition name order
+        """
+        merged = TripAggregates()
+        for name in sorted(self.partitions):
+            merged.merge(self.partitions[name]['aggregates'])
+        return merged
+    
+    def cleaning_stats(self):
+        """
+        Cleaning statistics per partition.
+        
+        Returns:
+            dict: Statistics keyed by partition name
+        """
+        return {name: self.partitions[name]['stats'] for name in sorted(self.partitions)}
+    
+    def save(self, path=DEFAULT_STATE_PATH):
+        """
+        Write the state to a ``.npz`` file.
+        
+        The file is written next to the target and renamed over it, so a
+        reader never sees a partially written state.
+        
+        Args:
+            path (str): Destination path
+        
+        Returns:
+            Path: Path of the written state
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        
+        names = sorted(self.partitions)
+        arrays = {}
+        for index, name in enumerate(names):
+            for field, array in self.partitions[name]['aggregates'].to_arrays().items():
+                arrays[f'{index}/{field}'] = array
+        metadata = {
+            'pipeline_version': self.pipeline_version,
+            'root': None if self.root is None else str(self.root),
+            'partitions': [{'name': name, 'signature': self.partitions[name]['signature'],
+                            'stats': self.partitions[name]['stats']} for name in names]
+        }
+        arrays['metadata'] = np.array(json.dumps(metadata))
+        
+        temp_path = path.with_name(path.name + '.tmp')
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temp_path, path)
+        return path
+    
+    @classmethod
+    def load(cls, path=DEFAULT_STATE_PATH, pipeline_version=None, root=None):
+        """
+        Read a state written by ``save``.
+        
+        Args:
+            path (str): Path to the state file
+            pipeline_version (str): Expected pipeline version; a state saved
+                by another version is ignored (default: accept any)
+            root (str): Directory the trip files are located under; a state
+                keyed under another directory is ignored (default: use the
+                saved root)
+        
+        Returns:
+            AnalysisState: Loaded state, or an empty one if the file is
+            missing, unreadable, from another pipeline version or keyed
+            under another root
+        """
+        path = Path(path)
+        if not path.exists():
+            return cls(pipeline_version, root)
+        
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                metadata = json.loads(str(data['metadata']))
+                state = cls(metadata['pipeline_version'], metadata.get('root'))
+                for index, partition in enumerate(metadata['partitions']):
+                    prefix = f'{index}/'
+                    arrays = {key[len(prefix):]: data[key] for key in data.files
+                              if key.startswith(prefix)}
+                    state.partitions[partition['name']] = {
+                        'signature': partition['signature'],
+                        'stats': partition['stats'],
+                        'aggregates': TripAggregates.from_arrays(arrays)
+                    }
+        except Exception as e:
+            print(f"Ignoring unreadable analysis state {path}: {e}")
+            return cls(pipeline_version, root)
+        
+        if pipeline_version is not None and state.pipeline_version != pipeline_version:
+            print(f"Discarding analysis state from pipeline version {state.pipeline_version}")
+            return cls(pipeline_version, root)
+        if root is not None and state.root != Path(root).resolve():
+            # The stored keys are relative to the old root and cannot be read against the new one
+            print(f"Discarding analysis state keyed under {state.root}")
+            return cls(pipeline_version, root)
+        return state
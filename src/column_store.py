@@ -0,0 +1,183 @@
+"""
+Memory-Mapped Column Store for Cyclistic Analysis
+================================================
+
+This module saves a prepared DataFrame as one ``.npy`` file per column plus
+a small JSON manifest, and opens it again with memory mapping. Reopening
+parses nothing, and every process that opens the same store shares the
+same pages of the operating system's file cache.
+
+Author: Muhammad Baihaqi
+License: MIT
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+MANIFEST_FILE = 'manifest.json'
+COLUMN_STORE_VERSION = 1
+
+
+def _save_array(directory, name, array):
+    """Write an array next to its final name and move it into place."""
+    path = Path(directory) / name
+    temp_path = path.with_name(path.name + '.tmp')
+    with open(temp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+    # Replacing rather than truncating keeps pages mapped by readers valid
+    os.replace(temp_path, path)
+    return name
+
+
+def _dictionary(values):
+    """Fixed-width array of dictionary values, so it can be saved without pickling."""
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = values.astype(str)
+    return values
+
+
+def _encode_column(directory, index, values):
+    """Save one column and return its manifest entry."""
+    entry = {'name': values.name}
+    stem = f'{index:03d}'
+    dtype = values.dtype
+    
+    if isinstance(dtype, pd.CategoricalDtype):
+        entry['kind'] = 'dictionary'
+        entry['file'] = _save_array(directory, f'{stem}.npy', values.cat.codes.to_numpy())
+        entry['dictionary'] = _save_array(directory, f'{stem}.dict.npy',
+                                          _dictionary(dtype.categories.to_numpy()))
+        entry['ordered'] = bool(dtype.ordered)
+    elif pd.api.types.is_string_dtype(dtype) or dtype == object:
+        codes, uniques = pd.factorize(values)
+        entry['kind'] = 'dictionary'
+        entry['file'] = _save_array(directory, f'{stem}.npy', codes.astype(np.min_scalar_type(-len(uniques) - 1)))
+        entry['dictionary'] = _save_array(directory, f'{stem}.dict.npy', _dictionary(uniques))
+        entry['ordered'] = False
+    elif isinstance(dtype, np.dtype) and dtype.kind in 'biufM':
+        entry['kind'] = 'plain'
+        entry['file'] = _save_array(directory, f'{stem}.npy', values.to_numpy())
+    elif getattr(dtype, 'numpy_dtype', np.dtype(object)).kind in 'biuf':
+        # Nullable Int/Float/boolean columns: the values plus a missing-value mask
+        entry['kind'] = 'masked'
+        entry['dtype'] = str(dtype)
+        filled = values.to_numpy(dtype=dtype.numpy_dtype, na_value=dtype.numpy_dtype.type(0))
+        entry['file'] = _save_array(directory, f'{stem}.npy', filled)
+        entry['mask'] = _save_array(directory, f'{stem}.mask.npy', values.isna().to_numpy())
+    else:
+        raise ValueError(f"Cannot store column {values.name!r} of dtype {dtype} in a column store")
+    
+    return entry
+
+
+def write_column_store(df, directory, source_key=None):
+    """
+    Save a DataFrame as a column store.
+    
+    Each column becomes one ``.npy`` file. Categorical and string columns are
+    dictionary-encoded into integer codes plus a ``.dict.npy`` file of their
+    distinct values, and nullable columns keep their missing-value mask in
+    a ``.mask.npy`` file. The manifest is written last, so an interrupted
+    write leaves the previous manifest (or none) in place.
+    
+    Args:
+        df (DataFrame): Frame to save; the index is not stored
+        directory (str): Directory of the store, created if needed
+        source_key (str): Key of the source files and pipeline the frame was
+            prepared from (see ``DataManager.get_cache_key``)
+    
+    Returns:
+        Path: Path of the written manifest
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    
+    manifest = {
+        'version': COLUMN_STORE_VERSION,
+        'source_key': source_key,
+        'length': len(df),
+        'columns': [_encode_column(directory, index, df[col]) for index, col in enumerate(df.columns)]
+    }
+    
+    path = directory / MANIFEST_FILE
+    temp_path = path.with_name(path.name + '.tmp')
+    temp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(temp_path, path)
+    
+    # Remove files of columns the new manifest no longer lists
+    listed = {entry[key] for entry in manifest['columns'] for key in ['file', 'dictionary', 'mask'] if key in entry}
+    for stale in directory.glob('*.npy'):
+        if stale.name not in listed:
+            stale.unlink()
+    return path
+
+
+def read_source_key(directory):
+    """
+    Read the source key a column store was written with.
+    
+    Args:
+        directory (str): Directory of the store
+    
+    Returns:
+        str: The store's source key, or None if the directory holds no
+        readable manifest or the store was written without a key
+    """
+    try:
+        manifest = json.loads((Path(directory) / MANIFEST_FILE).read_text())
+    except (OSError, ValueError):
+        return None
+    return manifest.get('source_key')
+
+
+def read_column_store(directory, mmap=True, columns=None):
+    """
+    Open a column store as a DataFrame.
+    
+    With ``mmap`` the column data is not read up front: every column is a
+    read-only view of its memory-mapped ``.npy`` file, including the codes
+    of dictionary-encoded columns, which come back as categoricals. Only
+    the dictionaries themselves are loaded, so skipping high-cardinality
+    string columns such as ``ride_id`` through ``columns`` makes opening
+    almost free.
+    
+    Args:
+        directory (str): Directory of the store
+        mmap (bool): Memory-map the columns instead of reading them
+        columns (list): Columns to open (default: all)
+    
+    Returns:
+        DataFrame: The stored frame
+    
+    Raises:
+        FileNotFoundError: If the directory holds no manifest
+        ValueError: If the store was written by an unsupported version
+    """
+    directory = Path(directory)
+    manifest = json.loads((directory / MANIFEST_FILE).read_text())
+    if manifest['version'] != COLUMN_STORE_VERSION:
+        raise ValueError(f"Unsupported column store version {manifest['version']}")
+    
+    mmap_mode = 'r' if mmap else None
+    data = {}
+    for entry in manifest['columns']:
+        if columns is not None and entry['name'] not in columns:
+            continue
+        # Plain ndarray views, so results computed from them are not memmaps too
+        values = np.asarray(np.load(directory / entry['file'], mmap_mode=mmap_mode, allow_pickle=False))
+        if entry['kind'] == 'dictionary':
+            categories = np.load(directory / entry['dictionary'], allow_pickle=False)
+            dtype = pd.CategoricalDtype(categories, ordered=entry['ordered'])
+            data[entry['name']] = pd.Categorical.from_codes(values, dtype=dtype)
+        elif entry['kind'] == 'masked':
+            mask = np.asarray(np.load(directory / entry['mask'], mmap_mode=mmap_mode, allow_pickle=False))
+            array_type = pd.api.types.pandas_dtype(entry['dtype']).construct_array_type()
+            data[entry['name']] = array_type(values, mask)
+        else:
+            data[entry['name']] = values
+    
+    return pd.DataFrame(data, index=pd.RangeIndex(manifest['length']), copy=False)
@@ -14,18 +14,531 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
+from pathlib import Path
+import contextlib
+import functools
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pandas.tseries.holiday import USFederalHolidayCalendar
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from .aggregates import TripAggregates, USER_TYPES, DAY_NAMES
+    from .column_store import write_column_store, read_column_store, MANIFEST_FILE
+    from .analysis_state import AnalysisState, DEFAULT_STATE_PATH
+    from .data_utils import generate_trips, find_trip_files, trip_file_root, STATIONS_CACHE_PREFIX
+    from .shared_frames import share_frame, collect_shared_frames, release_shared_frame
+    from .sql_backend import SQLiteTripStore
+    from .trip_index import TripIndex
+    from .stations import StationDimension, StationFlows, trip_distances
+except ImportError:  # Imported as a top-level module with src/ on sys.path
+    from aggregates import TripAggregates, USER_TYPES, DAY_NAMES
+    from column_store import write_column_store, read_column_store, MANIFEST_FILE
+    from analysis_state import AnalysisState, DEFAULT_STATE_PATH
+    from data_utils import generate_trips, find_trip_files, trip_file_root, STATIONS_CACHE_PREFIX
+    from shared_frames import share_frame, collect_shared_frames, release_shared_frame
+    from sql_backend import SQLiteTripStore
+    from trip_index import TripIndex
+    from stations import StationDimension, StationFlows, trip_distances
+
+# Bump whenever a change to the preparation steps alters the cleaned output,
+# so that cached copies of older results are rebuilt.
+PIPELINE_VERSION = "1"
+
+# Column renames that bring each Divvy export format to the 2020 schema
+SCHEMA_RENAMES = {
+    'divvy_2019': {
+        'trip_id': 'ride_id',
+        'start_time': 'started_at',
+        'end_time': 'ended_at',
+        'bikeid': 'bike_id',
+        'tripduration': 'trip_duration',
+        'from_station_id': 'start_station_id',
+        'from_station_name': 'start_station_name',
+        'to_station_id': 'end_station_id',
+        'to_station_name': 'end_station_name',
+        'usertype': 'member_casual',
+        'gender': 'gender',
+        'birthyear': 'birth_year'
+    },
+    # 2019 Q2 was published with report-style headers
+    'divvy_2019_q2': {
+        '01 - Rental Details Rental ID': 'ride_id',
+        '01 - Rental Details Local Start Time': 'started_at',
+        '01 - Rental Details Local End Time': 'ended_at',
+        '01 - Rental Details Bike ID': 'bike_id',
+        '01 - Rental Details Duration In Seconds Uncapped': 'trip_duration',
+        '03 - Rental Start Station ID': 'start_station_id',
+        '03 - Rental Start Station Name': 'start_station_name',
+        '02 - Rental End Station ID': 'end_station_id',
+        '02 - Rental End Station Name': 'end_station_name',
+        'User Type': 'member_casual',
+        'Member Gender': 'gender',
+        '05 - Member Details Member Birthday Year': 'birth_year'
+    },
+    'divvy_2020': {}
+}
+LEGACY_USER_TYPES = {'Subscriber': 'member', 'Customer': 'casual'}
+
+# Timestamp layouts seen in Divvy exports, most common first
+TIMESTAMP_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%dT%H:%M:%S',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M'
+]
+TIMESTAMP_SAMPLE_SIZE = 200
+
+# Cleaning rules in the order rejections are attributed to them
+CLEANING_RULES = ['invalid_duration', 'over_24_hours', 'under_1_minute', 'missing_station']
+
+# Column groups for the compact schema applied by optimize_dtypes()
+CATEGORY_COLUMNS = ['member_casual', 'day_name', 'rideable_type', 'start_station_name',
+                    'end_station_name', 'gender']
+INTEGER_COLUMNS = ['day_of_week', 'start_hour', 'month', 'year', 'start_station_id',
+                   'end_station_id', 'bike_id']
+FLOAT32_COLUMNS = ['ride_length', 'start_lat', 'start_lng', 'end_lat', 'end_lng',
+                   'birth_year', 'distance_km', 'speed_kmh']
+
+# Calculated columns: name -> (columns it is derived from, function computing it
+# from the frame and the analyzer's station dimension, which may be None).
+# The calendar columns are pure functions of started_at and are looked up in a
+# per-date calendar table (see calendar_lookup).
+DERIVED_COLUMNS = {
+    'day_of_week': (['started_at'], lambda df, stations: calendar_lookup(df['started_at'], 'day_of_week')),
+    'day_name': (['day_of_week'], lambda df, stations: pd.Categorical.from_codes(
+        df['day_of_week'].fillna(-1).astype(np.int8), DAY_NAMES)),
+    'start_hour': (['started_at'], lambda df, stations: calendar_lookup(df['started_at'], 'start_hour')),
+    'month': (['started_at'], lambda df, stations: calendar_lookup(df['started_at'], 'month')),
+    'year': (['started_at'], lambda df, stations: calendar_lookup(df['started_at'], 'year')),
+    'is_weekend': (['started_at'], lambda df, stations: calendar_lookup(df['started_at'], 'is_weekend')),
+    'is_holiday': (['started_at'], lambda df, stations: calendar_lookup(df['started_at'], 'is_holiday')),
+    # Straight-line trip distance; trips without coordinates use station locations
+    'distance_km': ([], lambda df, stations: trip_distances(
+        df, None if stations is None else stations.table[['lat', 'lng']])),
+    'speed_kmh': (['distance_km', 'ride_length'], lambda df, stations: df['distance_km'] / (df['ride_length'] / 60)),
+}
+
+# Calculated columns added by add_calculated_columns() unless they are deferred
+CALCULATED_COLUMNS = ['day_of_week', 'day_name', 'start_hour', 'month', 'year', 'is_weekend']
+
+# Columns the cube is keyed by
+AGGREGATE_COLUMNS = ['day_of_week', 'start_hour', 'month']
+
+# Columns the analyses read, checksummed before serving memoized results when
+# verify_data is on. Derived calendar columns are covered through started_at.
+FINGERPRINT_COLUMNS = ['member_casual', 'started_at', 'ride_length']
+
+
+def _column_checksum(values):
+    """Position-sensitive 64-bit checksum of a column's contents."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        bits = values.cat.codes.to_numpy(dtype=np.int64).view(np.uint64)
+    elif pd.api.types.is_datetime64_any_dtype(values):
+        bits = values.to_numpy(dtype='datetime64[ns]').view(np.uint64)
+    elif (pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values)) and not values.hasnans:
+        bits = values.to_numpy(dtype=np.int64).view(np.uint64)
+    elif pd.api.types.is_numeric_dtype(values):
+        bits = values.to_numpy(dtype=np.float64, na_value=np.nan).view(np.uint64)
+    else:
+        # Strings: only the user types the analyses recognise matter
+        bits = np.zeros(len(values), dtype=np.uint64)
+        for code, user_type in enumerate(USER_TYPES, start=1):
+            bits[(values == user_type).to_numpy(dtype=bool, na_value=False)] = code
+    
+    weights = np.arange(1, 2 * len(bits), 2, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    with np.errstate(over='ignore'):
+        return int((bits * weights).sum())
+
+
+def _memoized(method):
+    """
+    Cache an analysis method's result, printed output and stored results.
+    
+    Entries are keyed by method and arguments and are dropped whenever the
+    fingerprint of the analyzed data changes (see ``_data_fingerprint``).
+    Cache hits replay the original output so repeated calls look exactly
+    like fresh ones.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.memoize:
+            return method(self, *args, **kwargs)
+        
+        if self._memo_depth == 0:
+            self._validate_cache()
+        
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        if key in self._memo:
+            result, results_update, output = self._memo[key]
+            self.analysis_results.update(results_update)
+            print(output, end='')
+        else:
+            results_before = dict(self.analysis_results)
+            buffer = io.StringIO()
+            self._memo_depth += 1
+            try:
+                with contextlib.redirect_stdout(buffer):
+                    result = method(self, *args, **kwargs)
+            finally:
+                self._memo_depth -= 1
+            output = buffer.getvalue()
+            print(output, end='')
+            
+            results_update = {
+                name: value for name, value in self.analysis_results.items()
+                if name not in results_before or results_before[name] is not value
+            }
+            self._memo[key] = (result, results_update, output)
+        
+        # Hand out copies so callers cannot alter the cached frames
+        if isinstance(result, (pd.DataFrame, pd.Series)):
+            return result.copy()
+        return result
+    
+    return wrapper
+
+
+def detect_schema(columns):
+    """
+    Identify the Divvy export format from a file's columns.
+    
+    Args:
+        columns (list): Column names of a trip file
+        
+    Returns:
+        str: Key into ``SCHEMA_RENAMES``
+        
+    Raises:
+        ValueError: If the columns do not match any known format
+    """
+    columns = set(columns)
+    if {'started_at', 'member_casual'} <= columns:
+        return 'divvy_2020'
+    for schema in ['divvy_2019', 'divvy_2019_q2']:
+        renames = SCHEMA_RENAMES[schema]
+        source = {col for col, target in renames.items() if target in ('started_at', 'member_casual')}
+        if source & columns:
+            return schema
+    raise ValueError(f"Unrecognized trip file columns: {sorted(columns)}")
+
+
+def detect_timestamp_format(values):
+    """
+    Detect the timestamp layout of a column from a small sample.
+    
+    Args:
+        values (Series): Timestamp strings
+        
+    Returns:
+        str: strftime-style format that parses every sampled value, or None
+    """
+    sample = values.dropna().head(TIMESTAMP_SAMPLE_SIZE).astype(str)
+    if sample.empty:
+        return None
+    
+    for fmt in TIMESTAMP_FORMATS:
+        parsed = pd.to_datetime(sample, format=fmt, errors='coerce')
+        if parsed.notna().all():
+            return fmt
+    return None
+
+
+def _infer_timestamps(values):
+    """Parse timestamps with per-element format inference (slow path)."""
+    try:
+        return pd.to_datetime(values, format='mixed', errors='coerce')
+    except (TypeError, ValueError):  # pandas < 2.0 has no 'mixed' format
+        return pd.to_datetime(values, errors='coerce')
+
+
+def parse_timestamps(values, fmt=None):
+    """
+    Parse a column of timestamp strings with a single explicit format.
+    
+    The format is detected once from a sample, the whole column is parsed
+    vectorized with it, and only rows that fail fall back to inference.
+    
+    Args:
+        values (Series): Timestamp strings or already-parsed datetimes
+        fmt (str): Format to use instead of detecting one
+        
+    Returns:
+        Series: Parsed datetimes
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    
+    fmt = fmt or detect_timestamp_format(values)
+    if fmt is None:
+        return _infer_timestamps(values)
+    
+    parsed = pd.to_datetime(values, format=fmt, errors='coerce')
+    failed = parsed.isna() & values.notna()
+    if failed.any():
+        parsed[failed] = _infer_timestamps(values[failed])
+    return parsed
+
+
+def calendar_table(first_day, last_day):
+    """
+    Calendar features for every date in a range.
+    
+    Args:
+        first_day: First date (anything ``pd.date_range`` accepts)
+        last_day: Last date, inclusive
+        
+    Returns:
+        DataFrame: day_of_week (0=Monday), is_weekend, month, year and
+        is_holiday (US federal holidays), one row per date
+    """
+    dates = pd.date_range(first_day, last_day, freq='D')
+    holidays = USFederalHolidayCalendar().holidays(dates.min(), dates.max())
+    return pd.DataFrame({
+        'day_of_week': dates.dayofweek,
+        'is_weekend': dates.dayofweek >= 5,  # Saturday and Sunday
+        'month': dates.month,
+        'year': dates.year,
+        'is_holiday': dates.isin(holidays)
+    }, index=dates)
+
+
+def calendar_lookup(timestamps, column):
+    """
+    Map timestamps to a calendar feature through a per-date table.
+    
+    A quarter has millions of trips but only about 90 distinct dates, so
+    the features are computed once per date and each trip picks its row
+    with a single integer index operation. ``start_hour`` needs no table
+    and comes straight from the same hour offsets.
+    
+    Args:
+        timestamps (Series): Datetimes
+        column (str): ``start_hour`` or a column of ``calendar_table``
+        
+    Returns:
+        ndarray: Feature per timestamp; missing timestamps give NaN, or
+        False for flag columns
+    """
+    if getattr(timestamps.dt, 'tz', None) is not None:
+        timestamps = timestamps.dt.tz_localize(None)  # Keep local wall-clock dates
+    ticks = timestamps.to_numpy()
+    ticks_per_hour = np.timedelta64(1, 'h') // np.timedelta64(1, np.datetime_data(ticks.dtype)[0])
+    ticks = ticks.view(np.int64)
+    valid = ticks != np.iinfo(np.int64).min
+    hours = ticks // ticks_per_hour
+    
+    if column == 'start_hour':
+        values = (hours % 24).astype(np.int32)
+    else:
+        days = hours // 24
+        first = int(days[valid].min()) if valid.any() else 0
+        last = int(days[valid].max()) if valid.any() else 0
+        table = calendar_table(np.datetime64(first, 'D'), np.datetime64(last, 'D'))
+        offsets = days - first
+        if not valid.all():
+            offsets[~valid] = 0
+        values = table[column].to_numpy()[offsets]
+    
+    if not valid.all():
+        values = np.where(valid, values, False if values.dtype == bool else np.nan)
+    return values
+
+
+def read_trip_csv(path, chunksize=None):
+    """
+    Read a Divvy trip file, parsing its timestamps while reading.
+    
+    A small sample is read first to detect the export format and the
+    timestamp layout, which is then passed to the CSV parser so the
+    timestamp columns are never materialized as strings. Rows the parser
+    cannot handle are left for ``parse_timestamps`` to repair.
+    
+    Args:
+        path (str): Path to a Divvy trip CSV file
+        chunksize (int): Return an iterator of chunks of this many rows
+        
+    Returns:
+        DataFrame or TextFileReader: Trips, or an iterator of chunks
+    """
+    sample = pd.read_csv(path, nrows=TIMESTAMP_SAMPLE_SIZE)
+    try:
+        renames = SCHEMA_RENAMES[detect_schema(sample.columns)]
+    except ValueError:
+        return pd.read_csv(path, chunksize=chunksize)
+    
+    sources = {target: source for source, target in renames.items()}
+    date_columns = [sources.get(col, col) for col in ['started_at', 'ended_at']]
+    date_columns = [col for col in date_columns if col in sample.columns]
+    formats = {detect_timestamp_format(sample[col]) for col in date_columns}
+    
+    if len(formats) != 1 or None in formats:
+        return pd.read_csv(path, chunksize=chunksize)
+    
+    try:
+        return pd.read_csv(path, chunksize=chunksize, parse_dates=date_columns,
+                           date_format=formats.pop())
+    except TypeError:  # pandas < 2.0 has no date_format argument
+        return pd.read_csv(path, chunksize=chunksize)
+
+
+def merge_cleaning_stats(total, stats):
+    """
+    Add one set of cleaning statistics to a running total.
+    
+    Args:
+        total (dict): Running total, or None to start a new one
+        stats (dict): Statistics returned by ``CyclisticAnalyzer.clean_data``
+        
+    Returns:
+        dict: Updated running total
+    """
+    if total is None:
+        return dict(stats)
+    return {key: total.get(key, 0) + value for key, value in stats.items()}
+
+
+def _prepare_trip_file(path, keep_rows=True, chunksize=None, share_memory=False,
+                       lazy_columns=False):
+    """
+    Read and prepare one trip file; runs inside a worker process.
+    
+    Args:
+        path (str): Path to a Divvy trip CSV file
+        keep_rows (bool): Return the prepared trips rather than aggregates
+        chunksize (int): Read the file in chunks of this many rows
+        share_memory (bool): Return the prepared trips as a shared-memory
+            payload (see ``shared_frames``) instead of a pickled DataFrame
+        lazy_columns (bool): Leave calendar columns to be derived on demand
+        
+    Returns:
+        tuple: (path, cleaning statistics, prepared DataFrame, payload or
+            TripAggregates)
+    """
+    analyzer = CyclisticAnalyzer(memoize=False, lazy_columns=lazy_columns)
+    
+    if keep_rows:
+        df = read_trip_csv(path)
+        prepared, stats = analyzer.prepare_frame(df, verbose=False, inplace=True, return_stats=True)
+        return path, stats, share_frame(prepared) if share_memory else prepared
+    
+    aggregates = TripAggregates()
+    stats = None
+    for chunk in read_trip_csv(path, chunksize=chunksize or 500_000):
+        chunk, chunk_stats = analyzer.prepare_frame(chunk, verbose=False, inplace=True, return_stats=True)
+        stats = merge_cleaning_stats(stats, chunk_stats)
+        aggregates.update(analyzer.ensure_columns(AGGREGATE_COLUMNS, chunk))
+    return path, stats, aggregates
+
+
 class CyclisticAnalyzer:
     """
     Main analyzer class for Cyclistic bike-share data analysis.
     """
     
-    def __init__(self):
-        """Initialize the analyzer."""
+    def __init__(self, memoize=True, lazy_columns=False, verify_data=False):
+        """
+        Initialize the analyzer.
+        
+        Args:
+            memoize (bool): Cache analysis results until the data changes
+            lazy_columns (bool): Compute calendar columns the first time an
+                analysis or chart needs them instead of during preparation
+            verify_data (bool): Also checksum ``member_casual``, ``started_at``
+                and ``ride_length`` before serving memoized results, to catch
+                edits to ``df_combined`` made in place without
+                ``mark_data_changed``. This reads every row on each call, so
+                it costs about as much as a small analysis on large data.
+        """
+        self.memoize = memoize
+        self.lazy_columns = lazy_columns
+        self.verify_data = verify_data
+        self._memo = {}
+        self._memo_depth = 0
+        self._fingerprint = None
+        self._data_version = 0
         self.df_combined = None
+        self.aggregates = None
+        self.stations = None
         self.analysis_results = {}
+        self.memory_usage = None
+        self.cleaning_stats = {}
+    
+    @property
+    def df_combined(self):
+        """DataFrame: Combined, cleaned trips (None in streaming or SQLite mode)."""
+        return self._df_combined
+    
+    @df_combined.setter
+    def df_combined(self, df):
+        self._df_combined = df
+        # Replacing the trips also retires the cube and any SQLite copy of the old ones
+        self.aggregates = None
+        self.store = None
+        self._data_version += 1
+        self.clear_cache()
+    
+    def mark_data_changed(self):
+        """
+        Record an in-place edit of ``df_combined``.
+        
+        Memoized results, the aggregate cube and the trip index are rebuilt
+        the next time they are needed. Replacing ``df_combined`` or cleaning
+        it in place with ``clean_data`` records the change automatically.
+        """
+        self._data_version += 1
+        if self.df_combined is not None:
+            self.aggregates = None
+        self.clear_cache()
+    
+    def clear_cache(self):
+        """Drop memoized analysis results and the trip index."""
+        self._memo = {}
+        self._fingerprint = None
+        self._trip_index = None
+    
+    def _data_fingerprint(self):
+        """
+        Fingerprint the data the analyses read.
+        
+        Changes made through the analyzer bump a version counter, so the
+        fingerprint is computed in constant time. Only with ``verify_data``
+        does it also checksum the analyzed columns.
+        
+        Returns:
+            tuple: Identity, shape, version and, with ``verify_data``, content
+            checksums of the analyzed data
+        """
+        if self.df_combined is None and self.store is not None:
+            return ('store', id(self.store), self.store.revision)
+        if self.df_combined is None:
+            return ('aggregates', id(self.aggregates))
+        
+        df = self.df_combined
+        fingerprint = ('frame', id(df), len(df), self._data_version)
+        if not self.verify_data:
+            return fingerprint
+        
+        checksums = tuple(
+            _column_checksum(df[col]) for col in FINGERPRINT_COLUMNS if col in df.columns
+        )
+        # Deriving a column on demand must not look like a change to the data
+        columns = tuple(col for col in df.columns if col not in DERIVED_COLUMNS)
+        return fingerprint + (columns, checksums)
+    
+    def _validate_cache(self):
+        """Drop memoized results and the derived cube if the data has changed."""
+        fingerprint = self._data_fingerprint()
+        if fingerprint != self._fingerprint:
+            if self._fingerprint is not None and self.df_combined is not None:
+                self.aggregates = None
+                self._trip_index = None
+            self._memo = {}
+            self._fingerprint = fingerprint
         
     def load_data(self, file_2019, file_2020):
         """
@@ -39,8 +552,8 @@ class CyclisticAnalyzer:
             tuple: (df_2019, df_2020) DataFrames
         """
         try:
-            df_2019 = pd.read_csv(file_2019)
-            df_2020 = pd.read_csv(file_2020)
+            df_2019 = read_trip_csv(file_2019)
+            df_2020 = read_trip_csv(file_2020)
             
             print(f"2019 Q1 Dataset Shape: {df_2019.shape}")
             print(f"2020 Q1 Dataset Shape: {df_2020.shape}")
@@ -54,10 +567,13 @@ class CyclisticAnalyzer:
             print("Please ensure the CSV files are in the data/ directory")
             return None, None
     
-    def standardize_columns(self, df, year):
+    def standardize_columns(self, df, year=None):
         """
         Standardize column names between datasets.
         
+        The export format is detected from the columns; ``year`` is only
+        used when the columns do not identify it.
+        
         Args:
             df (DataFrame): Input DataFrame
             year (int): Year of the dataset (2019 or 2020)
@@ -65,29 +581,30 @@ class CyclisticAnalyzer:
         Returns:
             DataFrame: DataFrame with standardized columns
         """
-        if year == 2019:
-            df = df.rename(columns={
-                'trip_id': 'ride_id',
-                'start_time': 'started_at',
-                'end_time': 'ended_at',
-                'bikeid': 'bike_id',
-                'tripduration': 'trip_duration',
-                'from_station_id': 'start_station_id',
-                'from_station_name': 'start_station_name',
-                'to_station_id': 'end_station_id',
-                'to_station_name': 'end_station_name',
-                'usertype': 'member_casual',
-                'gender': 'gender',
-                'birthyear': 'birth_year'
-            })
+        try:
+            schema = detect_schema(df.columns)
+        except ValueError:
+            schema = 'divvy_2019' if year == 2019 else 'divvy_2020'
+        
+        if schema != 'divvy_2020':
+            df = df.rename(columns=SCHEMA_RENAMES[schema])
+            # 2019 trip ids are integers while 2020 ride ids are strings
+            if 'ride_id' in df.columns:
+                df['ride_id'] = df['ride_id'].astype(str)
         return df
     
-    def add_calculated_columns(self, df):
+    def add_calculated_columns(self, df, lazy=False):
         """
         Add calculated columns for analysis.
         
+        ``ride_length`` is always computed because cleaning depends on it.
+        The calendar columns in ``CALCULATED_COLUMNS`` are added as well unless
+        ``lazy`` is True, in which case ``ensure_columns`` derives each one
+        the first time it is requested.
+        
         Args:
             df (DataFrame): Input DataFrame
+            lazy (bool): Defer the calendar columns
             
         Returns:
             DataFrame: DataFrame with additional calculated columns
@@ -95,139 +612,676 @@ class CyclisticAnalyzer:
         # Calculate ride length in minutes
         df['ride_length'] = (df['ended_at'] - df['started_at']).dt.total_seconds() / 60
         
-        # Extract day of week (0=Monday, 6=Sunday)
-        df['day_of_week'] = df['started_at'].dt.dayofweek
-        df['day_name'] = df['started_at'].dt.day_name()
+        if not lazy:
+            self.ensure_columns(CALCULATED_COLUMNS, df)
         
-        # Extract hour for time-based analysis
-        df['start_hour'] = df['started_at'].dt.hour
+        return df
+    
+    def ensure_columns(self, columns, df=None):
+        """
+        Derive any missing calculated columns in place.
         
-        # Extract month and year
-        df['month'] = df['started_at'].dt.month
-        df['year'] = df['started_at'].dt.year
+        Columns already present are left untouched, so each one is computed
+        at most once per frame. Derived columns are functions of columns
+        already there, so adding them to ``df_combined`` does not count as a
+        change to the data.
         
-        # Create weekend indicator
-        df['is_weekend'] = df['day_of_week'].isin([5, 6])  # Saturday and Sunday
+        Args:
+            columns (list): Names of columns from ``DERIVED_COLUMNS``
+            df (DataFrame): Frame to complete (default: ``df_combined``)
+            
+        Returns:
+            DataFrame: The same frame with the requested columns present
+        """
+        if df is None:
+            df = self.df_combined
+        if df is None:
+            return None
         
+        for col in columns:
+            if col in df.columns:
+                continue
+            sources, derive = DERIVED_COLUMNS[col]
+            self.ensure_columns(sources, df)
+            df[col] = derive(df, self.stations)
         return df
     
-    def clean_data(self, df):
+    def clean_data(self, df, verbose=True, inplace=False, return_stats=False):
         """
         Remove invalid data and outliers.
         
+        All rules are evaluated into a single boolean mask that is applied
+        once. Each rejected row is attributed to the first rule it fails, in
+        the order of ``CLEANING_RULES``:
+        
+        - ``invalid_duration``: missing, zero or negative ride length
+        - ``over_24_hours``: longer than 24 hours (likely data errors)
+        - ``under_1_minute``: shorter than 1 minute (likely false starts)
+        - ``missing_station``: no start or end station id
+        
         Args:
             df (DataFrame): Input DataFrame
+            verbose (bool): Print how many records were removed
+            inplace (bool): Drop the rejected rows from ``df`` itself
+            return_stats (bool): Also return the rejection statistics
             
         Returns:
-            DataFrame: Cleaned DataFrame
+            DataFrame: Cleaned DataFrame, or (DataFrame, dict) when
+            ``return_stats`` is True
         """
         initial_rows = len(df)
+        ride_length = df['ride_length'].to_numpy(dtype=np.float64, na_value=np.nan)
+        
+        with np.errstate(invalid='ignore'):
+            failures = {
+                'invalid_duration': ~(ride_length > 0),
+                'over_24_hours': ride_length > 1440,  # 24 hours in minutes
+                'under_1_minute': ride_length < 1,
+                'missing_station': (df['start_station_id'].isna() | df['end_station_id'].isna()).to_numpy()
+            }
+        
+        keep = np.ones(initial_rows, dtype=bool)
+        stats = {'initial_rows': initial_rows}
+        for rule in CLEANING_RULES:
+            rejected = keep & failures[rule]
+            stats[rule] = int(rejected.sum())
+            keep &= ~rejected
+        
+        stats['removed_rows'] = initial_rows - int(keep.sum())
+        stats['final_rows'] = initial_rows - stats['removed_rows']
         
-        # Remove rides with negative or zero duration
-        df = df[df['ride_length'] > 0]
+        if stats['removed_rows']:
+            if inplace:
+                # Drop by position: labels can repeat in concatenated inputs
+                index = df.index
+                df.index = pd.RangeIndex(initial_rows)
+                df.drop(index=np.flatnonzero(~keep), inplace=True)
+                df.index = index[keep]
+                if df is self.df_combined:
+                    self.mark_data_changed()
+            else:
+                df = df[keep]
+        
+        if verbose:
+            self._report_cleaning(stats)
+        
+        return (df, stats) if return_stats else df
+    
+    def _report_cleaning(self, stats, label=None):
+        """Print cleaning statistics returned by ``clean_data``."""
+        initial_rows = stats['initial_rows']
+        removed = stats['removed_rows']
+        removed_pct = (removed / initial_rows * 100) if initial_rows else 0.0
+        prefix = f"{label}: " if label else ""
         
-        # Remove extremely long rides (likely data errors) - over 24 hours
-        df = df[df['ride_length'] <= 1440]  # 24 hours in minutes
+        print(f"{prefix}Removed {removed} invalid records ({removed_pct:.2f}%)")
+        if removed:
+            details = ', '.join(f"{rule}={stats[rule]:,}" for rule in CLEANING_RULES if stats[rule])
+            print(f"  Rejected by rule: {details}")
+    
+    def optimize_dtypes(self, df, verbose=True):
+        """
+        Convert a prepared DataFrame to a compact schema.
         
-        # Remove extremely short rides (likely false starts) - under 1 minute
-        df = df[df['ride_length'] >= 1]
+        Repeated strings become categoricals, whole-number columns are
+        downcast to the narrowest integer type that holds them, measurements
+        become float32 and ``ride_id`` is replaced by a 64-bit hash key.
+        
+        Args:
+            df (DataFrame): Prepared trips
+            verbose (bool): Print memory usage before and after
+            
+        Returns:
+            DataFrame: DataFrame with compact dtypes
+        """
+        memory_before = df.memory_usage(deep=True).sum()
         
-        # Remove rides with missing station information
-        df = df.dropna(subset=['start_station_id', 'end_station_id'])
+        for col in CATEGORY_COLUMNS:
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
         
-        final_rows = len(df)
-        removed_pct = ((initial_rows - final_rows) / initial_rows * 100)
-        print(f"Removed {initial_rows - final_rows} invalid records ({removed_pct:.2f}%)")
+        for col in INTEGER_COLUMNS:
+            # Columns with missing values cannot be stored as plain integers
+            if col in df.columns and pd.api.types.is_numeric_dtype(df[col]) and df[col].notna().all():
+                values = df[col]
+                if (values == values.round()).all():
+                    df[col] = pd.to_numeric(values.astype(np.int64), downcast='integer')
+        
+        for col in FLOAT32_COLUMNS:
+            if col in df.columns and pd.api.types.is_float_dtype(df[col]):
+                df[col] = df[col].astype(np.float32)
+        
+        if 'ride_id' in df.columns and not pd.api.types.is_unsigned_integer_dtype(df['ride_id']):
+            df['ride_id'] = pd.util.hash_pandas_object(df['ride_id'], index=False).to_numpy()
+        
+        memory_after = df.memory_usage(deep=True).sum()
+        self.memory_usage = {'before_mb': memory_before / 1024**2, 'after_mb': memory_after / 1024**2}
+        
+        if verbose:
+            print(f"Memory usage: {memory_before / 1024**2:.1f} MB -> {memory_after / 1024**2:.1f} MB "
+                  f"({memory_before / max(memory_after, 1):.1f}x smaller)")
         
         return df
     
-    def prepare_data(self, file_2019=None, file_2020=None):
+    def prepare_frame(self, df, verbose=True, inplace=False, return_stats=False):
+        """
+        Run the per-file preparation steps on a raw DataFrame.
+        
+        Args:
+            df (DataFrame): Raw trips as read from a Divvy CSV file in any
+                supported export format
+            verbose (bool): Print cleaning statistics
+            inplace (bool): Prepare ``df`` itself instead of a copy; only for
+                frames that are not used after this call
+            return_stats (bool): Also return the cleaning statistics
+            
+        Returns:
+            DataFrame: Standardized, enriched and cleaned trips, or
+            (DataFrame, dict) when ``return_stats`` is True
+        """
+        if not inplace:
+            df = df.copy()
+        legacy = detect_schema(df.columns) != 'divvy_2020'
+        df = self.standardize_columns(df)
+        
+        # Convert datetime columns
+        for col in ['started_at', 'ended_at']:
+            df[col] = parse_timestamps(df[col])
+        
+        # Standardize member_casual values
+        if legacy:
+            df['member_casual'] = df['member_casual'].map(LEGACY_USER_TYPES)
+        
+        df = self.add_calculated_columns(df, lazy=self.lazy_columns)
+        return self.clean_data(df, verbose=verbose, inplace=True, return_stats=return_stats)
+    
+    def prepare_data(self, file_2019=None, file_2020=None, chunksize=None,
+                     data_manager=None, rebuild_cache=False, compact=False, parallel=False):
         """
         Complete data preparation pipeline.
         
         Args:
             file_2019 (str): Path to 2019 Q1 CSV file
             file_2020 (str): Path to 2020 Q1 CSV file
+            chunksize (int): Stream each file in chunks of this many rows and
+                keep only running aggregates instead of the combined trips
+            data_manager (DataManager): Cache the cleaned trips in its
+                processed directory and reuse them on later runs
+            rebuild_cache (bool): Ignore any cached copy and rebuild it
+            compact (bool): Store the combined trips with compact dtypes
+                (see ``optimize_dtypes``)
+            parallel (bool): Prepare the two files concurrently in separate
+                worker processes
         """
         # Use sample data if files not provided
         if file_2019 is None or file_2020 is None:
             print("Using sample data for demonstration...")
             self._create_sample_data()
             return
-            
-        # Load data
-        df_2019, df_2020 = self.load_data(file_2019, file_2020)
-        if df_2019 is None or df_2020 is None:
-            print("Failed to load data. Using sample data instead...")
-            self._create_sample_data()
+        
+        if chunksize:
+            self.prepare_data_streaming(file_2019, file_2020, chunksize)
             return
+            
+        cache_key = None
+        if data_manager is not None:
+            try:
+                pipeline_version = PIPELINE_VERSION + ('-compact' if compact else '')
+                cache_key = data_manager.get_cache_key([file_2019, file_2020], pipeline_version)
+            except FileNotFoundError:
+                cache_key = None
+            
+            if cache_key is not None and not rebuild_cache:
+                cached = data_manager.load_cached_data(cache_key)
+                if cached is not None:
+                    self.df_combined = cached
+                    self.aggregates = None
+                    stations = data_manager.load_cached_data(cache_key, prefix=STATIONS_CACHE_PREFIX)
+                    if stations is not None:
+                        self.stations = StationDimension(stations.set_index('station_id'))
+                    else:
+                        self.intern_stations()
+                    print(f"Combined dataset shape: {self.df_combined.shape}")
+                    return
+            
+        if parallel:
+            try:
+                outcomes = self._run_workers([file_2019, file_2020], max_workers=2)
+            except FileNotFoundError as e:
+                print(f"Error loading data files: {e}")
+                print("Failed to load data. Using sample data instead...")
+                self._create_sample_data()
+                return
+            
+            self.cleaning_stats = {}
+            for (path, stats, prepared), year in zip(outcomes, [2019, 2020]):
+                print(f"{year} Q1: {stats['initial_rows']:,} records read from {path}")
+                self._report_cleaning(stats)
+                self.cleaning_stats[f'{year} Q1'] = stats
+            
+            # Combine datasets
+            self.df_combined = self._combine_outcomes(outcomes)
+        else:
+            # Load data
+            df_2019, df_2020 = self.load_data(file_2019, file_2020)
+            if df_2019 is None or df_2020 is None:
+                print("Failed to load data. Using sample data instead...")
+                self._create_sample_data()
+                return
+            
+            df_2019_final, stats_2019 = self.prepare_frame(df_2019, inplace=True, return_stats=True)
+            df_2020_final, stats_2020 = self.prepare_frame(df_2020, inplace=True, return_stats=True)
+            del df_2019, df_2020
+            self.cleaning_stats = {'2019 Q1': stats_2019, '2020 Q1': stats_2020}
+            
+            # Combine datasets
+            self.df_combined = pd.concat([df_2019_final, df_2020_final], ignore_index=True)
+        self.intern_stations()
+        self.aggregates = None
+        print(f"Combined dataset shape: {self.df_combined.shape}")
         
-        # Standardize columns
-        df_2019_clean = self.standardize_columns(df_2019.copy(), 2019)
-        df_2020_clean = df_2020.copy()
+        if compact:
+            self.df_combined = self.optimize_dtypes(self.df_combined)
         
-        # Convert datetime columns
-        datetime_columns = ['started_at', 'ended_at']
-        for col in datetime_columns:
-            df_2019_clean[col] = pd.to_datetime(df_2019_clean[col])
-            df_2020_clean[col] = pd.to_datetime(df_2020_clean[col])
+        if cache_key is not None:
+            data_manager.save_cached_data(self.df_combined, cache_key)
+            data_manager.save_cached_data(self.stations.table.reset_index(), cache_key,
+                                          prefix=STATIONS_CACHE_PREFIX)
+    
+    def intern_stations(self):
+        """
+        Move station names out of the trips into the station dimension.
         
-        # Standardize member_casual values
-        df_2019_clean['member_casual'] = df_2019_clean['member_casual'].map({
-            'Subscriber': 'member',
-            'Customer': 'casual'
-        })
+        Builds ``stations`` (id -> name, lat, lng) from ``df_combined`` and
+        leaves only integer station ids on the trips; names are resolved
+        through ``stations`` when a report needs them.
         
-        # Add calculated columns
-        df_2019_clean = self.add_calculated_columns(df_2019_clean)
-        df_2020_clean = self.add_calculated_columns(df_2020_clean)
+        Returns:
+            StationDimension: The station dimension
+        """
+        if self.df_combined is None:
+            return None
+        self.stations = StationDimension.from_trips(self.df_combined)
+        self.df_combined = self.stations.intern(self.df_combined)
+        return self.stations
+    
+    def prepare_data_streaming(self, file_2019, file_2020, chunksize=500_000):
+        """
+        Prepare data in fixed-size chunks, folding each into running aggregates.
         
-        # Clean data
-        df_2019_final = self.clean_data(df_2019_clean)
-        df_2020_final = self.clean_data(df_2020_clean)
+        Peak memory depends on ``chunksize`` rather than on file size. The
+        combined trips are not kept, so ``df_combined`` stays ``None`` and the
+        analysis methods read from ``aggregates`` instead.
         
-        # Combine datasets
-        self.df_combined = pd.concat([df_2019_final, df_2020_final], ignore_index=True)
-        print(f"Combined dataset shape: {self.df_combined.shape}")
+        Args:
+            file_2019 (str): Path to 2019 Q1 CSV file
+            file_2020 (str): Path to 2020 Q1 CSV file
+            chunksize (int): Number of rows to read per chunk
+            
+        Returns:
+            TripAggregates: Aggregates over all cleaned trips
+        """
+        aggregates = TripAggregates()
+        stations = StationDimension()
+        cleaning_stats = {}
+        
+        for path, year in [(file_2019, 2019), (file_2020, 2020)]:
+            stats = None
+            try:
+                for chunk in read_trip_csv(path, chunksize=chunksize):
+                    chunk, chunk_stats = self.prepare_frame(chunk, verbose=False, inplace=True, return_stats=True)
+                    stats = merge_cleaning_stats(stats, chunk_stats)
+                    aggregates.update(self.ensure_columns(AGGREGATE_COLUMNS, chunk))
+                    stations.update(chunk)
+            except FileNotFoundError as e:
+                print(f"Error loading data files: {e}")
+                print("Please ensure the CSV files are in the data/ directory")
+                return None
+            
+            print(f"{year} Q1: streamed {stats['initial_rows']:,} records in chunks of {chunksize:,}")
+            self._report_cleaning(stats)
+            cleaning_stats[f'{year} Q1'] = stats
+        
+        self.cleaning_stats = cleaning_stats
+        
+        self.df_combined = None
+        self.aggregates = aggregates
+        self.stations = stations
+        print(f"Aggregated rides: {aggregates.total_rides:,}")
+        return aggregates
     
-    def _create_sample_data(self):
-        """Create sample data for demonstration purposes."""
-        np.random.seed(42)
+    def _run_workers(self, paths, max_workers, keep_rows=True, chunksize=None):
+        """
+        Prepare trip files in worker processes.
         
-        # Create sample data with realistic patterns
-        n_samples = 10000
-        start_dates = pd.date_range('2019-01-01', '2020-03-31', periods=n_samples)
+        Args:
+            paths (list): Trip file paths
+            max_workers (int): Number of worker processes
+            keep_rows (bool): Return prepared trips rather than aggregates
+            chunksize (int): Rows per chunk when only aggregates are returned
+            
+        Returns:
+            list: (path, cleaning statistics, prepared DataFrame or TripAggregates)
+            in file order
+        """
+        paths = [str(path) for path in paths]
         
-        # Create member_casual with realistic distribution
-        member_casual = np.random.choice(['member', 'casual'], n_samples, p=[0.75, 0.25])
+        if max_workers == 1:
+            return [_prepare_trip_file(path, keep_rows, chunksize, lazy_columns=self.lazy_columns)
+                    for path in paths]
         
-        # Create ride_length with different patterns for members vs casual
-        ride_length = []
-        for mc in member_casual:
-            if mc == 'member':
-                # Members: shorter rides, normal distribution around 12 minutes
-                length = np.random.normal(12, 5)
-            else:
-                # Casual: longer rides, normal distribution around 36 minutes
-                length = np.random.normal(36, 15)
-            ride_length.append(max(1, length))  # Ensure positive values
-        
-        self.df_combined = pd.DataFrame({
-            'ride_id': [f'sample_{i}' for i in range(n_samples)],
-            'started_at': start_dates,
-            'ended_at': start_dates + pd.to_timedelta(ride_length, unit='minutes'),
-            'member_casual': member_casual,
-            'ride_length': ride_length,
-            'start_station_id': np.random.randint(1, 100, n_samples),
-            'end_station_id': np.random.randint(1, 100, n_samples)
-        })
+        outcomes = {}
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(_prepare_trip_file, path, keep_rows=keep_rows, chunksize=chunksize,
+                                   share_memory=keep_rows, lazy_columns=self.lazy_columns)
+                       for path in paths]
+            try:
+                for future in as_completed(futures):
+                    path, stats, prepared = future.result()
+                    outcomes[path] = (path, stats, prepared)
+            except BaseException:
+                # Free the blocks of every worker that finished, including the
+                # ones still running when the failure was raised
+                for future in futures:
+                    future.cancel()
+                for future in futures:
+                    if future.cancelled():
+                        continue
+                    try:
+                        _, _, prepared = future.result()
+                    except BaseException:
+                        continue
+                    if keep_rows:
+                        release_shared_frame(prepared)
+                raise
+        
+        # Keep partitions in file order so results do not depend on completion order
+        return [outcomes[path] for path in paths]
+    
+    def prepare_files(self, source, max_workers=None, keep_rows=True, chunksize=None):
+        """
+        Prepare any number of Divvy trip files in parallel worker processes.
+        
+        Each file's export format is detected from its columns, so quarters
+        from different years can be mixed freely.
+        
+        Args:
+            source (str or list): Glob pattern, directory or list of CSV paths
+            max_workers (int): Number of worker processes (default: CPU count)
+            keep_rows (bool): Concatenate the prepared trips into
+                ``df_combined``; when False each worker returns only
+                aggregates, which are merged as they arrive
+            chunksize (int): Rows per chunk read by each worker when
+                ``keep_rows`` is False
+                
+        Returns:
+            int: Number of files prepared
+        """
+        paths = find_trip_files(source)
+        if not paths:
+            print(f"No trip files found for {source}")
+            return 0
+        
+        max_workers = min(max_workers or os.cpu_count() or 1, len(paths))
+        print(f"Preparing {len(paths)} trip files with {max_workers} worker(s)...")
+        
+        outcomes = self._run_workers(paths, max_workers, keep_rows, chunksize)
+        
+        self.cleaning_stats = {}
+        for path, stats, prepared in outcomes:
+            print(f"  - {Path(path).name}: {stats['initial_rows']:,} records, "
+                  f"{stats['removed_rows']:,} removed")
+            self.cleaning_stats[Path(path).name] = stats
+        
+        if keep_rows:
+            self.df_combined = self._combine_outcomes(outcomes)
+            self.intern_stations()
+            self.aggregates = None
+            print(f"Combined dataset shape: {self.df_combined.shape}")
+        else:
+            aggregates = TripAggregates()
+            for _, _, prepared in outcomes:
+                aggregates.merge(prepared)
+            self.df_combined = None
+            self.aggregates = aggregates
+            print(f"Aggregated rides: {aggregates.total_rides:,}")
+        
+        return len(paths)
+    
+    def update_state(self, source, state_path=DEFAULT_STATE_PATH, max_workers=None, chunksize=None,
+                     root=None):
+        """
+        Fold new or changed trip files into the persisted analysis state.
+        
+        Only files whose content differs from the stored partition are
+        prepared; every other partition is reused as saved. The merged
+        aggregates then feed the analyses exactly as in streaming mode, and
+        they match preparing all the files in one run. Partitions are keyed
+        by the file's path relative to ``root``, which is saved with the
+        state, and partitions of files that have been deleted are dropped.
+        Partitions of existing files that are not matched by ``source`` are
+        kept.
+        
+        Args:
+            source (str or list): Glob pattern, directory or list of CSV paths
+            state_path (str): Path of the saved state
+            max_workers (int): Number of worker processes (default: CPU count)
+            chunksize (int): Rows per chunk read by each worker
+            root (str): Directory the trip files are located under; a state
+                saved under another root is rebuilt (default: the saved root,
+                or the directory of ``source`` for a new state)
+            
+        Returns:
+            list: Partition names of the files that were prepared or dropped
+        """
+        paths = find_trip_files(source)
+        state = AnalysisState.load(state_path, PIPELINE_VERSION, root=root)
+        if state.root is None:
+            state.root = trip_file_root(source).resolve()
+        removed = state.prune()
+        if removed:
+            print(f"Dropped {len(removed)} partitions of deleted trip files: {', '.join(removed)}")
+        changed = [path for path in paths if not state.is_current(path)]
+        
+        if changed:
+            max_workers = min(max_workers or os.cpu_count() or 1, len(changed))
+            print(f"Updating analysis state with {len(changed)} of {len(paths)} trip files...")
+            for path, stats, aggregates in self._run_workers(changed, max_workers, keep_rows=False,
+                                                             chunksize=chunksize):
+                print(f"  - {state.partition_name(path)}: {stats['initial_rows']:,} records, "
+                      f"{stats['removed_rows']:,} removed")
+                state.add_partition(path, stats, aggregates)
+        else:
+            print(f"Analysis state is up to date ({len(state)} partitions)")
+        # Saved even when unchanged to record refreshed modification times
+        state.save(state_path)
+        
+        self.cleaning_stats = state.cleaning_stats()
+        self.df_combined = None
+        self.aggregates = state.aggregates()
+        self.stations = None
+        print(f"Aggregated rides: {self.aggregates.total_rides:,}")
+        return [state.partition_name(path) for path in changed] + removed
+    
+    def _combine_outcomes(self, outcomes):
+        """Concatenate prepared frames or shared-memory payloads from the workers."""
+        parts = [prepared for _, _, prepared in outcomes]
+        if all(isinstance(part, pd.DataFrame) for part in parts):
+            return pd.concat(parts, ignore_index=True)
+        return collect_shared_frames(parts)
+    
+    def _create_sample_data(self, n_samples=10000, seed=42):
+        """Create sample data for demonstration purposes."""
+        trips = generate_trips(n_samples, seed=seed)
+        self.stations = StationDimension.from_trips(trips)
+        self.df_combined = trips[['ride_id', 'started_at', 'ended_at', 'member_casual',
+                                  'start_station_id', 'end_station_id']]
         
         # Add calculated columns
-        self.df_combined = self.add_calculated_columns(self.df_combined)
+        self.df_combined = self.add_calculated_columns(self.df_combined, lazy=self.lazy_columns)
+        self.df_combined = self.stations.intern(self.df_combined)
+        self.aggregates = None
         
         print("Sample data created successfully!")
         print(f"Sample dataset shape: {self.df_combined.shape}")
     
+    def use_sqlite(self, path, batch_size=100_000):
+        """
+        Keep the prepared trips in a SQLite database instead of in memory.
+        
+        The trips in ``df_combined`` are bulk-loaded into the database and
+        released; without prepared trips, an existing database is opened
+        as is. The duration, weekly and hourly analyses then run as SQL
+        aggregations and the database can be queried ad hoc through
+        ``store.query``.
+        
+        Args:
+            path (str): Path of the SQLite database file
+            batch_size (int): Rows per ``executemany`` call while loading
+            
+        Returns:
+            SQLiteTripStore: The trip store, or None if there are no trips
+        """
+        store = SQLiteTripStore(path)
+        if self.df_combined is not None:
+            rows = store.load(self.ensure_columns(AGGREGATE_COLUMNS), batch_size=batch_size)
+            print(f"Stored {rows:,} trips in SQLite database: {path}")
+        elif len(store) == 0:
+            print("No data available. Please run prepare_data() first.")
+            store.close()
+            return None
+        
+        self.df_combined = None
+        self.aggregates = None
+        self.store = store
+        return store
+    
+    def save_column_store(self, directory, source_key=None):
+        """
+        Save the prepared trips as a memory-mappable column store.
+        
+        The station dimension, when present, is saved in a ``stations``
+        subdirectory of the store.
+        
+        Args:
+            directory (str): Directory of the store
+            source_key (str): Key of the source files and pipeline the trips
+                were prepared from, checked before the store is reopened
+            
+        Returns:
+            Path: Path of the written manifest, or None without trips
+        """
+        if self.df_combined is None:
+            print("No data available. Please run prepare_data() first.")
+            return None
+        
+        manifest = write_column_store(self.df_combined, directory, source_key=source_key)
+        if self.stations is not None:
+            write_column_store(self.stations.table.reset_index(), Path(directory) / 'stations')
+        print(f"Prepared trips saved to column store: {directory}")
+        return manifest
+    
+    def open_column_store(self, directory, mmap=True, columns=None):
+        """
+        Open prepared trips saved with ``save_column_store``.
+        
+        With ``mmap`` the columns are memory-mapped read-only rather than
+        read, so analysis can start at once and several processes opening
+        the same store share one copy of the data in the page cache.
+        String columns come back as categoricals over their dictionaries.
+        
+        Args:
+            directory (str): Directory of the store
+            mmap (bool): Memory-map the columns instead of reading them
+            columns (list): Columns to open (default: all)
+            
+        Returns:
+            DataFrame: The prepared trips, now in ``df_combined``
+        """
+        df = read_column_store(directory, mmap=mmap, columns=columns)
+        
+        stations = None
+        if (Path(directory) / 'stations' / MANIFEST_FILE).exists():
+            table = read_column_store(Path(directory) / 'stations', mmap=False)
+            table['name'] = table['name'].astype(object)
+            stations = StationDimension(table.set_index('station_id'))
+        
+        self.df_combined = df
+        self.stations = stations
+        self.aggregates = None
+        print(f"Opened column store {directory}: {len(df):,} trips")
+        return df
+    
+    def _has_station_data(self):
+        """Check whether the trips carry station ids or coordinates."""
+        return self.df_combined is not None and any(
+            col in self.df_combined.columns for col in ['start_station_id', 'start_lat'])
+    
+    def _has_data(self):
+        """Check whether trips, streamed aggregates or a trip store are available."""
+        return self.df_combined is not None or self.aggregates is not None or self.store is not None
+    
+    def get_aggregates(self):
+        """
+        Get the aggregate cube that feeds every analysis.
+        
+        For in-memory data the cube is built from ``df_combined`` in a single
+        vectorized pass the first time it is needed, and with a SQLite store
+        it is built by grouped SQL queries; in streaming mode it is the cube
+        accumulated during preparation.
+        
+        Returns:
+            TripAggregates: Aggregates over all prepared trips, or None
+        """
+        if self.memoize and self._memo_depth == 0:
+            self._validate_cache()
+        if self.aggregates is None and self.df_combined is not None:
+            df = self.ensure_columns(AGGREGATE_COLUMNS)
+            self.aggregates = TripAggregates().update(df)
+        elif self.aggregates is None and self.store is not None:
+            self.aggregates = self.store.aggregates()
+        return self.aggregates
+    
+    def get_trip_index(self):
+        """
+        Get the time-sorted index of the prepared trips.
+        
+        The index is built the first time it is needed and rebuilt whenever
+        ``df_combined`` is replaced. Call ``mark_data_changed`` after editing
+        ``df_combined`` in place.
+        
+        Returns:
+            TripIndex: Index over ``df_combined``, or None without trips
+        """
+        if self._trip_index is None and self.df_combined is not None:
+            self._trip_index = TripIndex(self.ensure_columns(AGGREGATE_COLUMNS))
+        return self._trip_index
+    
+    def query_window(self, start=None, end=None, user_type=None, station_id=None):
+        """
+        Duration, weekly and hourly statistics for a date window.
+        
+        Meant for dashboards firing many small queries: the window is found
+        by binary search on the trip index and only its trips are
+        aggregated, so nothing is printed or stored in ``analysis_results``.
+        
+        Args:
+            start (str or Timestamp): First start time included (default: all)
+            end (str or Timestamp): First start time excluded (default: all)
+            user_type (str): Only rides by this user type
+            station_id (int or str): Only trips starting or ending at this station
+            
+        Returns:
+            dict: ``duration_stats``, ``weekly`` and ``hourly`` DataFrames laid
+            out like the full analyses, or None without trips
+        """
+        index = self.get_trip_index()
+        if index is None:
+            print("Date window queries need the trips; prepare the data without chunksize.")
+            return None
+        return index.summary(start, end, user_type, station_id)
+    
+    @_memoized
     def analyze_ride_duration(self):
         """
         Analyze ride duration by user type.
@@ -235,13 +1289,20 @@ class CyclisticAnalyzer:
         Returns:
             DataFrame: Duration statistics by user type
         """
-        if self.df_combined is None:
+        if not self._has_data():
             print("No data available. Please run prepare_data() first.")
             return None
             
-        duration_stats = self.df_combined.groupby('member_casual')['ride_length'].agg([
-            'count', 'mean', 'median', 'std', 'min', 'max'
-        ]).round(2)
+        duration_stats = self.get_aggregates().duration_stats()
+        
+        # Medians cannot be derived from the cube, so take them from the rows when kept
+        if self.df_combined is not None:
+            medians = self.df_combined.groupby('member_casual', observed=True)['ride_length'].median()
+            duration_stats['median'] = medians.reindex(duration_stats.index).to_numpy()
+        elif self.store is not None:
+            medians = self.store.duration_medians()
+            duration_stats['median'] = medians.reindex(duration_stats.index).to_numpy()
+        duration_stats = duration_stats.round(2)
         
         print("Ride Duration Analysis:")
         print(duration_stats)
@@ -262,6 +1323,46 @@ class CyclisticAnalyzer:
         
         return duration_stats
     
+    @_memoized
+    def analyze_duration_quantiles(self, exact=None):
+        """
+        Analyze the spread of ride durations by user type.
+        
+        Args:
+            exact (bool): Compute quantiles from the trips rather than from
+                the duration sketch; defaults to True whenever the trips are
+                kept in memory. Sketch estimates are within 3 seconds of the
+                exact values (see ``DurationSketch``).
+        
+        Returns:
+            DataFrame: p25, median, p75, p90, p99 and iqr per user type
+        """
+        if not self._has_data():
+            print("No data available. Please run prepare_data() first.")
+            return None
+        
+        if exact is None:
+            exact = self.df_combined is not None
+        
+        if exact:
+            if self.df_combined is None:
+                print("Exact quantiles need the trips; prepare the data without chunksize.")
+                return None
+            quantiles = (self.df_combined.groupby('member_casual', observed=True)['ride_length']
+                         .quantile([0.25, 0.5, 0.75, 0.9, 0.99]).unstack())
+            quantiles.columns = ['p25', 'median', 'p75', 'p90', 'p99']
+            quantiles['iqr'] = quantiles['p75'] - quantiles['p25']
+        else:
+            quantiles = self.get_aggregates().duration_quantiles()
+        quantiles = quantiles.dropna().round(2)
+        
+        print(f"Ride Duration Quantiles ({'exact' if exact else 'approximate'}):")
+        print(quantiles)
+        
+        self.analysis_results['duration_quantiles'] = quantiles
+        return quantiles
+    
+    @_memoized
     def analyze_weekly_patterns(self):
         """
         Analyze usage patterns by day of week.
@@ -269,16 +1370,11 @@ class CyclisticAnalyzer:
         Returns:
             DataFrame: Weekly usage patterns by user type
         """
-        if self.df_combined is None:
+        if not self._has_data():
             print("No data available. Please run prepare_data() first.")
             return None
             
-        weekly_stats = self.df_combined.groupby(['member_casual', 'day_name'])['ride_id'].count().reset_index()
-        weekly_pivot = weekly_stats.pivot(index='day_name', columns='member_casual', values='ride_id')
-        
-        # Reorder days
-        day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        weekly_pivot = weekly_pivot.reindex(day_order)
+        weekly_pivot = self.get_aggregates().weekly_counts()
         
         print("Weekly Usage Patterns:")
         print(weekly_pivot)
@@ -302,6 +1398,7 @@ class CyclisticAnalyzer:
         
         return weekly_pivot
     
+    @_memoized
     def analyze_hourly_patterns(self):
         """
         Analyze usage patterns by hour of day.
@@ -309,12 +1406,11 @@ class CyclisticAnalyzer:
         Returns:
             DataFrame: Hourly usage patterns by user type
         """
-        if self.df_combined is None:
+        if not self._has_data():
             print("No data available. Please run prepare_data() first.")
             return None
             
-        hourly_stats = self.df_combined.groupby(['member_casual', 'start_hour'])['ride_id'].count().reset_index()
-        hourly_pivot = hourly_stats.pivot(index='start_hour', columns='member_casual', values='ride_id')
+        hourly_pivot = self.get_aggregates().hourly_counts()
         
         # Find peak hours
         for user_type in ['casual', 'member']:
@@ -325,6 +1421,98 @@ class CyclisticAnalyzer:
         
         return hourly_pivot
     
+    def _name_stations(self, routes):
+        """Add station names to a small table of routes."""
+        if self.stations is None:
+            return routes
+        for end in ['start', 'end']:
+            position = routes.columns.get_loc(f'{end}_station_id') + 1
+            routes.insert(position, f'{end}_station_name', self.stations.names(routes[f'{end}_station_id']))
+        return routes
+    
+    @_memoized
+    def analyze_station_flows(self, top_n=10, min_rides=20):
+        """
+        Analyze station-to-station flows with a sparse origin-destination matrix.
+        
+        Args:
+            top_n (int): Number of routes and stations to report
+            min_rides (int): Minimum trips for a route to count as a corridor
+            
+        Returns:
+            StationFlows: Flows split by user type, or None
+        """
+        if self.df_combined is None:
+            print("Station flows need the trips; prepare the data without chunksize.")
+            return None
+        
+        flows = StationFlows.from_trips(self.df_combined, split_by='member_casual')
+        top_routes = self._name_stations(flows.top_routes(top_n))
+        station_volume = flows.station_volume()
+        corridors = self._name_stations(flows.casual_heavy_corridors(top_n, min_rides=min_rides))
+        if self.stations is not None:
+            station_volume.insert(0, 'name', self.stations.names(station_volume.index))
+        
+        print(f"Station Flows: {flows.total_trips:,} trips between {flows.n_stations} stations")
+        print("\nTop routes:")
+        print(top_routes.to_string(index=False))
+        print("\nBusiest stations:")
+        print(station_volume.head(top_n))
+        print("\nCasual-heavy corridors:")
+        print(corridors.round(3).to_string(index=False))
+        
+        # Store results
+        self.analysis_results['top_routes'] = top_routes
+        self.analysis_results['station_volume'] = station_volume
+        self.analysis_results['casual_corridors'] = corridors
+        
+        return flows
+    
+    @_memoized
+    def analyze_trip_distances(self):
+        """
+        Analyze straight-line trip distance and average speed by user type.
+        
+        Round trips that end where they started have no measurable distance
+        and are left out of the speed statistics.
+        
+        Returns:
+            DataFrame: Distance (km) and speed (km/h) statistics by user type
+        """
+        if self.df_combined is None:
+            print("Trip distances need the trips; prepare the data without chunksize.")
+            return None
+        
+        df = self.ensure_columns(['distance_km', 'speed_kmh'])
+        located = df['distance_km'].notna()
+        if not located.any():
+            print("No trip or station coordinates available for distance analysis.")
+            return None
+        
+        trips = df.loc[located, ['member_casual', 'distance_km', 'speed_kmh']]
+        moving = trips[trips['distance_km'] > 0]
+        by_user = trips.groupby('member_casual', observed=True)
+        distance_stats = pd.DataFrame({
+            'trips': by_user.size(),
+            'mean_km': by_user['distance_km'].mean(),
+            'median_km': by_user['distance_km'].median(),
+            'round_trip_pct': (trips['distance_km'] == 0).groupby(trips['member_casual'], observed=True).mean() * 100,
+            'mean_speed_kmh': moving.groupby('member_casual', observed=True)['speed_kmh'].mean(),
+            'median_speed_kmh': moving.groupby('member_casual', observed=True)['speed_kmh'].median()
+        }).round(2)
+        
+        print("Trip Distance Analysis:")
+        print(distance_stats)
+        
+        # Store results
+        self.analysis_results['distance_stats'] = distance_stats
+        for user_type in distance_stats.index:
+            self.analysis_results[f'{user_type}_avg_distance_km'] = distance_stats.loc[user_type, 'mean_km']
+            self.analysis_results[f'{user_type}_avg_speed_kmh'] = distance_stats.loc[user_type, 'mean_speed_kmh']
+        
+        return distance_stats
+    
+    @_memoized
     def run_complete_analysis(self):
         """
         Run the complete analysis pipeline.
@@ -336,17 +1524,19 @@ class CyclisticAnalyzer:
         print("CYCLISTIC BIKE-SHARE ANALYSIS RESULTS")
         print("="*50)
         
-        if self.df_combined is None:
+        if not self._has_data():
             print("No data available. Please run prepare_data() first.")
             return None
         
         # Basic dataset statistics
-        total_rides = len(self.df_combined)
-        casual_rides = len(self.df_combined[self.df_combined['member_casual'] == 'casual'])
-        member_rides = len(self.df_combined[self.df_combined['member_casual'] == 'member'])
+        aggregates = self.get_aggregates()
+        user_counts = aggregates.user_counts()
+        total_rides = int(user_counts.sum())
+        casual_rides = int(user_counts['casual'])
+        member_rides = int(user_counts['member'])
         
         print(f"Total rides analyzed: {total_rides:,}")
-        print(f"Date range: {self.df_combined['started_at'].min()} to {self.df_combined['started_at'].max()}")
+        print(f"Date range: {aggregates.first_start} to {aggregates.last_start}")
         print(f"Casual riders: {casual_rides:,}")
         print(f"Annual members: {member_rides:,}")
         
@@ -366,11 +1556,20 @@ class CyclisticAnalyzer:
         print("\n" + "="*50)
         self.analyze_hourly_patterns()
         
+        if self._has_station_data():
+            print("\n" + "="*50)
+            self.analyze_trip_distances()
+        
+        if self.df_combined is not None and {'start_station_id', 'end_station_id'} <= set(self.df_combined.columns):
+            print("\n" + "="*50)
+            self.analyze_station_flows()
+        
         return self.analysis_results
     
+    @_memoized
     def generate_summary_report(self):
         """Generate comprehensive summary report."""
-        if self.df_combined is None:
+        if not self._has_data():
             print("No data available. Please run prepare_data() first.")
             return
             
@@ -378,9 +1577,14 @@ class CyclisticAnalyzer:
         print("EXECUTIVE SUMMARY - CYCLISTIC BIKE-SHARE ANALYSIS")
         print("="*60)
         
-        total_rides = len(self.df_combined)
-        casual_rides = len(self.df_combined[self.df_combined['member_casual'] == 'casual'])
-        member_rides = len(self.df_combined[self.df_combined['member_casual'] == 'member'])
+        aggregates = self.get_aggregates()
+        user_counts = aggregates.user_counts()
+        weekend_counts = aggregates.weekend_counts()
+        duration_means = aggregates.duration_stats()['mean']
+        
+        total_rides = int(user_counts.sum())
+        casual_rides = int(user_counts['casual'])
+        member_rides = int(user_counts['member'])
         
         print(f"📊 DATASET OVERVIEW:")
         print(f"   • Total rides analyzed: {total_rides:,}")
@@ -388,8 +1592,8 @@ class CyclisticAnalyzer:
         print(f"   • Member trips: {member_rides:,} ({member_rides/total_rides*100:.1f}%)")
         
         # Duration insights
-        casual_avg = self.df_combined[self.df_combined['member_casual'] == 'casual']['ride_length'].mean()
-        member_avg = self.df_combined[self.df_combined['member_casual'] == 'member']['ride_length'].mean()
+        casual_avg = duration_means['casual']
+        member_avg = duration_means['member']
         
         print(f"\n🚴‍♀️ RIDE DURATION INSIGHTS:")
         print(f"   • Casual rider average: {casual_avg:.1f} minutes")
@@ -397,15 +1601,26 @@ class CyclisticAnalyzer:
         print(f"   • Casual riders take {casual_avg/member_avg:.1f}x longer rides")
         
         # Weekly patterns
-        weekend_data = self.df_combined[self.df_combined['is_weekend'] == True]
-        casual_weekend_pct = len(weekend_data[weekend_data['member_casual'] == 'casual']) / casual_rides * 100
-        member_weekend_pct = len(weekend_data[weekend_data['member_casual'] == 'member']) / member_rides * 100
+        casual_weekend_pct = weekend_counts['casual'] / casual_rides * 100
+        member_weekend_pct = weekend_counts['member'] / member_rides * 100
         
         print(f"\n📅 WEEKLY USAGE PATTERNS:")
         print(f"   • Casual riders - Weekend usage: {casual_weekend_pct:.1f}%")
         print(f"   • Members - Weekend usage: {member_weekend_pct:.1f}%")
         print(f"   • Weekend preference ratio: {casual_weekend_pct/member_weekend_pct:.1f}x higher for casual riders")
         
+        # Distance insights, when the trips could be located; the table itself
+        # is printed by run_complete_analysis
+        distance_stats = None
+        if self._has_station_data():
+            with contextlib.redirect_stdout(io.StringIO()):
+                distance_stats = self.analyze_trip_distances()
+        if distance_stats is not None and {'casual', 'member'} <= set(distance_stats.index):
+            print(f"\n📍 TRIP DISTANCE INSIGHTS:")
+            for user_type, label in [('casual', 'Casual riders'), ('member', 'Members')]:
+                print(f"   • {label} - Average distance: {distance_stats.loc[user_type, 'mean_km']:.2f} km "
+                      f"at {distance_stats.loc[user_type, 'mean_speed_kmh']:.1f} km/h")
+        
         print(f"\n💡 KEY BUSINESS INSIGHTS:")
         print(f"   • Casual riders prefer recreational, longer rides")
         print(f"   • Members use bikes for functional, shorter commutes")
@@ -13,8 +13,201 @@ import numpy as np
 from pathlib import Path
 import requests
 import zipfile
+import hashlib
 import os
 
+CACHE_PREFIX = "trips_"
+STATIONS_CACHE_PREFIX = "stations_"
+
+# Synthetic data settings
+SAMPLE_START = pd.Timestamp('2019-01-01')
+SAMPLE_END = pd.Timestamp('2020-03-31')
+MEMBER_SHARE = 0.75
+MEMBER_COMMUTE_HOURS = np.array([7, 8, 17, 18])
+MEMBER_COMMUTE_PROBS = np.array([0.3, 0.3, 0.25, 0.15])
+SAMPLE_STATION_IDS = np.arange(1, 101)
+# 20 popular stations share the rides; the remaining probability is divided among the others
+SAMPLE_STATION_PROBS = np.r_[np.full(20, 0.05), np.full(80, (1.0 - 0.05 * 20) / 80)]
+SAMPLE_STATION_NAMES = [f'Station_{station_id}' for station_id in SAMPLE_STATION_IDS]
+NS_PER_MINUTE = 60 * 10**9
+NS_PER_HOUR = 60 * NS_PER_MINUTE
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+
+def find_trip_files(source):
+    """
+    Resolve a glob pattern, directory or list of paths to trip CSV files.
+    
+    Args:
+        source (str or list): Glob pattern, directory, single file or list of paths
+        
+    Returns:
+        list: Sorted list of matching file paths
+    """
+    if isinstance(source, (list, tuple)):
+        return [Path(path) for path in source]
+    
+    source = Path(source)
+    if source.is_dir():
+        return sorted(source.glob('*.csv'))
+    if source.exists():
+        return [source]
+    
+    # Treat anything else as a glob pattern relative to its anchor
+    anchor = Path(source.anchor) if source.is_absolute() else Path('.')
+    pattern = str(source.relative_to(anchor)) if source.is_absolute() else str(source)
+    return sorted(anchor.glob(pattern))
+
+
+def trip_file_root(source):
+    """
+    Find the directory that the trip files of a source are located under.
+    
+    Args:
+        source (str or list): Glob pattern, directory, single file or list of paths
+        
+    Returns:
+        Path: The directory itself, the parent of a single file, the leading
+        directories of a glob pattern without wildcards, or the common
+        parent of a list of paths
+    """
+    if isinstance(source, (list, tuple)):
+        parents = [str(Path(path).resolve().parent) for path in source]
+        return Path(os.path.commonpath(parents)) if parents else Path('.')
+    
+    source = Path(source)
+    if source.is_dir():
+        return source
+    fixed = []
+    for part in source.parts:
+        if any(char in part for char in '*?['):
+            return Path(*fixed) if fixed else Path('.')
+        fixed.append(part)
+    return source.parent
+
+
+def file_digest(path):
+    """
+    Hash the content of a file.
+    
+    Args:
+        path (str): Path to the file
+        
+    Returns:
+        bytes: SHA-256 digest of the file content
+    """
+    content = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            content.update(block)
+    return content.digest()
+
+
+def _generate_chunk(rng, positions, n_samples):
+    """
+    Generate synthetic trips for a range of record positions.
+    
+    Args:
+        rng (Generator): Random generator for this chunk
+        positions (ndarray): Record positions in the full dataset
+        n_samples (int): Size of the full dataset
+        
+    Returns:
+        DataFrame: Synthetic trips in the 2020 Divvy format
+    """
+    n = len(positions)
+    
+    # Spread trip dates evenly across the sample period
+    span = (SAMPLE_END - SAMPLE_START).value
+    step = span / max(n_samples - 1, 1)
+    dates = SAMPLE_START.value + np.round(positions * step).astype(np.int64)
+    days = dates // NS_PER_DAY
+    day_of_week = (days + 3) % 7  # 1970-01-01 was a Thursday
+    weekend = day_of_week >= 5
+    
+    is_member = rng.random(n) < MEMBER_SHARE
+    
+    # Members: weekday commute peaks, any hour on weekends.
+    # Casual: daytime rides on weekends, any hour on weekdays.
+    commute_hour = rng.choice(MEMBER_COMMUTE_HOURS, n, p=MEMBER_COMMUTE_PROBS)
+    any_hour = rng.integers(0, 24, n)
+    leisure_hour = rng.integers(10, 20, n)
+    hour = np.where(is_member,
+                    np.where(weekend, any_hour, commute_hour),
+                    np.where(weekend, leisure_hour, any_hour))
+    
+    started = days * NS_PER_DAY + hour * NS_PER_HOUR + rng.integers(0, NS_PER_HOUR, n)
+    
+    # Members take shorter rides than casual users
+    ride_length = np.where(is_member, rng.normal(12, 5, n), rng.normal(36, 15, n))
+    ride_length = np.maximum(1, ride_length)
+    ended = started + np.round(ride_length * NS_PER_MINUTE).astype(np.int64)
+    
+    station_codes = rng.choice(len(SAMPLE_STATION_IDS), (2, n), p=SAMPLE_STATION_PROBS)
+    start_station_ids = SAMPLE_STATION_IDS[station_codes[0]]
+    end_station_ids = SAMPLE_STATION_IDS[station_codes[1]]
+    
+    return pd.DataFrame({
+        'ride_id': np.char.add('sample_', np.char.zfill(positions.astype(str), 6)),
+        'rideable_type': pd.Categorical.from_codes((rng.random(n) >= 0.6).astype(np.int8),
+                                                   ['electric_bike', 'classic_bike']),
+        'started_at': started.view('datetime64[ns]'),
+        'ended_at': ended.view('datetime64[ns]'),
+        'start_station_name': pd.Categorical.from_codes(station_codes[0], SAMPLE_STATION_NAMES),
+        'start_station_id': start_station_ids,
+        'end_station_name': pd.Categorical.from_codes(station_codes[1], SAMPLE_STATION_NAMES),
+        'end_station_id': end_station_ids,
+        'start_lat': rng.uniform(41.8, 42.0, n),  # Chicago lat range
+        'start_lng': rng.uniform(-87.8, -87.5, n),  # Chicago lng range
+        'end_lat': rng.uniform(41.8, 42.0, n),
+        'end_lng': rng.uniform(-87.8, -87.5, n),
+        'member_casual': pd.Categorical.from_codes(is_member.astype(np.int8), ['casual', 'member'])
+    })
+
+
+def generate_trip_chunks(n_samples, seed=42, chunk_size=1_000_000, partition=0, n_partitions=1):
+    """
+    Generate synthetic trips in chunks.
+    
+    Every chunk draws from its own independent random substream derived
+    from ``seed`` and the chunk index, so the output does not depend on
+    how chunks are split between partitions or worker processes.
+    
+    Args:
+        n_samples (int): Total number of records in the dataset
+        seed (int): Seed for the random generator
+        chunk_size (int): Number of records per chunk
+        partition (int): Index of the partition to generate
+        n_partitions (int): Number of contiguous partitions the chunks are split into
+        
+    Yields:
+        DataFrame: Consecutive chunks of synthetic trips
+    """
+    n_chunks = max(1, -(-n_samples // chunk_size))
+    first_chunk = partition * n_chunks // n_partitions
+    last_chunk = (partition + 1) * n_chunks // n_partitions
+    
+    for chunk_index in range(first_chunk, last_chunk):
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk_index,)))
+        positions = np.arange(chunk_index * chunk_size, min(n_samples, (chunk_index + 1) * chunk_size))
+        yield _generate_chunk(rng, positions, n_samples)
+
+
+def generate_trips(n_samples, seed=42, chunk_size=1_000_000):
+    """
+    Generate a synthetic trip dataset with realistic usage patterns.
+    
+    Args:
+        n_samples (int): Number of records to create
+        seed (int): Seed for the random generator
+        chunk_size (int): Number of records generated at a time
+        
+    Returns:
+        DataFrame: Synthetic trips in the 2020 Divvy format
+    """
+    chunks = list(generate_trip_chunks(n_samples, seed=seed, chunk_size=chunk_size))
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
 class DataManager:
     """
     Data management class for Cyclistic bike-share data.
@@ -36,89 +229,17 @@ class DataManager:
         for dir_path in [self.data_dir, self.raw_dir, self.processed_dir, self.sample_dir]:
             dir_path.mkdir(exist_ok=True, parents=True)
     
-    def create_sample_data(self, n_samples=10000):
+    def create_sample_data(self, n_samples=10000, seed=42):
         """
         Create sample data for demonstration purposes.
         
         Args:
             n_samples (int): Number of sample records to create
+            seed (int): Seed for the random generator
         """
-        np.random.seed(42)
-        
         print(f"Creating sample data with {n_samples:,} records...")
         
-        # Create realistic sample data
-        start_dates = pd.date_range('2019-01-01', '2020-03-31', periods=n_samples)
-        
-        # Create member_casual with realistic distribution (75% members, 25% casual)
-        member_casual = np.random.choice(['member', 'casual'], n_samples, p=[0.75, 0.25])
-        
-        # Create ride_length with different patterns for members vs casual
-        ride_length = []
-        day_of_week = []
-        start_hour = []
-        
-        for i, (date, mc) in enumerate(zip(start_dates, member_casual)):
-            # Extract day of week and hour for realistic patterns
-            dow = date.dayofweek
-            day_of_week.append(dow)
-            
-            if mc == 'member':
-                # Members: more rides on weekdays, peak hours 7-9am and 5-7pm
-                if dow < 5:  # Weekday
-                    hour = np.random.choice([7, 8, 17, 18], p=[0.3, 0.3, 0.25, 0.15])
-                else:  # Weekend
-                    hour = np.random.choice(range(24))
-                # Shorter rides for members
-                length = np.random.normal(12, 5)
-            else:
-                # Casual: more rides on weekends, more evenly distributed hours
-                if dow >= 5:  # Weekend
-                    hour = np.random.choice(range(10, 20))
-                else:  # Weekday
-                    hour = np.random.choice(range(24))
-                # Longer rides for casual users
-                length = np.random.normal(36, 15)
-            
-            start_hour.append(hour)
-            ride_length.append(max(1, length))  # Ensure positive values
-        
-        # Create station IDs with some popular stations
-        popular_stations = list(range(1, 21))  # 20 popular stations
-        other_stations = list(range(21, 101))  # 80 other stations
-        
-        # Create probability distribution that sums to 1
-        popular_prob = 0.05
-        other_prob = (1.0 - popular_prob * 20) / 80  # Remaining probability divided among other stations
-        
-        start_station_ids = np.random.choice(
-            popular_stations + other_stations, 
-            n_samples, 
-            p=[popular_prob] * 20 + [other_prob] * 80  # Popular stations get more rides
-        )
-        
-        end_station_ids = np.random.choice(
-            popular_stations + other_stations, 
-            n_samples, 
-            p=[popular_prob] * 20 + [other_prob] * 80
-        )
-        
-        # Create the sample dataset
-        sample_data = pd.DataFrame({
-            'ride_id': [f'sample_{i:06d}' for i in range(n_samples)],
-            'rideable_type': np.random.choice(['electric_bike', 'classic_bike'], n_samples, p=[0.6, 0.4]),
-            'started_at': start_dates,
-            'ended_at': start_dates + pd.to_timedelta(ride_length, unit='minutes'),
-            'start_station_name': [f'Station_{id}' for id in start_station_ids],
-            'start_station_id': start_station_ids,
-            'end_station_name': [f'Station_{id}' for id in end_station_ids],
-            'end_station_id': end_station_ids,
-            'start_lat': np.random.uniform(41.8, 42.0, n_samples),  # Chicago lat range
-            'start_lng': np.random.uniform(-87.8, -87.5, n_samples),  # Chicago lng range
-            'end_lat': np.random.uniform(41.8, 42.0, n_samples),
-            'end_lng': np.random.uniform(-87.8, -87.5, n_samples),
-            'member_casual': member_casual
-        })
+        sample_data = generate_trips(n_samples, seed=seed)
         
         # Save sample data
         sample_2019 = sample_data[sample_data['started_at'].dt.year == 2019]
@@ -134,6 +255,38 @@ class DataManager:
         
         return sample_2019, sample_2020
     
+    def write_sample_partition(self, path, n_samples, partition=0, n_partitions=1,
+                               seed=42, chunk_size=1_000_000):
+        """
+        Stream one partition of a synthetic dataset to a CSV file.
+        
+        Each worker process can write its own partition; together the
+        partitions contain exactly the rows of a single-process run with the
+        same ``n_samples``, ``seed`` and ``chunk_size``.
+        
+        Args:
+            path (str): Output CSV path
+            n_samples (int): Total number of records across all partitions
+            partition (int): Index of the partition to write
+            n_partitions (int): Total number of partitions
+            seed (int): Seed for the random generator
+            chunk_size (int): Number of records generated and written at a time
+            
+        Returns:
+            int: Number of records written
+        """
+        path = Path(path)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        
+        written = 0
+        for chunk in generate_trip_chunks(n_samples, seed=seed, chunk_size=chunk_size,
+                                          partition=partition, n_partitions=n_partitions):
+            chunk.to_csv(path, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+            written += len(chunk)
+        
+        print(f"Partition {partition + 1}/{n_partitions}: {written:,} records saved to {path}")
+        return written
+    
     def validate_data(self, df, year=None):
         """
         Validate data quality and structure.
@@ -305,6 +458,108 @@ The data is made available under the [Divvy Data License Agreement](https://ride
         
         print(f"Data README created at {readme_path}")
     
+    def get_cache_key(self, file_paths, pipeline_version):
+        """
+        Build a cache key for the cleaned data derived from some source files.
+        
+        The key changes whenever a source file's size, modification time or
+        content changes, or when the preparation pipeline version is bumped.
+        
+        Args:
+            file_paths (list): Paths to the source CSV files
+            pipeline_version (str): Version of the preparation pipeline
+            
+        Returns:
+            str: Hexadecimal cache key
+        """
+        key = hashlib.sha256(f"pipeline={pipeline_version}".encode())
+        
+        for path in file_paths:
+            path = Path(path)
+            stat = path.stat()
+            key.update(f"|{path.name}|{stat.st_size}|{stat.st_mtime_ns}|".encode())
+            key.update(file_digest(path))
+        
+        return key.hexdigest()[:16]
+    
+    def _cache_files(self, cache_key='*', prefix=None):
+        """List cached files in the processed directory (all tables by default)."""
+        prefixes = [prefix] if prefix else [CACHE_PREFIX, STATIONS_CACHE_PREFIX]
+        return sorted(path for prefix in prefixes
+                      for path in self.processed_dir.glob(f"{prefix}{cache_key}.*"))
+    
+    def load_cached_data(self, cache_key, prefix=CACHE_PREFIX):
+        """
+        Load cleaned trips from the processed-data cache.
+        
+        Args:
+            cache_key (str): Key returned by ``get_cache_key``
+            prefix (str): Table to load (``STATIONS_CACHE_PREFIX`` for the
+                station dimension)
+            
+        Returns:
+            DataFrame: Cached trips, or None if there is no usable cache entry
+        """
+        for path in self._cache_files(cache_key, prefix):
+            try:
+                if path.suffix == '.parquet':
+                    df = pd.read_parquet(path)
+                else:
+                    df = pd.read_pickle(path)
+            except Exception as e:
+                print(f"Ignoring unreadable cache file {path}: {e}")
+                continue
+            
+            print(f"Loaded cleaned data from cache: {path}")
+            return df
+        
+        return None
+    
+    def save_cached_data(self, df, cache_key, prefix=CACHE_PREFIX):
+        """
+        Save cleaned trips to the processed-data cache.
+        
+        Parquet is used when a Parquet engine (pyarrow or fastparquet) is
+        installed; otherwise the frame is pickled. Entries for other keys are
+        removed so the cache holds only the current dataset; saving the trips
+        also removes the station dimension, which is saved after them.
+        
+        Args:
+            df (DataFrame): Cleaned, standardized trips
+            cache_key (str): Key returned by ``get_cache_key``
+            prefix (str): Table to save (``STATIONS_CACHE_PREFIX`` for the
+                station dimension)
+            
+        Returns:
+            Path: Path of the written cache file
+        """
+        for path in self._cache_files(prefix=None if prefix == CACHE_PREFIX else prefix):
+            path.unlink()
+        
+        path = self.processed_dir / f"{prefix}{cache_key}.parquet"
+        try:
+            df.to_parquet(path, index=False)
+        except (ImportError, ValueError):
+            # No Parquet engine installed, or a column Parquet cannot store
+            path.unlink(missing_ok=True)
+            path = path.with_suffix('.pkl')
+            df.to_pickle(path)
+        
+        print(f"Cleaned data cached to: {path}")
+        return path
+    
+    def clear_cache(self):
+        """
+        Remove all cached trip and station files from the processed directory.
+        
+        Returns:
+            int: Number of files removed
+        """
+        cache_files = self._cache_files()
+        for path in cache_files:
+            path.unlink()
+        return len(cache_files)
+    
     def get_file_paths(self, use_sample=False):
         """
         Get paths to data files.
@@ -0,0 +1,139 @@
+"""
+Shared-Memory Frame Transport
+============================
+
+This module moves prepared DataFrames from worker processes back to the
+parent through POSIX shared memory instead of pickling every column, so the
+only full copy of the data is the final concatenation.
+
+Only fixed-width columns (numbers, booleans, timestamps and categorical
+codes) travel through shared memory. Object and string columns such as
+``ride_id`` and the station names are still pickled, so convert them to
+categoricals first if their transfer matters.
+
+Author: Muhammad Baihaqi
+License: MIT
+"""
+
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory, resource_tracker
+
+
+def _numeric_view(values):
+    """Return a column's values as a plain NumPy array, or None if it must be pickled."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(values) and getattr(values.dt, 'tz', None) is None:
+        return values.to_numpy()
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biuf':
+        return values.to_numpy()
+    return None
+
+
+def share_frame(df):
+    """
+    Copy the fixed-width columns of a DataFrame into shared memory blocks.
+    
+    Runs in the worker process. The blocks are detached from the worker's
+    resource tracker so they outlive the worker; the parent releases them
+    in ``collect_shared_frames``.
+    
+    Args:
+        df (DataFrame): Frame to share
+    
+    Returns:
+        dict: Picklable payload describing the shared frame
+    """
+    columns = []
+    blocks = {}
+    pickled = {}
+    
+    payload = {'length': len(df), 'columns': columns, 'blocks': blocks, 'pickled': pickled}
+    try:
+        for col in df.columns:
+            values = df[col]
+            array = _numeric_view(values)
+            if array is None or array.nbytes == 0:
+                pickled[col] = values.reset_index(drop=True)
+                columns.append((col, 'pickled'))
+                continue
+            
+            block = shared_memory.SharedMemory(create=True, size=array.nbytes)
+            categories = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else None
+            blocks[col] = (block.name, array.dtype.str, categories)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            resource_tracker.unregister(block._name, 'shared_memory')
+            block.close()
+            columns.append((col, 'shared'))
+    except BaseException:
+        # Blocks are untracked, so nothing else would free them
+        release_shared_frame(payload)
+        raise
+    
+    return payload
+
+
+def _attach(payload, handles):
+    """Build a DataFrame whose fixed-width columns are views on shared memory."""
+    data = {}
+    for col, kind in payload['columns']:
+        if kind == 'pickled':
+            data[col] = payload['pickled'][col]
+            continue
+        
+        name, dtype, categories = payload['blocks'][col]
+        block = shared_memory.SharedMemory(name=name)
+        handles.append(block)
+        array = np.ndarray(payload['length'], dtype=np.dtype(dtype), buffer=block.buf)
+        if categories is not None:
+            data[col] = pd.Categorical.from_codes(array, categories)
+        else:
+            data[col] = array
+    
+    return pd.DataFrame(data, copy=False)
+
+
+def release_shared_frame(payload):
+    """
+    Free the shared memory blocks of a payload without reading them.
+    
+    Args:
+        payload (dict): Payload returned by ``share_frame``
+    """
+    for name, _, _ in payload['blocks'].values():
+        try:
+            block = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        block.close()
+        block.unlink()
+
+
+def collect_shared_frames(payloads):
+    """
+    Concatenate shared frames into one DataFrame and free the shared memory.
+    
+    Args:
+        payloads (list): Payloads returned by ``share_frame``, in order
+    
+    Returns:
+        DataFrame: Concatenated frame owning its own memory
+    """
+    handles = []
+    try:
+        parts = [_attach(payload, handles) for payload in payloads]
+        combined = pd.concat(parts, ignore_index=True)
+        if len(parts) == 1:
+            combined = combined.copy(deep=True)
+        del parts
+    finally:
+        for block in handles:
+            try:
+                block.close()
+            except BufferError:
+                # A view is still alive; the mapping is dropped once it is collected
+                pass
+            block.unlink()
+    
+    return combined
@@ -0,0 +1,177 @@
+"""
+Duration Quantile Sketches for Cyclistic Analysis
+===============================================
+
+This module provides a mergeable sketch of the ride duration distribution
+so that medians, percentiles and box plot statistics can be reported for
+data processed in chunks or in separate worker processes.
+
+Author: Muhammad Baihaqi
+License: MIT
+"""
+
+import numpy as np
+
+# Cleaned rides last between 1 minute and 24 hours
+DEFAULT_BIN_WIDTH = 0.1
+DEFAULT_MAX_DURATION = 1440.0
+
+
+class DurationSketch:
+    """
+    Fixed-width histogram of ride durations per user type.
+    
+    Durations are counted in bins of ``bin_width`` minutes covering
+    ``[0, max_duration)``. Two sketches with the same binning merge by
+    adding their counts, so the result does not depend on how the trips
+    were split into chunks or in which order they were folded in.
+    
+    Error bounds: a quantile is estimated from the midpoints of the bins
+    holding the order statistics it interpolates between, so for
+    durations inside the covered range the estimate is within
+    ``bin_width / 2`` minutes (3 seconds by default) of the exact,
+    linearly interpolated quantile. Durations outside the range are
+    counted in the first or last bin and carry no such bound.
+    """
+    
+    def __init__(self, n_groups, bin_width=DEFAULT_BIN_WIDTH, max_duration=DEFAULT_MAX_DURATION):
+        """
+        Initialize an empty sketch.
+        
+        Args:
+            n_groups (int): Number of user types tracked
+            bin_width (float): Bin width in minutes
+            max_duration (float): Upper edge of the covered range in minutes
+        """
+        self.bin_width = bin_width
+        self.max_duration = max_duration
+        self.n_bins = int(np.ceil(max_duration / bin_width))
+        self.counts = np.zeros((n_groups, self.n_bins), dtype=np.int64)
+    
+    @property
+    def bin_edges(self):
+        """ndarray: Bin edges in minutes."""
+        return np.arange(self.n_bins + 1) * self.bin_width
+    
+    def update(self, groups, durations):
+        """
+        Count durations into the sketch.
+        
+        Args:
+            groups (ndarray): Group code per ride (0 to ``n_groups - 1``)
+            durations (ndarray): Ride durations in minutes
+        
+        Returns:
+            DurationSketch: self, to allow chaining
+        """
+        finite = np.isfinite(durations)
+        groups, durations = groups[finite], durations[finite]
+        bins = np.clip(np.floor(durations / self.bin_width), 0, self.n_bins - 1).astype(np.int64)
+        key = groups * self.n_bins + bins
+        self.counts += np.bincount(key, minlength=self.counts.size).reshape(self.counts.shape)
+        return self
+    
+    def merge(self, other):
+        """
+        Merge another sketch into this one.
+        
+        Args:
+            other (DurationSketch): Sketch with the same binning
+        
+        Returns:
+            DurationSketch: self, to allow chaining
+        """
+        if other.counts.shape != self.counts.shape or other.bin_width != self.bin_width:
+            raise ValueError("Cannot merge duration sketches with different binning")
+        self.counts += other.counts
+        return self
+    
+    @property
+    def midpoints(self):
+        """ndarray: Bin midpoints in minutes."""
+        return (np.arange(self.n_bins) + 0.5) * self.bin_width
+    
+    def _order_statistics(self, ranks):
+        """Bin midpoints holding the given 0-based order statistics, per group."""
+        cumulative = np.cumsum(self.counts, axis=1)
+        bins = (cumulative[:, :, None] <= ranks[:, None, :]).sum(axis=1)
+        return self.midpoints[np.minimum(bins, self.n_bins - 1)]
+    
+    def quantiles(self, q):
+        """
+        Estimate quantiles of each group's durations.
+        
+        All groups are estimated together in one vectorized pass.
+        
+        Args:
+            q (list): Quantiles between 0 and 1
+        
+        Returns:
+            ndarray: (n_groups, len(q)) estimates, NaN for empty groups
+        """
+        q = np.asarray(q, dtype=np.float64)
+        n = self.counts.sum(axis=1)
+        # Same linear interpolation between order statistics as pandas
+        rank = np.maximum(n[:, None] - 1, 0) * q[None, :]
+        lower = self._order_statistics(np.floor(rank))
+        upper = self._order_statistics(np.ceil(rank))
+        estimates = lower + (upper - lower) * (rank - np.floor(rank))
+        estimates[n == 0] = np.nan
+        return estimates
+    
+    def box_stats(self, whis=1.5):
+        """
+        Five-number box plot statistics of each group's durations.
+        
+        Whiskers follow the Tukey convention used by matplotlib: they end at
+        the most extreme bin within ``whis`` interquartile ranges of the
+        quartiles, and the bins beyond them are reported as fliers.
+        
+        Args:
+            whis (float): Whisker reach in interquartile ranges
+        
+        Returns:
+            dict: ``q1``, ``med``, ``q3``, ``whislo`` and ``whishi`` arrays
+            (NaN for empty groups) and ``fliers``, a list holding the
+            midpoints of the occupied bins outside the whiskers per group
+        """
+        q1, med, q3 = self.quantiles([0.25, 0.5, 0.75]).T
+        iqr = q3 - q1
+        midpoints = self.midpoints[None, :]
+        occupied = self.counts > 0
+        
+        with np.errstate(invalid='ignore'):
+            inside = occupied & (midpoints >= (q1 - whis * iqr)[:, None]) & (midpoints <= (q3 + whis * iqr)[:, None])
+        whislo = np.where(inside, midpoints, np.inf).min(axis=1)
+        whishi = np.where(inside, midpoints, -np.inf).max(axis=1)
+        empty = ~inside.any(axis=1)
+        whislo[empty] = np.nan
+        whishi[empty] = np.nan
+        
+        fliers = [self.midpoints[group_occupied & ~group_inside]
+                  for group_occupied, group_inside in zip(occupied, inside)]
+        return {'q1': q1, 'med': med, 'q3': q3, 'whislo': whislo, 'whishi': whishi, 'fliers': fliers}
+    
+    def histogram(self, bins, range):
+        """
+        Re-bin the sketch into a coarser equal-width histogram.
+        
+        Each sketch bin is assigned to the output bin holding its midpoint,
+        so output edges are accurate to within one sketch bin.
+        
+        Args:
+            bins (int): Number of output bins
+            range (tuple): (lower, upper) edges of the output bins in minutes
+        
+        Returns:
+            tuple: (edges, counts) where counts has shape (n_groups, bins)
+        """
+        edges = np.linspace(range[0], range[1], bins + 1)
+        target = np.clip(np.searchsorted(edges, self.midpoints, side='right') - 1, 0, bins - 1)
+        within = (self.midpoints >= edges[0]) & (self.midpoints <= edges[-1])
+        
+        n_groups = self.counts.shape[0]
+        key = (np.arange(n_groups)[:, None] * bins + target[None, :])[:, within]
+        counts = np.bincount(key.ravel(), weights=self.counts[:, within].ravel(),
+                             minlength=n_groups * bins).reshape(n_groups, bins)
+        return edges, counts.astype(np.int64)
@@ -0,0 +1,258 @@
+"""
+SQLite Trip Store for Cyclistic Analysis
+=======================================
+
+This module keeps the cleaned trips in a local SQLite database instead of a
+DataFrame, so the data can be queried ad hoc without holding it in memory
+and the analyses can push their aggregations down as SQL.
+
+Author: Muhammad Baihaqi
+License: MIT
+"""
+
+import sqlite3
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+try:
+    from .aggregates import TripAggregates, USER_TYPES, CUBE_SHAPE
+    from .sketches import DEFAULT_BIN_WIDTH, DEFAULT_MAX_DURATION
+except ImportError:  # Imported as a top-level module with src/ on sys.path
+    from aggregates import TripAggregates, USER_TYPES, CUBE_SHAPE
+    from sketches import DEFAULT_BIN_WIDTH, DEFAULT_MAX_DURATION
+
+# Stored trip columns and their SQLite types
+TRIP_COLUMNS = {
+    'ride_id': 'TEXT',
+    'started_at': 'TEXT',
+    'ended_at': 'TEXT',
+    'member_casual': 'TEXT',
+    'ride_length': 'REAL',
+    'day_of_week': 'INTEGER',
+    'start_hour': 'INTEGER',
+    'month': 'INTEGER',
+    # Divvy station ids are strings such as 'TA1307000039' since 2021
+    'start_station_id': 'TEXT',
+    'end_station_id': 'TEXT'
+}
+
+# Created after the bulk load, which is much faster than maintaining them row by row
+TRIP_INDEXES = {
+    'idx_trips_started_at': ['started_at'],
+    # ride_length is included so medians are read in order from the index
+    'idx_trips_member_casual': ['member_casual', 'ride_length'],
+    'idx_trips_start_station': ['start_station_id'],
+    'idx_trips_end_station': ['end_station_id']
+}
+
+# Timestamps are stored as sortable text so ad-hoc queries can compare them directly
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class SQLiteTripStore:
+    """
+    Cleaned trips in an indexed SQLite table.
+    
+    The database runs in write-ahead-log mode, so reports can read it while
+    it is being loaded.
+    """
+    
+    def __init__(self, path):
+        """
+        Open or create a trip database.
+        
+        Args:
+            path (str): Path of the database file
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.revision = 0
+    
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+    
+    def __len__(self):
+        if not self._has_table():
+            return 0
+        return self.connection.execute('SELECT COUNT(*) FROM trips').fetchone()[0]
+    
+    def _has_table(self):
+        """Check whether the trip table exists."""
+        return self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trips'").fetchone() is not None
+    
+    def query(self, sql, params=()):
+        """
+        Run an ad-hoc query against the trip table.
+        
+        Args:
+            sql (str): SQL statement, e.g. ``SELECT ... FROM trips WHERE ...``
+            params (tuple): Query parameters
+        
+        Returns:
+            DataFrame: Query result
+        """
+        return pd.read_sql_query(sql, self.connection, params=params)
+    
+    def load(self, df, batch_size=100_000):
+        """
+        Replace the stored trips with a prepared DataFrame.
+        
+        Rows are inserted with ``executemany`` in batches inside a single
+        transaction, and the indexes are built once the table is filled.
+        
+        Args:
+            df (DataFrame): Prepared trips with ``ride_length``, ``started_at``
+                and the ``day_of_week``, ``start_hour`` and ``month`` columns
+            batch_size (int): Rows per ``executemany`` call
+        
+        Returns:
+            int: Number of rows stored
+        """
+        columns = [col for col in TRIP_COLUMNS if col in df.columns]
+        schema = ', '.join(f'{col} {TRIP_COLUMNS[col]}' for col in columns)
+        insert = f"INSERT INTO trips ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        
+        with self.connection:
+            for name in TRIP_INDEXES:
+                self.connection.execute(f'DROP INDEX IF EXISTS {name}')
+            self.connection.execute('DROP TABLE IF EXISTS trips')
+            self.connection.execute(f'CREATE TABLE trips ({schema})')
+            
+            for start in range(0, len(df), batch_size):
+                batch = df.iloc[start:start + batch_size]
+                values = [self._column_values(batch[col]) for col in columns]
+                self.connection.executemany(insert, zip(*values))
+            
+            for name, index_columns in TRIP_INDEXES.items():
+                if set(index_columns) <= set(columns):
+                    self.connection.execute(f"CREATE INDEX {name} ON trips ({', '.join(index_columns)})")
+        
+        self.connection.execute('ANALYZE')
+        self.revision += 1
+        return len(df)
+    
+    @staticmethod
+    def _column_values(values):
+        """Convert a column to Python objects that sqlite3 can bind, with None for missing."""
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime(TIMESTAMP_FORMAT)
+        elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            if TRIP_COLUMNS[values.name] == 'TEXT' and pd.api.types.is_unsigned_integer_dtype(values):
+                # Hashed ride ids do not fit SQLite's signed 64-bit integers
+                return values.astype(str).tolist()
+            array = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            missing = np.isnan(array)
+            with np.errstate(invalid='ignore'):
+                # Whole-number ids bind as integers, so a TEXT column stores '5' rather than '5.0'
+                python = (array if TRIP_COLUMNS[values.name] == 'REAL' else array.astype(np.int64)).tolist()
+            if missing.any():
+                python = [None if gap else value for value, gap in zip(python, missing)]
+            return python
+        return values.astype(object).where(values.notna(), None).tolist()
+    
+    def user_moments(self):
+        """
+        Per-user-type duration moments computed in SQL.
+        
+        The sum of squared deviations is taken around each user type's mean
+        in a second pass rather than from a sum of squares.
+        
+        Returns:
+            DataFrame: count, mean, m2, min and max indexed by user type
+        """
+        return self.query("""
+            SELECT t.member_casual, COUNT(*) AS count, m.mean,
+                   SUM((t.ride_length - m.mean) * (t.ride_length - m.mean)) AS m2,
+                   MIN(t.ride_length) AS min, MAX(t.ride_length) AS max
+            FROM trips AS t
+            JOIN (SELECT member_casual, AVG(ride_length) AS mean
+                  FROM trips GROUP BY member_casual) AS m USING (member_casual)
+            GROUP BY t.member_casual
+        """).set_index('member_casual')
+    
+    def duration_medians(self):
+        """
+        Exact median ride length per user type.
+        
+        Each median walks the ``member_casual, ride_length`` index to the
+        middle offset instead of sorting the trips.
+        
+        Returns:
+            Series: Median ride length indexed by user type
+        """
+        medians = {}
+        counts = self.query('SELECT member_casual, COUNT(*) AS n FROM trips GROUP BY member_casual')
+        for user_type, n in zip(counts['member_casual'], counts['n'].tolist()):
+            rows = self.connection.execute(
+                'SELECT ride_length FROM trips WHERE member_casual = ? '
+                'ORDER BY ride_length LIMIT ? OFFSET ?',
+                (user_type, 2 - n % 2, (n - 1) // 2)).fetchall()
+            medians[user_type] = float(np.mean([row[0] for row in rows]))
+        return pd.Series(medians, name='ride_length')
+    
+    def aggregates(self, bin_width=DEFAULT_BIN_WIDTH, max_duration=DEFAULT_MAX_DURATION):
+        """
+        Build the aggregate cube with grouped SQL queries.
+        
+        Counts and duration moments per cube cell, the per-user-type moments
+        and the duration sketch are all aggregated inside SQLite, so only a
+        few thousand rows are read back.
+        
+        Args:
+            bin_width (float): Duration sketch bin width in minutes
+            max_duration (float): Upper edge of the sketch range in minutes
+        
+        Returns:
+            TripAggregates: Aggregates over every stored trip
+        """
+        user_case = ' '.join(f"WHEN '{user_type}' THEN {code}" for code, user_type in enumerate(USER_TYPES))
+        user_code = f'CASE member_casual {user_case} END'
+        
+        cells = self.connection.execute(f"""
+            SELECT {user_code} AS user, day_of_week, start_hour, month - 1,
+                   COUNT(*), SUM(ride_length), SUM(ride_length * ride_length)
+            FROM trips WHERE user IS NOT NULL
+            GROUP BY user, day_of_week, start_hour, month
+        """).fetchall()
+        
+        count = np.zeros(CUBE_SHAPE, dtype=np.int64)
+        total = np.zeros(CUBE_SHAPE)
+        total_sq = np.zeros(CUBE_SHAPE)
+        if cells:
+            cells = np.array(cells, dtype=np.float64)
+            index = tuple(cells[:, :4].astype(np.int64).T)
+            count[index] = cells[:, 4].astype(np.int64)
+            total[index] = cells[:, 5]
+            total_sq[index] = cells[:, 6]
+        
+        n_bins = int(np.ceil(max_duration / bin_width))
+        durations = np.zeros((len(USER_TYPES), n_bins), dtype=np.int64)
+        sketch_rows = self.connection.execute(f"""
+            SELECT {user_code} AS user,
+                   MIN(MAX(CAST(ride_length / ? AS INTEGER), 0), ?) AS bin, COUNT(*)
+            FROM trips WHERE user IS NOT NULL AND ride_length IS NOT NULL
+            GROUP BY user, bin
+        """, (bin_width, n_bins - 1)).fetchall()
+        for user, bin_index, n in sketch_rows:
+            durations[user, bin_index] = n
+        
+        moments = self.user_moments().reindex(USER_TYPES)
+        first, last = self.connection.execute('SELECT MIN(started_at), MAX(started_at) FROM trips').fetchone()
+        
+        return TripAggregates.from_arrays({
+            'count': count, 'sum': total, 'sumsq': total_sq,
+            'min': moments['min'].fillna(np.inf).to_numpy(),
+            'max': moments['max'].fillna(-np.inf).to_numpy(),
+            'mean': moments['mean'].fillna(0.0).to_numpy(),
+            'm2': moments['m2'].fillna(0.0).to_numpy(),
+            'durations': durations,
+            'bin_width': bin_width,
+            'max_duration': max_duration,
+            'date_range': [first or '', last or '']
+        })
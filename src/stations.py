@@ -0,0 +1,454 @@
+"""
+Station Flow Analytics for Cyclistic Analysis
+===========================================
+
+This module builds sparse origin-destination matrices of station-to-station
+trips so that route and station volume questions are answered with sparse
+matrix operations instead of grouping millions of trips, and derives trip
+distances from station and trip coordinates.
+
+Author: Muhammad Baihaqi
+License: MIT
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+try:
+    from .aggregates import USER_TYPES
+except ImportError:  # Imported as a top-level module with src/ on sys.path
+    from aggregates import USER_TYPES
+
+# Mean Earth radius used for great-circle distances
+EARTH_RADIUS_KM = 6371.0088
+
+# Trip splits supported by StationFlows: column -> group labels
+FLOW_SPLITS = {
+    'member_casual': USER_TYPES,
+    'start_hour': list(range(24))
+}
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance between coordinate arrays.
+    
+    Args:
+        lat1 (ndarray): Start latitudes in degrees
+        lng1 (ndarray): Start longitudes in degrees
+        lat2 (ndarray): End latitudes in degrees
+        lng2 (ndarray): End longitudes in degrees
+        
+    Returns:
+        ndarray: Distances in kilometres (NaN where a coordinate is missing)
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(values, dtype=np.float64))
+                              for values in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def station_coordinates(df):
+    """
+    Build a station coordinate lookup table from trips that carry coordinates.
+    
+    Each station is placed at the median of every start and end coordinate
+    recorded for it, which smooths out GPS noise on dockless trips.
+    
+    Args:
+        df (DataFrame): Trips with station ids and, for some rows,
+            ``start_lat``/``start_lng``/``end_lat``/``end_lng``
+            
+    Returns:
+        DataFrame: lat and lng indexed by station id
+    """
+    parts = []
+    for end in ['start', 'end']:
+        columns = [f'{end}_station_id', f'{end}_lat', f'{end}_lng']
+        if all(col in df.columns for col in columns):
+            part = df[columns]
+            part.columns = ['station_id', 'lat', 'lng']
+            parts.append(part)
+    if not parts:
+        return pd.DataFrame({'lat': [], 'lng': []}, index=pd.Index([], name='station_id'))
+    
+    points = pd.concat(parts, ignore_index=True).dropna()
+    return points.groupby('station_id')[['lat', 'lng']].median()
+
+
+def _trip_points(df, end, coordinates):
+    """Latitudes and longitudes of one trip end, filled from station coordinates where missing."""
+    n = len(df)
+    lat = np.array(df[f'{end}_lat'], dtype=np.float64) if f'{end}_lat' in df.columns else np.full(n, np.nan)
+    lng = np.array(df[f'{end}_lng'], dtype=np.float64) if f'{end}_lng' in df.columns else np.full(n, np.nan)
+    
+    missing = np.isnan(lat) | np.isnan(lng)
+    station_col = f'{end}_station_id'
+    if coordinates is not None and missing.any() and station_col in df.columns:
+        position = coordinates.index.get_indexer(df[station_col].to_numpy()[missing])
+        found = position >= 0
+        rows = np.flatnonzero(missing)[found]
+        lat[rows] = coordinates['lat'].to_numpy()[position[found]]
+        lng[rows] = coordinates['lng'].to_numpy()[position[found]]
+    return lat, lng
+
+
+def trip_distances(df, coordinates=None):
+    """
+    Straight-line distance of every trip.
+    
+    Trips without coordinates, such as the 2019 exports, are located
+    through a station coordinate lookup table.
+    
+    Args:
+        df (DataFrame): Trips or a chunk of trips
+        coordinates (DataFrame): Station lookup table (default: built from
+            the coordinates present in ``df`` with ``station_coordinates``)
+            
+    Returns:
+        ndarray: Distances in kilometres (NaN where a trip cannot be located)
+    """
+    coordinate_columns = ['start_lat', 'start_lng', 'end_lat', 'end_lng']
+    complete = (all(col in df.columns for col in coordinate_columns)
+                and not df[coordinate_columns].isna().any().any())
+    if coordinates is None and not complete:
+        coordinates = station_coordinates(df)
+    start_lat, start_lng = _trip_points(df, 'start', coordinates)
+    end_lat, end_lng = _trip_points(df, 'end', coordinates)
+    return haversine_km(start_lat, start_lng, end_lat, end_lng)
+
+
+def _station_keys(values):
+    """Return station ids as a NumPy array, using integers where the ids are whole numbers."""
+    values = np.asarray(values)
+    if values.dtype.kind == 'f' and np.all(values == np.round(values)):
+        return values.astype(np.int64)
+    return values
+
+
+class StationDimension:
+    """
+    Station attributes (name, lat, lng) keyed by station id.
+    
+    Built once when trips are loaded so that the trip frame only needs to
+    carry integer station ids; names are looked up when a report or chart
+    asks for them.
+    """
+    
+    def __init__(self, table=None):
+        """
+        Initialize the dimension.
+        
+        Args:
+            table (DataFrame): name, lat and lng indexed by station_id
+        """
+        if table is None:
+            table = pd.DataFrame({'name': pd.Series(dtype=object), 'lat': pd.Series(dtype=np.float64),
+                                  'lng': pd.Series(dtype=np.float64)})
+            table.index = pd.Index(table.index, name='station_id')
+        self.table = table
+    
+    def __len__(self):
+        return len(self.table)
+    
+    @classmethod
+    def from_trips(cls, df):
+        """
+        Build the dimension from a frame of trips.
+        
+        Args:
+            df (DataFrame): Trips with station ids and optionally station
+                names and coordinates
+            
+        Returns:
+            StationDimension: One row per station seen at either trip end
+        """
+        return cls().update(df)
+    
+    def update(self, df):
+        """
+        Add the stations of another frame of trips.
+        
+        Stations already in the dimension keep their attributes.
+        
+        Args:
+            df (DataFrame): Trips with station ids
+            
+        Returns:
+            StationDimension: self, to allow chaining
+        """
+        ids, names = [], []
+        for end in ['start', 'end']:
+            if f'{end}_station_id' in df.columns:
+                ids.append(df[f'{end}_station_id'].to_numpy())
+                name_col = f'{end}_station_name'
+                names.append(df[name_col].astype(object).to_numpy() if name_col in df.columns
+                             else np.full(len(df), None, dtype=object))
+        if not ids:
+            return self
+        
+        pairs = pd.DataFrame({'station_id': np.concatenate(ids), 'name': np.concatenate(names)})
+        pairs = pairs[pairs['station_id'].notna()]
+        pairs['station_id'] = _station_keys(pairs['station_id'].to_numpy())
+        
+        # Most frequent name per station, resolved with one grouped count
+        counts = pairs.groupby(['station_id', 'name'], dropna=False).size().reset_index(name='rides')
+        counts = counts.sort_values('rides', ascending=False, kind='stable')
+        table = counts.drop_duplicates('station_id').set_index('station_id')[['name']]
+        table = table.join(station_coordinates(df)).sort_index()
+        
+        new = table[~table.index.isin(self.table.index)]
+        self.table = pd.concat([self.table, new]).sort_index() if len(self.table) else new
+        self.table.index.name = 'station_id'
+        return self
+    
+    def names(self, station_ids):
+        """
+        Resolve station ids to names.
+        
+        Args:
+            station_ids (array-like): Station ids
+            
+        Returns:
+            ndarray: Station names (None for unknown stations)
+        """
+        position = self.table.index.get_indexer(np.asarray(station_ids))
+        names = self.table['name'].to_numpy(dtype=object)
+        return np.where(position >= 0, names[np.maximum(position, 0)], None)
+    
+    def intern(self, df):
+        """
+        Drop station names from a frame of trips, keeping integer ids.
+        
+        Args:
+            df (DataFrame): Trips already folded into the dimension
+            
+        Returns:
+            DataFrame: Trips without name columns and with the narrowest
+            integer station ids that hold them
+        """
+        df = df.drop(columns=[col for col in ['start_station_name', 'end_station_name'] if col in df.columns])
+        for col in ['start_station_id', 'end_station_id']:
+            if col in df.columns and pd.api.types.is_numeric_dtype(df[col]) and df[col].notna().all():
+                values = df[col].to_numpy()
+                if np.all(values == np.round(values)):
+                    df[col] = pd.to_numeric(values.astype(np.int64), downcast='integer')
+        return df
+
+
+class StationFlows:
+    """
+    Sparse origin-destination matrices of trips between stations.
+    
+    Stations are interned to integer codes once and every trip becomes one
+    entry of a ``scipy.sparse`` matrix, so memory grows with the number of
+    distinct routes rather than the number of trips. With ``split_by`` the
+    trips are also split by user type or start hour; the groups are stacked
+    as row blocks of a single matrix.
+    """
+    
+    def __init__(self, split_by=None):
+        """
+        Initialize empty station flows.
+        
+        Args:
+            split_by (str): ``member_casual``, ``start_hour`` or None
+        """
+        if split_by is not None and split_by not in FLOW_SPLITS:
+            raise ValueError(f"Cannot split station flows by {split_by!r}")
+        self.split_by = split_by
+        self.groups = FLOW_SPLITS[split_by] if split_by else [None]
+        self.stations = np.array([], dtype=np.int64)
+        self.flows = sparse.csr_matrix((0, 0), dtype=np.int64)
+    
+    @classmethod
+    def from_trips(cls, df, split_by=None):
+        """
+        Build station flows from a frame of trips.
+        
+        Args:
+            df (DataFrame): Trips with ``start_station_id`` and
+                ``end_station_id`` (and the ``split_by`` column)
+            split_by (str): ``member_casual``, ``start_hour`` or None
+        
+        Returns:
+            StationFlows: Flows over all trips with both stations known
+        """
+        return cls(split_by).update(df)
+    
+    @property
+    def n_stations(self):
+        """int: Number of distinct stations seen."""
+        return len(self.stations)
+    
+    @property
+    def total_trips(self):
+        """int: Number of trips folded into the flows."""
+        return int(self.flows.sum())
+    
+    def _group_codes(self, df):
+        """Group code per trip for the split column (-1 for unknown groups)."""
+        if self.split_by is None:
+            return np.zeros(len(df), dtype=np.int64)
+        return pd.Categorical(df[self.split_by], categories=self.groups).codes.astype(np.int64)
+    
+    def _union(self, stations):
+        """Sorted union of the known stations and ``stations``."""
+        if not len(self.stations):
+            return np.unique(stations)
+        return np.union1d(self.stations, stations)
+    
+    def _resize(self, stations):
+        """Re-index the existing flows onto a larger, sorted set of stations."""
+        if len(stations) == len(self.stations):
+            return
+        n_groups = len(self.groups)
+        mapping = np.searchsorted(stations, self.stations)
+        flows = self.flows.tocoo()
+        group, origin = np.divmod(flows.row, max(self.n_stations, 1))
+        self.flows = sparse.coo_matrix(
+            (flows.data, (group * len(stations) + mapping[origin], mapping[flows.col])),
+            shape=(n_groups * len(stations), len(stations))).tocsr()
+        self.stations = stations
+    
+    def update(self, df):
+        """
+        Fold a chunk of trips into the flows.
+        
+        Args:
+            df (DataFrame): Trips with ``start_station_id`` and
+                ``end_station_id`` (and the ``split_by`` column)
+        
+        Returns:
+            StationFlows: self, to allow chaining
+        """
+        start = df['start_station_id'].to_numpy()
+        end = df['end_station_id'].to_numpy()
+        group = self._group_codes(df)
+        known = pd.notna(start) & pd.notna(end) & (group >= 0)
+        start, end, group = _station_keys(start[known]), _station_keys(end[known]), group[known]
+        
+        self._resize(self._union(np.union1d(start, end)))
+        
+        n = self.n_stations
+        origins = group * n + np.searchsorted(self.stations, start)
+        destinations = np.searchsorted(self.stations, end)
+        self.flows = self.flows + sparse.coo_matrix(
+            (np.ones(len(origins), dtype=np.int64), (origins, destinations)),
+            shape=(len(self.groups) * n, n)).tocsr()
+        return self
+    
+    def merge(self, other):
+        """
+        Merge flows built from another chunk or file.
+        
+        Args:
+            other (StationFlows): Flows with the same split
+        
+        Returns:
+            StationFlows: self, to allow chaining
+        """
+        if other.split_by != self.split_by:
+            raise ValueError("Cannot merge station flows with different splits")
+        
+        stations = self._union(other.stations)
+        self._resize(stations)
+        other_flows = other.flows.tocoo()
+        group, origin = np.divmod(other_flows.row, max(other.n_stations, 1))
+        mapping = np.searchsorted(stations, other.stations)
+        n = self.n_stations
+        self.flows = self.flows + sparse.coo_matrix(
+            (other_flows.data, (group * n + mapping[origin], mapping[other_flows.col])),
+            shape=self.flows.shape).tocsr()
+        return self
+    
+    def matrix(self, group=None):
+        """
+        Origin-destination matrix for one group or for all trips.
+        
+        Args:
+            group: Group label (e.g. ``'casual'`` or an hour), or None for
+                all groups combined
+        
+        Returns:
+            csr_matrix: Trips from row station to column station
+        """
+        n = self.n_stations
+        if group is not None:
+            code = self.groups.index(group)
+            return self.flows[code * n:(code + 1) * n]
+        # Sum the row blocks with one sparse product
+        n_groups = len(self.groups)
+        selector = sparse.hstack([sparse.identity(n, dtype=np.int64, format='csr')] * n_groups)
+        return (selector @ self.flows).tocsr()
+    
+    def top_routes(self, n=10, group=None):
+        """
+        Most travelled station-to-station routes.
+        
+        Args:
+            n (int): Number of routes to return
+            group: Restrict to one group (see ``matrix``)
+        
+        Returns:
+            DataFrame: start_station_id, end_station_id and rides, busiest first
+        """
+        flows = self.matrix(group).tocoo()
+        order = np.argsort(-flows.data, kind='stable')[:n]
+        return pd.DataFrame({
+            'start_station_id': self.stations[flows.row[order]],
+            'end_station_id': self.stations[flows.col[order]],
+            'rides': flows.data[order]
+        })
+    
+    def station_volume(self, group=None):
+        """
+        Outbound and inbound trips per station.
+        
+        Args:
+            group: Restrict to one group (see ``matrix``)
+        
+        Returns:
+            DataFrame: outbound, inbound and net (inbound - outbound) rides
+            indexed by station id, busiest first
+        """
+        flows = self.matrix(group)
+        outbound = np.asarray(flows.sum(axis=1)).ravel()
+        inbound = np.asarray(flows.sum(axis=0)).ravel()
+        volume = pd.DataFrame({'outbound': outbound, 'inbound': inbound, 'net': inbound - outbound},
+                              index=pd.Index(self.stations, name='station_id'))
+        order = np.argsort(-(outbound + inbound), kind='stable')
+        return volume.iloc[order]
+    
+    def casual_heavy_corridors(self, n=10, min_rides=20):
+        """
+        Routes where casual riders make up the largest share of trips.
+        
+        Args:
+            n (int): Number of routes to return
+            min_rides (int): Ignore routes with fewer trips in total
+        
+        Returns:
+            DataFrame: start_station_id, end_station_id, rides, casual_rides
+            and casual_share, highest share first
+        """
+        if self.split_by != 'member_casual':
+            raise ValueError("Casual corridors need flows split by member_casual")
+        
+        total = self.matrix().tocoo()
+        # The casual matrix has a subset of the total's routes; align the two
+        casual = self.matrix('casual').tocsr()
+        casual_rides = np.asarray(casual[total.row, total.col]).ravel()
+        
+        busy = total.data >= min_rides
+        share = casual_rides[busy] / total.data[busy]
+        order = np.lexsort((-total.data[busy], -share))[:n]
+        return pd.DataFrame({
+            'start_station_id': self.stations[total.row[busy][order]],
+            'end_station_id': self.stations[total.col[busy][order]],
+            'rides': total.data[busy][order],
+            'casual_rides': casual_rides[busy][order],
+            'casual_share': share[order]
+        })
@@ -0,0 +1,175 @@
+"""
+Time-Sorted Trip Index for Cyclistic Analysis
+============================================
+
+This module keeps the prepared trips sorted by start time so that the
+statistics of a date window, optionally narrowed to one user type or one
+station, are computed from just the trips in that window.
+
+Author: Muhammad Baihaqi
+License: MIT
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .aggregates import USER_TYPES, DAY_NAMES
+except ImportError:  # Imported as a top-level module with src/ on sys.path
+    from aggregates import USER_TYPES, DAY_NAMES
+
+
+def _group_positions(keys, positions):
+    """
+    Group positions by key, CSR style.
+    
+    Args:
+        keys (ndarray): Integer key per entry
+        positions (ndarray): Position per entry
+    
+    Returns:
+        tuple: (sorted unique keys, offsets into the grouped positions,
+        positions sorted by key and then by position)
+    """
+    order = np.lexsort((positions, keys))
+    keys, positions = keys[order], positions[order]
+    unique, starts = np.unique(keys, return_index=True)
+    return unique, np.append(starts, len(keys)), positions
+
+
+class TripIndex:
+    """
+    Trips sorted by ``started_at`` with positional indexes.
+    
+    Date windows are found with binary search on the sorted start times.
+    Each user type and each station has a precomputed, sorted array of the
+    positions of its trips, which is cut to a date window with a second
+    binary search, so a query touches only the trips it returns.
+    """
+    
+    def __init__(self, df):
+        """
+        Build the index from prepared trips.
+        
+        Args:
+            df (DataFrame): Trips with ``started_at``, ``member_casual``,
+                ``ride_length``, ``day_of_week``, ``start_hour`` and
+                ``month``, and optionally the station id columns
+        """
+        started_at = df['started_at'].to_numpy()
+        self.unit = np.datetime_data(started_at.dtype)[0]
+        ticks = started_at.view(np.int64)
+        order = np.argsort(ticks, kind='stable')
+        
+        self.starts = ticks[order]
+        self.user = pd.Categorical(df['member_casual'], categories=USER_TYPES).codes[order]
+        self.day = df['day_of_week'].to_numpy(dtype=np.int64)[order]
+        self.hour = df['start_hour'].to_numpy(dtype=np.int64)[order]
+        self.month = df['month'].to_numpy(dtype=np.int64)[order]
+        self.ride_length = df['ride_length'].to_numpy(dtype=np.float64)[order]
+        
+        positions = np.arange(len(order))
+        self.user_positions = [np.flatnonzero(self.user == code) for code in range(len(USER_TYPES))]
+        
+        # A station's trips are the ones that start or end there. Ids are numbers
+        # before 2021 and strings after, so they are keyed by factorized code
+        columns = [col for col in ['start_station_id', 'end_station_id'] if col in df.columns]
+        ids = pd.concat([df[col].iloc[order] for col in columns],
+                        ignore_index=True) if columns else pd.Series([], dtype=object)
+        codes, uniques = pd.factorize(ids)
+        self.station_ids = pd.Index(uniques)
+        known = codes >= 0
+        _, self.station_offsets, self.station_positions = _group_positions(
+            codes[known].astype(np.int64), np.tile(positions, len(columns))[known])
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def _ticks(self, value):
+        """Convert a date bound to the index's integer time unit."""
+        # Timestamp.value is always in nanoseconds, whatever the index's unit
+        return int(np.datetime64(pd.Timestamp(value)).astype(f'datetime64[{self.unit}]').view('i8'))
+    
+    def _station(self, station_id):
+        """Sorted positions of the trips that start or end at a station."""
+        code = self.station_ids.get_indexer([station_id])[0]
+        if code < 0:
+            return np.array([], dtype=np.int64)
+        positions = self.station_positions[self.station_offsets[code]:self.station_offsets[code + 1]]
+        # Round trips are listed under both columns
+        return positions[np.append(True, positions[1:] != positions[:-1])]
+    
+    def positions(self, start=None, end=None, user_type=None, station_id=None):
+        """
+        Find the trips in a date window.
+        
+        Args:
+            start (str or Timestamp): First start time included (default: all)
+            end (str or Timestamp): First start time excluded (default: all)
+            user_type (str): Only rides by this user type
+            station_id (int or str): Only trips starting or ending at this station
+        
+        Returns:
+            ndarray: Sorted positions of the matching trips in the index
+        """
+        low = 0 if start is None else np.searchsorted(self.starts, self._ticks(start), side='left')
+        high = len(self.starts) if end is None else np.searchsorted(self.starts, self._ticks(end), side='left')
+        
+        candidates = None
+        if station_id is not None:
+            candidates = self._station(station_id)
+        elif user_type is not None:
+            candidates = self.user_positions[USER_TYPES.index(user_type)]
+        if candidates is None:
+            return np.arange(low, max(low, high))
+        
+        window = candidates[np.searchsorted(candidates, low):np.searchsorted(candidates, high)]
+        if station_id is not None and user_type is not None:
+            window = window[self.user[window] == USER_TYPES.index(user_type)]
+        return window
+    
+    def summary(self, start=None, end=None, user_type=None, station_id=None):
+        """
+        Duration, weekly and hourly statistics of the trips in a date window.
+        
+        The tables have the same layout as ``analyze_ride_duration``,
+        ``analyze_weekly_patterns`` and ``analyze_hourly_patterns``. They are
+        computed straight from the window's trips, without building the
+        full aggregate cube, so small windows take a few milliseconds.
+        
+        Args:
+            start (str or Timestamp): First start time included (default: all)
+            end (str or Timestamp): First start time excluded (default: all)
+            user_type (str): Only rides by this user type
+            station_id (int or str): Only trips starting or ending at this station
+        
+        Returns:
+            dict: ``duration_stats``, ``weekly`` and ``hourly`` DataFrames
+        """
+        window = self.positions(start, end, user_type, station_id)
+        user = self.user[window].astype(np.int64)
+        window, user = window[user >= 0], user[user >= 0]
+        lengths = self.ride_length[window]
+        present = [code for code in range(len(USER_TYPES)) if (user == code).any()]
+        columns = pd.Index([USER_TYPES[code] for code in present], name='member_casual')
+        
+        rows = []
+        for code in present:
+            user_lengths = lengths[user == code]
+            rows.append([len(user_lengths), user_lengths.mean(), np.median(user_lengths),
+                         user_lengths.std(ddof=1) if len(user_lengths) > 1 else np.nan,
+                         user_lengths.min(), user_lengths.max()])
+        duration_stats = pd.DataFrame(rows, index=columns,
+                                      columns=['count', 'mean', 'median', 'std', 'min', 'max'])
+        duration_stats['count'] = duration_stats['count'].astype(np.int64)
+        
+        n_users = len(USER_TYPES)
+        weekly = np.bincount(self.day[window] * n_users + user, minlength=7 * n_users)
+        hourly = np.bincount(self.hour[window] * n_users + user, minlength=24 * n_users)
+        return {
+            'duration_stats': duration_stats.round(2),
+            'weekly': pd.DataFrame(weekly.reshape(7, n_users)[:, present], columns=columns,
+                                   index=pd.Index(DAY_NAMES, name='day_name')),
+            'hourly': pd.DataFrame(hourly.reshape(24, n_users)[:, present], columns=columns,
+                                   index=pd.Index(range(24), name='start_hour'))
+        }
@@ -8,31 +8,162 @@ Author: Muhammad Baihaqi
 License: MIT
 """
 
+import calendar
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+# Bump whenever a change to the chart code alters the rendered images, so
+# that cached PNGs are redrawn.
+CHART_VERSION = "1"
+
+# Plot style applied by every visualizer
+PLOT_STYLE = 'seaborn-v0_8'
+PLOT_PALETTE = 'husl'
+CHART_DPI = 300
+
+# Records the cache key each PNG in an output directory was rendered with
+CHART_MANIFEST = '.chart_cache.json'
+
+# Charts written by generate_all_visualizations(): file stem -> method name
+CHARTS = {
+    'duration_comparison': 'create_duration_comparison_chart',
+    'weekly_patterns': 'create_weekly_usage_chart',
+    'hourly_patterns': 'create_hourly_usage_chart',
+    'monthly_patterns': 'create_monthly_usage_chart',
+    'comprehensive_dashboard': 'create_comprehensive_dashboard'
+}
+
+# Aggregate tables each chart is drawn from, so a chart is redrawn only when they change
+CHART_INPUTS = {
+    'duration_comparison': ['duration_stats', 'duration_box_stats'],
+    'weekly_patterns': ['weekly_counts'],
+    'hourly_patterns': ['hourly_counts'],
+    'monthly_patterns': ['monthly_counts'],
+    'comprehensive_dashboard': ['duration_stats', 'weekly_counts', 'hourly_counts',
+                                'duration_histogram', 'user_counts', 'weekend_counts']
+}
+
+
+def _hash_input(key, value):
+    """Feed a table, array or nested container of them into a hash."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        key.update(value.to_json(orient='split', double_precision=15).encode())
+    elif isinstance(value, np.ndarray):
+        key.update(f"{value.dtype}{value.shape}".encode())
+        key.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for name in sorted(value):
+            key.update(f"{name}=".encode())
+            _hash_input(key, value[name])
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _hash_input(key, item)
+    else:
+        key.update(repr(value).encode())
+    key.update(b'|')
+
+
+def chart_cache_key(name, aggregates):
+    """
+    Cache key for one rendered chart.
+    
+    Only the aggregate tables listed for the chart in ``CHART_INPUTS`` are
+    hashed, so a change that leaves them alone (e.g. to ride durations for
+    the weekly chart) keeps the cached file.
+    
+    Args:
+        name (str): Chart name from ``CHARTS``
+        aggregates (TripAggregates): Aggregates the chart is drawn from
+        
+    Returns:
+        str: Hexadecimal key covering the chart's input tables, the plot
+        style settings and ``CHART_VERSION``
+    """
+    key = hashlib.sha256(f"chart={name}|version={CHART_VERSION}|style={PLOT_STYLE}|"
+                         f"palette={PLOT_PALETTE}|dpi={CHART_DPI}|".encode())
+    for method_name in CHART_INPUTS[name]:
+        key.update(f"{method_name}:".encode())
+        _hash_input(key, getattr(aggregates, method_name)())
+    return key.hexdigest()[:16]
+
+
+def _render_chart(aggregates, method_name, save_path):
+    """
+    Render one chart headlessly; runs inside a worker process.
+    
+    Args:
+        aggregates (TripAggregates): Aggregates to plot
+        method_name (str): Chart method of ``CyclisticVisualizer``
+        save_path (str): Output PNG path
+        
+    Returns:
+        float: Render time in seconds
+    """
+    start = time.perf_counter()
+    visualizer = CyclisticVisualizer(aggregates=aggregates, headless=True)
+    getattr(visualizer, method_name)(save_path)
+    return time.perf_counter() - start
+
+
 class CyclisticVisualizer:
     """
     Visualization class for Cyclistic bike-share data.
+    
+    Charts are drawn from a ``TripAggregates`` cube (ride counts by user
+    type, day, hour and month plus duration sketches) rather than from the
+    trips themselves, so rendering time and memory do not grow with the
+    number of rides.
     """
     
-    def __init__(self, analyzer=None):
+    def __init__(self, analyzer=None, aggregates=None, headless=False):
         """
         Initialize the visualizer.
         
         Args:
             analyzer: CyclisticAnalyzer instance with prepared data
+            aggregates (TripAggregates): Aggregates to plot instead of the
+                analyzer's
+            headless (bool): Render with the non-interactive Agg backend
+                and never display figures, only save them
         """
         self.analyzer = analyzer
-        self.df_combined = analyzer.df_combined if analyzer else None
+        self._aggregates = aggregates
+        self.headless = headless
+        if headless:
+            plt.switch_backend('Agg')
         
         # Set style for better-looking plots
-        plt.style.use('seaborn-v0_8')
-        sns.set_palette("husl")
+        plt.style.use(PLOT_STYLE)
+        sns.set_palette(PLOT_PALETTE)
+    
+    @property
+    def aggregates(self):
+        """TripAggregates: Aggregates the charts are drawn from, or None."""
+        if self._aggregates is not None:
+            return self._aggregates
+        if self.analyzer is None or not self.analyzer._has_data():
+            return None
+        return self.analyzer.get_aggregates()
+    
+    def _finish(self, fig, save_path):
+        """Save a finished figure, show it unless headless, and free it."""
+        plt.tight_layout()
+        
+        if save_path:
+            fig.savefig(save_path, dpi=CHART_DPI, bbox_inches='tight')
         
+        if not self.headless:
+            plt.show()
+        plt.close(fig)
+    
     def create_duration_comparison_chart(self, save_path=None):
         """
         Create ride duration comparison chart.
@@ -40,14 +171,15 @@ class CyclisticVisualizer:
         Args:
             save_path (str): Optional path to save the chart
         """
-        if self.df_combined is None:
+        aggregates = self.aggregates
+        if aggregates is None:
             print("No data available for visualization.")
             return
             
         fig, ax = plt.subplots(1, 2, figsize=(15, 6))
         
         # Bar chart of average duration
-        duration_means = self.df_combined.groupby('member_casual')['ride_length'].mean()
+        duration_means = aggregates.duration_stats()['mean']
         bars = ax[0].bar(duration_means.index, duration_means.values, 
                         color=['#3B82F6', '#10B981'], alpha=0.8)
         ax[0].set_title('Average Ride Duration by User Type', fontsize=14, fontweight='bold')
@@ -59,18 +191,13 @@ class CyclisticVisualizer:
             ax[0].text(i, v + 1, f'{v:.1f}min', ha='center', fontweight='bold')
         
         # Box plot for distribution
-        self.df_combined.boxplot(column='ride_length', by='member_casual', ax=ax[1])
+        ax[1].bxp(aggregates.duration_box_stats())
         ax[1].set_title('Ride Duration Distribution by User Type', fontsize=14, fontweight='bold')
         ax[1].set_ylabel('Ride Duration (minutes)')
         ax[1].set_xlabel('User Type')
         ax[1].set_ylim(0, 100)  # Limit y-axis for better visibility
         
-        plt.tight_layout()
-        
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            
-        plt.show()
+        self._finish(fig, save_path)
     
     def create_weekly_usage_chart(self, save_path=None):
         """
@@ -79,16 +206,12 @@ class CyclisticVisualizer:
         Args:
             save_path (str): Optional path to save the chart
         """
-        if self.df_combined is None:
+        aggregates = self.aggregates
+        if aggregates is None:
             print("No data available for visualization.")
             return
             
-        weekly_data = self.df_combined.groupby(['member_casual', 'day_name'])['ride_id'].count().reset_index()
-        weekly_pivot = weekly_data.pivot(index='day_name', columns='member_casual', values='ride_id')
-        
-        # Reorder days
-        day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        weekly_pivot = weekly_pivot.reindex(day_order)
+        weekly_pivot = aggregates.weekly_counts()
         
         fig, ax = plt.subplots(figsize=(12, 6))
         weekly_pivot.plot(kind='line', ax=ax, marker='o', linewidth=3, markersize=8)
@@ -104,12 +227,7 @@ class CyclisticVisualizer:
             ax.axvspan(idx-0.5, idx+0.5, alpha=0.2, color='yellow')
         
         plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            
-        plt.show()
+        self._finish(fig, save_path)
     
     def create_hourly_usage_chart(self, save_path=None):
         """
@@ -118,12 +236,12 @@ class CyclisticVisualizer:
         Args:
             save_path (str): Optional path to save the chart
         """
-        if self.df_combined is None:
+        aggregates = self.aggregates
+        if aggregates is None:
             print("No data available for visualization.")
             return
             
-        hourly_data = self.df_combined.groupby(['member_casual', 'start_hour'])['ride_id'].count().reset_index()
-        hourly_pivot = hourly_data.pivot(index='start_hour', columns='member_casual', values='ride_id')
+        hourly_pivot = aggregates.hourly_counts()
         
         fig, ax = plt.subplots(figsize=(14, 6))
         hourly_pivot.plot(kind='area', ax=ax, alpha=0.7)
@@ -139,12 +257,7 @@ class CyclisticVisualizer:
             ax.axvspan(start, end, alpha=0.2, color='red', 
                       label='Commute Hours' if start == 7 else "")
         
-        plt.tight_layout()
-        
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            
-        plt.show()
+        self._finish(fig, save_path)
     
     def create_monthly_usage_chart(self, save_path=None):
         """
@@ -153,12 +266,12 @@ class CyclisticVisualizer:
         Args:
             save_path (str): Optional path to save the chart
         """
-        if self.df_combined is None:
+        aggregates = self.aggregates
+        if aggregates is None:
             print("No data available for visualization.")
             return
             
-        monthly_data = self.df_combined.groupby(['member_casual', 'month'])['ride_id'].count().reset_index()
-        monthly_pivot = monthly_data.pivot(index='month', columns='member_casual', values='ride_id')
+        monthly_pivot = aggregates.monthly_counts()
         
         fig, ax = plt.subplots(figsize=(10, 6))
         monthly_pivot.plot(kind='bar', ax=ax, alpha=0.8)
@@ -169,15 +282,10 @@ class CyclisticVisualizer:
         ax.grid(True, alpha=0.3)
         
         # Set month labels
-        month_labels = ['Jan', 'Feb', 'Mar']
+        month_labels = [calendar.month_abbr[month] for month in monthly_pivot.index]
         ax.set_xticklabels(month_labels, rotation=45)
         
-        plt.tight_layout()
-        
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            
-        plt.show()
+        self._finish(fig, save_path)
     
     def create_comprehensive_dashboard(self, save_path=None):
         """
@@ -186,7 +294,8 @@ class CyclisticVisualizer:
         Args:
             save_path (str): Optional path to save the dashboard
         """
-        if self.df_combined is None:
+        aggregates = self.aggregates
+        if aggregates is None:
             print("No data available for visualization.")
             return
             
@@ -195,7 +304,7 @@ class CyclisticVisualizer:
         
         # 1. Duration comparison
         ax1 = plt.subplot(3, 2, 1)
-        duration_means = self.df_combined.groupby('member_casual')['ride_length'].mean()
+        duration_means = aggregates.duration_stats()['mean']
         bars = ax1.bar(duration_means.index, duration_means.values, 
                       color=['#3B82F6', '#10B981'], alpha=0.8)
         ax1.set_title('Average Ride Duration by User Type', fontsize=12, fontweight='bold')
@@ -205,10 +314,7 @@ class CyclisticVisualizer:
         
         # 2. Weekly patterns
         ax2 = plt.subplot(3, 2, 2)
-        weekly_data = self.df_combined.groupby(['member_casual', 'day_name'])['ride_id'].count().reset_index()
-        weekly_pivot = weekly_data.pivot(index='day_name', columns='member_casual', values='ride_id')
-        day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        weekly_pivot = weekly_pivot.reindex(day_order)
+        weekly_pivot = aggregates.weekly_counts()
         weekly_pivot.plot(kind='line', ax=ax2, marker='o', linewidth=2)
         ax2.set_title('Weekly Usage Patterns', fontsize=12, fontweight='bold')
         ax2.set_ylabel('Number of Rides')
@@ -216,8 +322,7 @@ class CyclisticVisualizer:
         
         # 3. Hourly patterns
         ax3 = plt.subplot(3, 2, 3)
-        hourly_data = self.df_combined.groupby(['member_casual', 'start_hour'])['ride_id'].count().reset_index()
-        hourly_pivot = hourly_data.pivot(index='start_hour', columns='member_casual', values='ride_id')
+        hourly_pivot = aggregates.hourly_counts()
         hourly_pivot.plot(kind='area', ax=ax3, alpha=0.7)
         ax3.set_title('Hourly Usage Patterns', fontsize=12, fontweight='bold')
         ax3.set_xlabel('Hour of Day')
@@ -225,9 +330,10 @@ class CyclisticVisualizer:
         
         # 4. Duration distribution
         ax4 = plt.subplot(3, 2, 4)
-        for user_type in ['casual', 'member']:
-            data = self.df_combined[self.df_combined['member_casual'] == user_type]['ride_length']
-            ax4.hist(data, bins=50, alpha=0.7, label=user_type, density=True)
+        edges, density = aggregates.duration_histogram(bins=50, density=True)
+        for user_type in density.columns:
+            ax4.bar(edges[:-1], density[user_type], width=np.diff(edges), align='edge',
+                    alpha=0.7, label=user_type)
         ax4.set_title('Ride Duration Distribution', fontsize=12, fontweight='bold')
         ax4.set_xlabel('Duration (minutes)')
         ax4.set_ylabel('Density')
@@ -236,7 +342,10 @@ class CyclisticVisualizer:
         
         # 5. Weekend vs Weekday
         ax5 = plt.subplot(3, 2, 5)
-        weekend_stats = self.df_combined.groupby(['member_casual', 'is_weekend'])['ride_id'].count().unstack()
+        user_counts = aggregates.user_counts()
+        weekend_counts = aggregates.weekend_counts()
+        weekend_stats = pd.DataFrame({False: user_counts - weekend_counts, True: weekend_counts})
+        weekend_stats = weekend_stats[user_counts > 0]
         weekend_stats_pct = weekend_stats.div(weekend_stats.sum(axis=1), axis=0) * 100
         weekend_stats_pct.plot(kind='bar', ax=ax5, stacked=True)
         ax5.set_title('Weekend vs Weekday Usage (%)', fontsize=12, fontweight='bold')
@@ -251,13 +360,13 @@ class CyclisticVisualizer:
         
         # Create summary table
         summary_data = []
-        for user_type in ['casual', 'member']:
-            user_data = self.df_combined[self.df_combined['member_casual'] == user_type]
+        duration_means = aggregates.duration_stats()['mean']
+        for user_type in duration_means.index:
             summary_data.append([
                 user_type.title(),
-                f"{len(user_data):,}",
-                f"{user_data['ride_length'].mean():.1f} min",
-                f"{(user_data['is_weekend'].sum() / len(user_data) * 100):.1f}%"
+                f"{user_counts[user_type]:,}",
+                f"{duration_means[user_type]:.1f} min",
+                f"{(weekend_counts[user_type] / user_counts[user_type] * 100):.1f}%"
             ])
         
         table = ax6.table(cellText=summary_data,
@@ -269,34 +378,70 @@ class CyclisticVisualizer:
         table.scale(1.2, 1.5)
         ax6.set_title('Summary Statistics', fontsize=12, fontweight='bold', pad=20)
         
-        plt.tight_layout()
-        
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            
-        plt.show()
+        self._finish(fig, save_path)
     
-    def generate_all_visualizations(self, output_dir="assets"):
+    def generate_all_visualizations(self, output_dir="assets", parallel=False, max_workers=None,
+                                    use_cache=True):
         """
         Generate and save all visualizations.
         
         Args:
             output_dir (str): Directory to save visualizations
+            parallel (bool): Render the charts concurrently in headless
+                worker processes
+            max_workers (int): Number of worker processes (default: one per
+                chart, capped at the CPU count)
+            use_cache (bool): Keep existing PNGs whose cache key (see
+                ``chart_cache_key``) is unchanged instead of redrawing them
+            
+        Returns:
+            dict: Render time in seconds per chart (0.0 for cached charts)
         """
-        if self.df_combined is None:
+        aggregates = self.aggregates
+        if aggregates is None:
             print("No data available for visualization.")
-            return
+            return None
             
         # Create output directory if it doesn't exist
         Path(output_dir).mkdir(exist_ok=True)
         
         print("Generating visualizations...")
         
-        # Generate individual charts
-        self.create_duration_comparison_chart(f"{output_dir}/duration_comparison.png")
-        self.create_weekly_usage_chart(f"{output_dir}/weekly_patterns.png")
-        self.create_hourly_usage_chart(f"{output_dir}/hourly_patterns.png")
-        self.create_monthly_usage_chart(f"{output_dir}/monthly_patterns.png")
-        self.create_comprehensive_dashboard(f"{output_dir}/comprehensive_dashboard.png")
-        
-        print(f"All visualizations saved to {output_dir}/ directory")
\ No newline at end of file
+        manifest_path = Path(output_dir) / CHART_MANIFEST
+        manifest = {}
+        if use_cache and manifest_path.exists():
+            try:
+                manifest = json.loads(manifest_path.read_text())
+            except (OSError, ValueError):
+                manifest = {}
+        
+        keys = {name: chart_cache_key(name, aggregates) for name in CHARTS}
+        pending = {name: method_name for name, method_name in CHARTS.items()
+                   if not (use_cache and manifest.get(name) == keys[name]
+                           and (Path(output_dir) / f"{name}.png").exists())}
+        
+        timings = {name: 0.0 for name in CHARTS if name not in pending}
+        if parallel and pending:
+            max_workers = max_workers or min(len(pending), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                futures = {name: pool.submit(_render_chart, aggregates, method_name,
+                                             f"{output_dir}/{name}.png")
+                           for name, method_name in pending.items()}
+                for name, future in futures.items():
+                    timings[name] = future.result()
+                    manifest[name] = keys[name]
+        else:
+            for name, method_name in pending.items():
+                start = time.perf_counter()
+                getattr(self, method_name)(f"{output_dir}/{name}.png")
+                timings[name] = time.perf_counter() - start
+                manifest[name] = keys[name]
+        
+        manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+        timings = {name: timings[name] for name in CHARTS}
+        
+        for name in CHARTS:
+            status = f"{timings[name]:.2f}s" if name in pending else "unchanged, kept cached file"
+            print(f"  - {name}.png: {status}")
+        print(f"All visualizations saved to {output_dir}/ directory")
+        return timings
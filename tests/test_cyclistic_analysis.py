@@ -9,17 +9,90 @@ License: MIT
 """
 
 import unittest
+from unittest import mock
 import sys
+import tempfile
 from pathlib import Path
 import pandas as pd
 import numpy as np
+import matplotlib.pyplot as plt
 
 # Add src directory to path
 sys.path.append(str(Path(__file__).parent.parent / 'src'))
+sys.path.append(str(Path(__file__).parent.parent))
 
-from cyclistic_analyzer import CyclisticAnalyzer
-from visualizations import CyclisticVisualizer
-from data_utils import DataManager
+from cyclistic_analyzer import (CyclisticAnalyzer, calendar_lookup, detect_schema,
+                                detect_timestamp_format, parse_timestamps, read_trip_csv,
+                                _column_checksum)
+from visualizations import CHARTS, CyclisticVisualizer
+from data_utils import DataManager, generate_trips, generate_trip_chunks
+from aggregates import TripAggregates, pool_moments
+from analysis_state import AnalysisState
+from stations import StationDimension, StationFlows, haversine_km
+from column_store import read_source_key
+import main_analysis
+
+
+def write_quarter_files(directory, n_rows=500, seed=0):
+    """Write small 2019- and 2020-format trip files and return their paths."""
+    rng = np.random.default_rng(seed)
+    
+    def trips(year):
+        starts = pd.Timestamp(f'{year}-01-01') + pd.to_timedelta(
+            rng.integers(0, 90 * 24 * 60, n_rows), unit='min')
+        ends = starts + pd.to_timedelta(rng.integers(-5, 120, n_rows), unit='min')
+        stations = rng.integers(1, 30, n_rows).astype(float)
+        stations[:5] = np.nan
+        return starts, ends, stations
+    
+    starts, ends, stations = trips(2019)
+    df_2019 = pd.DataFrame({
+        'trip_id': np.arange(n_rows),
+        'start_time': starts.strftime('%Y-%m-%d %H:%M:%S'),
+        'end_time': ends.strftime('%Y-%m-%d %H:%M:%S'),
+        'bikeid': rng.integers(1, 500, n_rows),
+        'tripduration': (ends - starts).total_seconds(),
+        'from_station_id': stations,
+        'from_station_name': [f'Station {s}' for s in stations],
+        'to_station_id': rng.integers(1, 30, n_rows),
+        'to_station_name': 'Station',
+        'usertype': rng.choice(['Subscriber', 'Customer'], n_rows),
+        'gender': 'Male',
+        'birthyear': 1990
+    })
+    
+    starts, ends, stations = trips(2020)
+    df_2020 = pd.DataFrame({
+        'ride_id': [f'R{i:06d}' for i in range(n_rows)],
+        'rideable_type': 'docked_bike',
+        'started_at': starts.strftime('%Y-%m-%d %H:%M:%S'),
+        'ended_at': ends.strftime('%Y-%m-%d %H:%M:%S'),
+        'start_station_name': [f'Station {s}' for s in stations],
+        'start_station_id': stations,
+        'end_station_name': 'Station',
+        'end_station_id': rng.integers(1, 30, n_rows),
+        'start_lat': rng.uniform(41.8, 42.0, n_rows),
+        'start_lng': rng.uniform(-87.8, -87.5, n_rows),
+        'end_lat': rng.uniform(41.8, 42.0, n_rows),
+        'end_lng': rng.uniform(-87.8, -87.5, n_rows),
+        'member_casual': rng.choice(['member', 'casual'], n_rows)
+    })
+    
+    path_2019 = Path(directory) / 'Divvy_Trips_2019_Q1.csv'
+    path_2020 = Path(directory) / 'Divvy_Trips_2020_Q1.csv'
+    df_2019.to_csv(path_2019, index=False)
+    df_2020.to_csv(path_2020, index=False)
+    return str(path_2019), str(path_2020)
+
+
+def use_string_station_ids(*paths):
+    """Rewrite the station ids of trip files as 2021-style strings."""
+    for path in paths:
+        df = pd.read_csv(path)
+        for col in ['from_station_id', 'to_station_id', 'start_station_id', 'end_station_id']:
+            if col in df.columns:
+                df[col] = df[col].map(lambda value: f'TA{value:.0f}' if pd.notna(value) else None)
+        df.to_csv(path, index=False)
 
 
 class TestCyclisticAnalyzer(unittest.TestCase):
@@ -62,6 +135,134 @@ class TestCyclisticAnalyzer(unittest.TestCase):
         self.assertIn('started_at', standardized.columns)
         self.assertIn('member_casual', standardized.columns)
     
+    def test_schema_detection(self):
+        """Test that each Divvy export format is recognised from its columns."""
+        self.assertEqual(detect_schema(['trip_id', 'start_time', 'usertype']), 'divvy_2019')
+        self.assertEqual(detect_schema(['01 - Rental Details Local Start Time', 'User Type']), 'divvy_2019_q2')
+        self.assertEqual(detect_schema(['ride_id', 'started_at', 'member_casual']), 'divvy_2020')
+        with self.assertRaises(ValueError):
+            detect_schema(['foo', 'bar'])
+    
+    def test_timestamp_parsing(self):
+        """Test explicit-format timestamp parsing with fallback for odd rows."""
+        values = pd.Series(['2019-01-01 00:04:37', '2019-01-01 00:08:13', '01/02/2019 10:00', None])
+        
+        self.assertEqual(detect_timestamp_format(values.head(2)), '%Y-%m-%d %H:%M:%S')
+        self.assertEqual(detect_timestamp_format(pd.Series(['3/31/2017 23:59'])), '%m/%d/%Y %H:%M')
+        
+        parsed = parse_timestamps(values)
+        self.assertEqual(parsed[0], pd.Timestamp('2019-01-01 00:04:37'))
+        self.assertEqual(parsed[2], pd.Timestamp('2019-01-02 10:00'))
+        self.assertTrue(pd.isna(parsed[3]))
+    
+    def test_calendar_lookup_matches_datetime_accessors(self):
+        """Test that the per-date calendar table reproduces the .dt accessors."""
+        starts = pd.Series(pd.to_datetime(['2019-12-31 23:59', '2020-01-01 00:00', None,
+                                           '2020-03-15 17:30', '1969-12-31 22:00']))
+        
+        for column, expected in [('day_of_week', starts.dt.dayofweek), ('start_hour', starts.dt.hour),
+                                 ('month', starts.dt.month), ('year', starts.dt.year)]:
+            np.testing.assert_array_equal(calendar_lookup(starts, column), expected.to_numpy())
+        np.testing.assert_array_equal(calendar_lookup(starts, 'is_weekend'),
+                                      [False, False, False, True, False])
+        np.testing.assert_array_equal(calendar_lookup(starts, 'is_holiday'),
+                                      [False, True, False, False, False])
+    
+    def test_timestamps_parsed_at_read_time(self):
+        """Test that trip files come back with datetime columns already parsed."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, file_2020 = write_quarter_files(tmp)
+            df_2019 = read_trip_csv(file_2019)
+            df_2020 = read_trip_csv(file_2020)
+        
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df_2019['start_time']))
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df_2020['ended_at']))
+    
+    def test_prepare_files_in_parallel(self):
+        """Test that the multi-file loader matches the two-file pipeline."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, file_2020 = write_quarter_files(tmp)
+            self.analyzer.prepare_data(file_2019, file_2020)
+            expected = self.analyzer.df_combined
+            
+            parallel = CyclisticAnalyzer()
+            self.assertEqual(parallel.prepare_files(f"{tmp}/Divvy_Trips_*.csv", max_workers=2), 2)
+            
+            streamed = CyclisticAnalyzer()
+            streamed.prepare_files(tmp, max_workers=2, keep_rows=False, chunksize=100)
+        
+        pd.testing.assert_frame_equal(parallel.df_combined, expected)
+        self.assertEqual(streamed.get_aggregates().total_rides, len(expected))
+    
+    def test_parallel_prepare_data(self):
+        """Test that parallel per-file preparation matches the sequential path."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, file_2020 = write_quarter_files(tmp)
+            self.analyzer.prepare_data(file_2019, file_2020)
+            
+            parallel = CyclisticAnalyzer()
+            parallel.prepare_data(file_2019, file_2020, parallel=True)
+        
+        pd.testing.assert_frame_equal(parallel.df_combined, self.analyzer.df_combined)
+    
+    @unittest.skipUnless(Path('/dev/shm').is_dir(), "needs POSIX shared memory in /dev/shm")
+    def test_failed_parallel_prepare_frees_shared_memory(self):
+        """Test that shared-memory blocks are freed when a worker fails."""
+        before = set(Path('/dev/shm').iterdir())
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, _ = write_quarter_files(tmp, n_rows=20000)
+            with self.assertRaises(FileNotFoundError):
+                self.analyzer._run_workers([str(Path(tmp) / 'missing.csv'), file_2019], max_workers=2)
+        
+        self.assertEqual(set(Path('/dev/shm').iterdir()) - before, set())
+    
+    def test_prepare_frame_leaves_input_unchanged(self):
+        """Test that prepare_frame works on a copy of the caller's frame."""
+        with tempfile.TemporaryDirectory() as tmp:
+            _, file_2020 = write_quarter_files(tmp)
+            df = pd.read_csv(file_2020)
+        expected = df.copy()
+        
+        prepared = self.analyzer.prepare_frame(df, verbose=False)
+        pd.testing.assert_frame_equal(df, expected)
+        self.assertIn('ride_length', prepared.columns)
+        self.assertLess(len(prepared), len(df))
+    
+    def test_clean_data_rule_statistics(self):
+        """Test that clean_data reports which rule rejected each row."""
+        df = pd.DataFrame({
+            'ride_length': [10.0, -1.0, np.nan, 2000.0, 0.5, 15.0, 20.0],
+            'start_station_id': [1, 1, 1, 1, 1, np.nan, 2],
+            'end_station_id': [2, 2, 2, 2, 2, 2, np.nan]
+        })
+        
+        cleaned, stats = self.analyzer.clean_data(df.copy(), return_stats=True)
+        
+        self.assertEqual(cleaned['ride_length'].tolist(), [10.0])
+        self.assertEqual(stats['invalid_duration'], 2)
+        self.assertEqual(stats['over_24_hours'], 1)
+        self.assertEqual(stats['under_1_minute'], 1)
+        self.assertEqual(stats['missing_station'], 2)
+        self.assertEqual(stats['removed_rows'], 6)
+        
+        self.analyzer.clean_data(df, verbose=False, inplace=True)
+        self.assertEqual(len(df), 1)
+    
+    def test_clean_data_duplicate_labels(self):
+        """Test that rows sharing an index label with a rejected row are kept."""
+        df = pd.DataFrame({
+            'ride_length': [10.0, -1.0, 20.0, 30.0],
+            'start_station_id': [1, 1, 1, 1],
+            'end_station_id': [2, 2, 2, 2]
+        }, index=[0, 1, 0, 1])
+        
+        cleaned = self.analyzer.clean_data(df.copy(), verbose=False)
+        self.assertEqual(cleaned['ride_length'].tolist(), [10.0, 20.0, 30.0])
+        
+        self.analyzer.clean_data(df, verbose=False, inplace=True)
+        self.assertEqual(df['ride_length'].tolist(), [10.0, 20.0, 30.0])
+        self.assertEqual(df.index.tolist(), [0, 0, 1])
+    
     def test_duration_analysis(self):
         """Test ride duration analysis."""
         self.analyzer.prepare_data()  # Create sample data
@@ -71,6 +272,445 @@ class TestCyclisticAnalyzer(unittest.TestCase):
         self.assertIn('casual', results.index)
         self.assertIn('member', results.index)
         self.assertIn('mean', results.columns)
+    
+    def test_aggregate_cube_matches_groupby(self):
+        """Test that the aggregate cube reproduces row-level groupby results."""
+        self.analyzer.prepare_data()
+        df = self.analyzer.df_combined
+        cube = self.analyzer.get_aggregates()
+        
+        expected_hourly = df.groupby(['start_hour', 'member_casual'], observed=True).size().unstack(fill_value=0)
+        hourly = cube.hourly_counts().loc[expected_hourly.index]
+        self.assertEqual(list(hourly.columns), list(expected_hourly.columns))
+        np.testing.assert_array_equal(hourly.to_numpy(), expected_hourly.to_numpy())
+        
+        expected_stats = df.groupby('member_casual', observed=True)['ride_length'].agg(['count', 'mean', 'std'])
+        for user_type in ['casual', 'member']:
+            for stat in ['count', 'mean', 'std']:
+                self.assertAlmostEqual(cube.duration_stats().loc[user_type, stat],
+                                       expected_stats.loc[user_type, stat], places=6)
+    
+    def test_lazy_calculated_columns(self):
+        """Test that deferred calendar columns are derived only when needed."""
+        self.analyzer.prepare_data()
+        expected = self.analyzer.analyze_weekly_patterns()
+        
+        lazy = CyclisticAnalyzer(lazy_columns=True)
+        lazy.prepare_data()
+        self.assertIn('ride_length', lazy.df_combined.columns)
+        self.assertNotIn('day_of_week', lazy.df_combined.columns)
+        
+        pd.testing.assert_frame_equal(lazy.analyze_weekly_patterns(), expected)
+        self.assertIn('day_of_week', lazy.df_combined.columns)
+        self.assertNotIn('day_name', lazy.df_combined.columns)
+        
+        df = lazy.ensure_columns(['day_name'])
+        self.assertIsInstance(df['day_name'].dtype, pd.CategoricalDtype)
+        self.assertTrue((df['day_name'].astype(str) == df['started_at'].dt.day_name()).all())
+        
+    def test_station_dimension(self):
+        """Test that station names move to the dimension and trips keep integer ids."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, file_2020 = write_quarter_files(tmp)
+            self.analyzer.prepare_data(file_2019, file_2020)
+        
+        df = self.analyzer.df_combined
+        stations = self.analyzer.stations
+        self.assertNotIn('start_station_name', df.columns)
+        self.assertTrue(pd.api.types.is_integer_dtype(df['start_station_id']))
+        self.assertTrue(set(df['start_station_id']) <= set(stations.table.index))
+        
+        self.assertIsNone(stations.names([-1])[0])
+        
+        # Each station takes its most frequent name across both trip ends
+        trips = pd.DataFrame({'start_station_id': [1.0, 1.0, 2.0], 'start_station_name': ['A', 'A', 'B'],
+                              'end_station_id': [2.0, 1.0, 2.0], 'end_station_name': ['B', 'A (old)', 'B']})
+        dimension = StationDimension.from_trips(trips)
+        np.testing.assert_array_equal(dimension.names([2, 1]), ['B', 'A'])
+        
+        self.analyzer.analyze_station_flows(top_n=3)
+        self.assertIn('start_station_name', self.analyzer.analysis_results['top_routes'].columns)
+    
+    def test_complete_analysis_includes_station_flows(self):
+        """Test that the complete analysis reports top routes and casual-heavy corridors."""
+        self.analyzer.prepare_data()
+        results = self.analyzer.run_complete_analysis()
+        
+        self.assertEqual(len(results['top_routes']), 10)
+        self.assertIn('casual_share', results['casual_corridors'].columns)
+        self.assertIn('station_volume', results)
+    
+    def test_station_flows_match_groupby(self):
+        """Test that the sparse origin-destination matrix matches a groupby over trips."""
+        self.analyzer.prepare_data()
+        df = self.analyzer.df_combined
+        flows = self.analyzer.analyze_station_flows(top_n=5)
+        
+        routes = df.groupby(['start_station_id', 'end_station_id']).size()
+        top = flows.top_routes(5)
+        self.assertEqual(top['rides'].tolist(), routes.sort_values(ascending=False).head(5).tolist())
+        self.assertEqual(flows.total_trips, len(df))
+        
+        volume = flows.station_volume()
+        outbound = df.groupby('start_station_id').size()
+        np.testing.assert_array_equal(volume.loc[outbound.index, 'outbound'], outbound)
+        
+        # Flows built per chunk and merged equal flows built at once
+        merged = StationFlows.from_trips(df.iloc[:3000], 'member_casual').merge(
+            StationFlows.from_trips(df.iloc[3000:], 'member_casual'))
+        self.assertEqual((merged.flows != flows.flows).nnz, 0)
+        
+        corridors = flows.casual_heavy_corridors(3, min_rides=1)
+        self.assertTrue(corridors['casual_share'].is_monotonic_decreasing)
+    
+    def test_trip_distances_and_speeds(self):
+        """Test haversine distances, the station lookup for 2019 trips and speed stats."""
+        # Chicago to New York is about 1,145 km
+        self.assertAlmostEqual(float(haversine_km(41.8781, -87.6298, 40.7128, -74.0060)), 1144.3, delta=1)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            self.analyzer.prepare_data(*write_quarter_files(tmp))
+        # The full run includes the distances, located through the station dimension
+        with mock.patch('stations.station_coordinates') as rebuild:
+            stats = self.analyzer.run_complete_analysis()['distance_stats']
+        rebuild.assert_not_called()
+        
+        df = self.analyzer.df_combined
+        legacy = df['start_lat'].isna()
+        self.assertTrue(legacy.any())
+        self.assertFalse(df.loc[legacy, 'distance_km'].isna().any())
+        
+        located = df.loc[~legacy].iloc[0]
+        expected = haversine_km(located['start_lat'], located['start_lng'], located['end_lat'], located['end_lng'])
+        self.assertAlmostEqual(located['distance_km'], float(expected))
+        self.assertIn('casual_avg_speed_kmh', self.analyzer.analysis_results)
+        self.assertGreater(stats.loc['member', 'mean_km'], 0)
+    
+    def test_reassigned_trips_rebuild_aggregates(self):
+        """Test that replacing df_combined rebuilds the aggregate cube."""
+        for memoize in [True, False]:
+            analyzer = CyclisticAnalyzer(memoize=memoize)
+            analyzer.prepare_data()
+            full = analyzer.run_complete_analysis()['total_rides']
+            
+            analyzer.df_combined = analyzer.df_combined.iloc[:500].copy()
+            self.assertEqual(analyzer.run_complete_analysis()['total_rides'], 500)
+            self.assertNotEqual(full, 500)
+    
+    def test_memoized_results_follow_data_changes(self):
+        """Test that analysis results are cached until the data changes."""
+        self.analyzer.prepare_data()
+        first = self.analyzer.analyze_ride_duration()
+        
+        with mock.patch.object(self.analyzer, 'get_aggregates', wraps=self.analyzer.get_aggregates) as spy:
+            cached = self.analyzer.analyze_ride_duration()
+            self.assertEqual(spy.call_count, 0)
+        pd.testing.assert_frame_equal(cached, first)
+        
+        # In-place edits take effect once they are recorded
+        self.analyzer.df_combined.loc[0, 'ride_length'] = 10000.0
+        self.analyzer.mark_data_changed()
+        modified = self.analyzer.analyze_ride_duration()
+        self.assertEqual(modified['max'].max(), 10000.0)
+        
+        # Cleaning the trips in place records the change by itself
+        self.analyzer.clean_data(self.analyzer.df_combined, verbose=False, inplace=True)
+        self.assertLess(self.analyzer.analyze_ride_duration()['max'].max(), 10000.0)
+        
+        # Reloading the data invalidates it as well
+        self.analyzer.prepare_data()
+        pd.testing.assert_frame_equal(self.analyzer.analyze_ride_duration(), first)
+    
+    def test_verify_data_catches_unrecorded_edits(self):
+        """Test that cache hits skip the checksum unless verify_data is on."""
+        for verify_data in [False, True]:
+            analyzer = CyclisticAnalyzer(verify_data=verify_data)
+            analyzer.prepare_data()
+            analyzer.analyze_ride_duration()
+            
+            with mock.patch('cyclistic_analyzer._column_checksum', wraps=_column_checksum) as checksum:
+                analyzer.analyze_ride_duration()
+            self.assertEqual(checksum.called, verify_data)
+            
+            analyzer.df_combined.loc[0, 'ride_length'] = 10000.0
+            self.assertEqual(analyzer.analyze_ride_duration()['max'].max() == 10000.0, verify_data)
+    
+    def test_streaming_matches_in_memory(self):
+        """Test that chunked preparation reproduces the in-memory results."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, file_2020 = write_quarter_files(tmp)
+            self.analyzer.prepare_data(file_2019, file_2020)
+            expected = self.analyzer.run_complete_analysis().copy()
+            expected_weekly = self.analyzer.analyze_weekly_patterns()
+            
+            streamed = CyclisticAnalyzer()
+            streamed.prepare_data(file_2019, file_2020, chunksize=97)
+        
+        self.assertIsNone(streamed.df_combined)
+        results = streamed.run_complete_analysis()
+        
+        self.assertEqual(results['total_rides'], expected['total_rides'])
+        self.assertEqual(results['casual_rides'], expected['casual_rides'])
+        self.assertAlmostEqual(results['casual_avg_duration'], expected['casual_avg_duration'], places=2)
+        pd.testing.assert_frame_equal(
+            streamed.analyze_weekly_patterns(), expected_weekly, check_dtype=False, check_names=False)
+    
+    def test_incremental_state_matches_full_recompute(self):
+        """Test that appending files to the analysis state matches one full run."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, file_2020 = write_quarter_files(tmp)
+            state_path = Path(tmp) / 'state.npz'
+            self.analyzer.prepare_data(file_2019, file_2020)
+            expected = self.analyzer.analyze_ride_duration()
+            
+            incremental = CyclisticAnalyzer()
+            self.assertEqual(incremental.update_state([file_2019], state_path), ['Divvy_Trips_2019_Q1.csv'])
+            self.assertEqual(incremental.update_state([file_2019, file_2020], state_path),
+                             ['Divvy_Trips_2020_Q1.csv'])
+            self.assertEqual(incremental.update_state([file_2019, file_2020], state_path), [])
+            self.assertEqual(len(AnalysisState.load(state_path)), 2)
+        
+        results = incremental.analyze_ride_duration()
+        pd.testing.assert_frame_equal(results.drop(columns='median'), expected.drop(columns='median'))
+        pd.testing.assert_frame_equal(
+            incremental.analyze_weekly_patterns(), self.analyzer.analyze_weekly_patterns(),
+            check_dtype=False, check_names=False)
+    
+    def test_incremental_state_keys_relative_paths(self):
+        """Test that same-named files get separate partitions and deleted files are dropped."""
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ['a', 'b']:
+                (Path(tmp) / name).mkdir()
+            first, _ = write_quarter_files(Path(tmp) / 'a', seed=1)
+            second, _ = write_quarter_files(Path(tmp) / 'b', seed=2)
+            state_path = Path(tmp) / 'state.npz'
+            source = str(Path(tmp) / '*' / 'Divvy_Trips_2019_Q1.csv')
+            
+            changed = self.analyzer.update_state(source, state_path)
+            self.assertEqual(changed, ['a/Divvy_Trips_2019_Q1.csv', 'b/Divvy_Trips_2019_Q1.csv'])
+            both = self.analyzer.get_aggregates().total_rides
+            
+            Path(second).unlink()
+            self.assertEqual(self.analyzer.update_state(source, state_path), ['b/Divvy_Trips_2019_Q1.csv'])
+            self.assertEqual(list(AnalysisState.load(state_path).partitions), ['a/Divvy_Trips_2019_Q1.csv'])
+            
+            single = CyclisticAnalyzer()
+            single.prepare_files([first])
+            self.assertEqual(self.analyzer.get_aggregates().total_rides, len(single.df_combined))
+            self.assertLess(self.analyzer.get_aggregates().total_rides, both)
+    
+    def test_incremental_state_keeps_root_for_narrower_sources(self):
+        """Test that a narrower source keeps the partitions of files it does not match."""
+        with tempfile.TemporaryDirectory() as tmp:
+            raw = Path(tmp) / 'raw'
+            for name in ['2019', '2020']:
+                (raw / name).mkdir(parents=True)
+            first, _ = write_quarter_files(raw / '2019', seed=1)
+            second, _ = write_quarter_files(raw / '2020', seed=2)
+            state_path = Path(tmp) / 'state.npz'
+            
+            self.analyzer.update_state([first, second], state_path)
+            both = self.analyzer.get_aggregates().total_rides
+            
+            self.assertEqual(self.analyzer.update_state(str(raw / '2019' / 'Divvy_Trips_2019_*.csv'), state_path), [])
+            self.assertEqual(self.analyzer.get_aggregates().total_rides, both)
+            self.assertEqual(sorted(AnalysisState.load(state_path).partitions),
+                             ['2019/Divvy_Trips_2019_Q1.csv', '2020/Divvy_Trips_2019_Q1.csv'])
+            
+            # An explicit root other than the saved one rebuilds the state
+            changed = self.analyzer.update_state(str(raw / '2019' / 'Divvy_Trips_2019_*.csv'), state_path, root=raw / '2019')
+            self.assertEqual(changed, ['Divvy_Trips_2019_Q1.csv'])
+            self.assertLess(self.analyzer.get_aggregates().total_rides, both)
+    
+    def test_sqlite_store_matches_pandas(self):
+        """Test that the SQL pushdown reproduces the in-memory analyses."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, file_2020 = write_quarter_files(tmp)
+            self.analyzer.prepare_data(file_2019, file_2020)
+            n_trips = len(self.analyzer.df_combined)
+            
+            stored = CyclisticAnalyzer()
+            stored.prepare_data(file_2019, file_2020)
+            store = stored.use_sqlite(Path(tmp) / 'trips.db', batch_size=97)
+            self.assertIsNone(stored.df_combined)
+            self.assertEqual(len(store), n_trips)
+            indexes = store.query("SELECT name FROM sqlite_master WHERE type = 'index'")['name']
+            self.assertEqual(len(indexes), 4)
+            
+            pd.testing.assert_frame_equal(stored.analyze_ride_duration(), self.analyzer.analyze_ride_duration())
+            pd.testing.assert_frame_equal(
+                stored.analyze_weekly_patterns(), self.analyzer.analyze_weekly_patterns(), check_names=False)
+            pd.testing.assert_frame_equal(
+                stored.analyze_hourly_patterns(), self.analyzer.analyze_hourly_patterns(), check_names=False)
+            store.close()
+    
+    def test_sqlite_store_compact_string_stations(self):
+        """Test that compact trips with string station ids can be stored in SQLite."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, file_2020 = write_quarter_files(tmp)
+            use_string_station_ids(file_2019, file_2020)
+            self.analyzer.prepare_data(file_2019, file_2020, compact=True)
+            self.assertTrue(pd.api.types.is_unsigned_integer_dtype(self.analyzer.df_combined['ride_id']))
+            expected = self.analyzer.analyze_ride_duration()
+            at_station = (self.analyzer.df_combined['start_station_id'] == 'TA5').sum()
+            
+            store = self.analyzer.use_sqlite(Path(tmp) / 'trips.db')
+            stored = store.query("SELECT COUNT(*) AS n FROM trips WHERE start_station_id = 'TA5'")
+            self.assertEqual(stored['n'][0], at_station)
+            pd.testing.assert_frame_equal(self.analyzer.analyze_ride_duration(), expected, check_dtype=False)
+            store.close()
+    
+    def test_date_window_queries(self):
+        """Test that indexed window queries match analyzing the filtered trips."""
+        self.analyzer.prepare_data()
+        df = self.analyzer.df_combined
+        window = df[(df['started_at'] >= '2019-02-01') & (df['started_at'] < '2019-03-01')]
+        
+        subset = CyclisticAnalyzer()
+        subset.df_combined = window.copy()
+        summary = self.analyzer.query_window('2019-02-01', '2019-03-01')
+        pd.testing.assert_frame_equal(summary['duration_stats'], subset.analyze_ride_duration())
+        pd.testing.assert_frame_equal(summary['weekly'], subset.analyze_weekly_patterns())
+        pd.testing.assert_frame_equal(summary['hourly'], subset.analyze_hourly_patterns())
+        
+        station = window[(window['start_station_id'] == 3) | (window['end_station_id'] == 3)]
+        summary = self.analyzer.query_window('2019-02-01', '2019-03-01', user_type='casual', station_id=3)
+        self.assertEqual(summary['duration_stats']['count'].sum(), (station['member_casual'] == 'casual').sum())
+        self.assertEqual(len(self.analyzer.get_trip_index().positions(end='2000-01-01')), 0)
+    
+    def test_date_window_queries_string_stations(self):
+        """Test that window queries work with 2021-style string station ids."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, file_2020 = write_quarter_files(tmp)
+            use_string_station_ids(file_2019, file_2020)
+            self.analyzer.prepare_data(file_2019, file_2020)
+        
+        df = self.analyzer.df_combined
+        summary = self.analyzer.query_window()
+        self.assertEqual(summary['duration_stats']['count'].sum(), len(df))
+        
+        at_station = (df['start_station_id'] == 'TA3') | (df['end_station_id'] == 'TA3')
+        summary = self.analyzer.query_window(station_id='TA3')
+        self.assertEqual(summary['duration_stats']['count'].sum(), at_station.sum())
+        self.assertEqual(len(self.analyzer.get_trip_index().positions(station_id=3)), 0)
+        
+        # pandas 3 parses the files to microsecond timestamps, unlike the nanosecond sample data
+        in_window = (df['started_at'] >= '2020-01-01') & (df['started_at'] < '2020-02-01')
+        summary = self.analyzer.query_window('2020-01-01', '2020-02-01', station_id='TA3')
+        self.assertEqual(summary['duration_stats']['count'].sum(), (in_window & at_station).sum())
+    
+    def test_column_store_keyed_by_source_files(self):
+        """Test that a column store records the source files it was written from."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, file_2020 = write_quarter_files(tmp)
+            args = mock.Mock(files=str(Path(tmp) / '*.csv'), compact=False, sample=False)
+            data_manager = DataManager(data_dir=str(Path(tmp) / 'data'))
+            key = main_analysis.column_store_source_key(args, data_manager)
+            
+            self.analyzer.prepare_files([file_2019, file_2020])
+            store = Path(tmp) / 'store'
+            self.analyzer.save_column_store(store, source_key=key)
+            self.assertEqual(read_source_key(store), key)
+            self.assertEqual(main_analysis.column_store_source_key(args, data_manager), key)
+            
+            args.compact = True
+            self.assertNotEqual(main_analysis.column_store_source_key(args, data_manager), key)
+            args.compact = False
+            with open(file_2020, 'a') as f:
+                f.write(Path(file_2020).read_text().splitlines()[-1] + '\n')
+            self.assertNotEqual(main_analysis.column_store_source_key(args, data_manager), key)
+        self.assertIsNone(read_source_key(store))
+    
+    def test_column_store_round_trip(self):
+        """Test that a memory-mapped column store reopens the same trips."""
+        self.analyzer.prepare_data()
+        expected = self.analyzer.df_combined
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            self.analyzer.save_column_store(tmp)
+            reopened = CyclisticAnalyzer()
+            df = reopened.open_column_store(tmp)
+            
+            values = df['ride_length'].to_numpy()
+            self.assertFalse(values.flags.writeable)
+            while not isinstance(values, np.memmap) and values.base is not None:
+                values = values.base
+            self.assertIsInstance(values, np.memmap)
+            self.assertEqual(df['ride_id'].dtype, 'category')
+            pd.testing.assert_frame_equal(df.astype({'ride_id': expected['ride_id'].dtype}), expected)
+            pd.testing.assert_frame_equal(reopened.analyze_ride_duration(), self.analyzer.analyze_ride_duration())
+            self.assertEqual(len(reopened.stations), len(self.analyzer.stations))
+            
+            subset = CyclisticAnalyzer().open_column_store(tmp, columns=['started_at', 'ride_length'])
+            self.assertEqual(list(subset.columns), ['started_at', 'ride_length'])
+            del df, subset, reopened
+    
+    def test_pooled_moments_are_stable(self):
+        """Test that pooled variances survive a large common offset."""
+        rng = np.random.default_rng(3)
+        a, b = 1e6 + rng.random(1000), 1e6 + rng.random(500)
+        n, mean, m2 = pool_moments(len(a), a.mean(), a.var() * len(a), len(b), b.mean(), b.var() * len(b))
+        both = np.concatenate([a, b])
+        self.assertEqual(n, len(both))
+        self.assertAlmostEqual(mean, both.mean())
+        self.assertAlmostEqual(m2 / n, both.var(), places=6)
+    
+    def test_duration_sketch_quantiles(self):
+        """Test that sketch quantiles merge across chunks and stay within the error bound."""
+        self.analyzer.prepare_data()
+        df = self.analyzer.df_combined
+        exact = self.analyzer.analyze_duration_quantiles()
+        
+        # Fold the trips in as two separate chunks and merge them
+        halves = [TripAggregates().update(part) for part in (df.iloc[::2], df.iloc[1::2])]
+        merged = halves[0].merge(halves[1])
+        np.testing.assert_array_equal(merged.durations.counts,
+                                      self.analyzer.get_aggregates().durations.counts)
+        
+        approximate = merged.duration_quantiles().loc[exact.index, exact.columns]
+        self.assertLessEqual((approximate - exact).abs().to_numpy().max(), 0.05 + 0.01)
+        self.assertEqual(list(exact.columns), ['p25', 'median', 'p75', 'p90', 'p99', 'iqr'])
+    
+    def test_binned_duration_distributions(self):
+        """Test box statistics and histograms from the sketch against the trips."""
+        from matplotlib import cbook
+        self.analyzer.prepare_data()
+        df = self.analyzer.df_combined
+        aggregates = self.analyzer.get_aggregates()
+        
+        for box in aggregates.duration_box_stats():
+            lengths = df.loc[df['member_casual'] == box['label'], 'ride_length'].to_numpy()
+            expected = cbook.boxplot_stats(lengths)[0]
+            for key in ['q1', 'med', 'q3', 'whislo', 'whishi']:
+                self.assertAlmostEqual(box[key], expected[key], delta=0.1)
+        
+        edges, histogram = aggregates.duration_histogram(bins=50)
+        for user_type in histogram.columns:
+            lengths = df.loc[df['member_casual'] == user_type, 'ride_length']
+            self.assertEqual(histogram[user_type].sum(), len(lengths))
+            expected, _ = np.histogram(lengths, bins=edges)
+            self.assertLessEqual(np.abs(histogram[user_type].to_numpy() - expected).sum(), 0.02 * len(lengths))
+    
+    def test_compact_schema(self):
+        """Test that the compact schema shrinks the frame without changing results."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file_2019, file_2020 = write_quarter_files(tmp)
+            self.analyzer.prepare_data(file_2019, file_2020)
+            expected = self.analyzer.analyze_ride_duration()
+            
+            compact = CyclisticAnalyzer()
+            compact.prepare_data(file_2019, file_2020, compact=True)
+        
+        df = compact.df_combined
+        self.assertIsInstance(df['member_casual'].dtype, pd.CategoricalDtype)
+        self.assertEqual(df['start_hour'].dtype, np.int8)
+        self.assertEqual(df['ride_length'].dtype, np.float32)
+        self.assertEqual(df['ride_id'].dtype, np.uint64)
+        self.assertEqual(df['ride_id'].nunique(), len(df))
+        self.assertLess(compact.memory_usage['after_mb'], compact.memory_usage['before_mb'])
+        result = compact.analyze_ride_duration()
+        result.index = result.index.astype(str)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_index_type=False, atol=0.01)
 
 
 class TestDataManager(unittest.TestCase):
@@ -94,6 +734,33 @@ class TestDataManager(unittest.TestCase):
         self.assertGreater(len(df_2019), 0)
         self.assertGreater(len(df_2020), 0)
     
+    def test_generator_is_reproducible_across_partitions(self):
+        """Test that partitioned generation reproduces a single-process run."""
+        full = generate_trips(1000, seed=7, chunk_size=100)
+        partitions = [
+            chunk
+            for partition in range(3)
+            for chunk in generate_trip_chunks(1000, seed=7, chunk_size=100,
+                                              partition=partition, n_partitions=3)
+        ]
+        
+        pd.testing.assert_frame_equal(pd.concat(partitions, ignore_index=True), full)
+        pd.testing.assert_frame_equal(generate_trips(1000, seed=7, chunk_size=100), full)
+        self.assertFalse(generate_trips(1000, seed=8, chunk_size=100).equals(full))
+    
+    def test_generator_patterns(self):
+        """Test that generated trips follow the member/casual usage patterns."""
+        trips = generate_trips(20000, seed=1)
+        members = trips[trips['member_casual'] == 'member']
+        weekday_members = members[members['started_at'].dt.dayofweek < 5]
+        
+        self.assertAlmostEqual((trips['member_casual'] == 'member').mean(), 0.75, delta=0.02)
+        self.assertTrue(weekday_members['started_at'].dt.hour.isin([7, 8, 17, 18]).all())
+        
+        length = (trips['ended_at'] - trips['started_at']).dt.total_seconds() / 60
+        by_type = length.groupby(trips['member_casual']).mean()
+        self.assertGreater(by_type['casual'], 2 * by_type['member'])
+    
     def test_data_validation(self):
         """Test data validation function."""
         # Create test dataframe
@@ -109,6 +776,30 @@ class TestDataManager(unittest.TestCase):
         self.assertIsInstance(validation_results, dict)
         self.assertIn('is_valid', validation_results)
         self.assertIn('statistics', validation_results)
+    
+    def test_processed_data_cache(self):
+        """Test that prepared data is cached and reused until the source changes."""
+        with tempfile.TemporaryDirectory() as tmp:
+            data_manager = DataManager(data_dir=tmp)
+            file_2019, file_2020 = write_quarter_files(tmp)
+            
+            analyzer = CyclisticAnalyzer()
+            analyzer.prepare_data(file_2019, file_2020, data_manager=data_manager)
+            key = data_manager.get_cache_key([file_2019, file_2020], '1')
+            self.assertIsNotNone(data_manager.load_cached_data(key))
+            
+            cached = CyclisticAnalyzer()
+            cached.prepare_data(file_2019, file_2020, data_manager=data_manager)
+            pd.testing.assert_frame_equal(cached.df_combined, analyzer.df_combined, check_dtype=False)
+            
+            with open(file_2020, 'a') as f:
+                f.write('\n')
+            self.assertNotEqual(data_manager.get_cache_key([file_2019, file_2020], '1'), key)
+            self.assertNotEqual(data_manager.get_cache_key([file_2019, file_2020], '2'), key)
+            
+            # The trips and the station dimension
+            self.assertEqual(data_manager.clear_cache(), 2)
+            self.assertIsNone(data_manager.load_cached_data(key))
 
 
 class TestCyclisticVisualizer(unittest.TestCase):
@@ -123,8 +814,43 @@ class TestCyclisticVisualizer(unittest.TestCase):
     def test_visualizer_initialization(self):
         """Test that visualizer initializes correctly."""
         self.assertIsInstance(self.visualizer, CyclisticVisualizer)
-        self.assertIsNotNone(self.visualizer.df_combined)
+        self.assertIsNotNone(self.visualizer.aggregates)
         self.assertEqual(self.visualizer.analyzer, self.analyzer)
+    
+    def test_charts_render_from_aggregates(self):
+        """Test that every chart renders headlessly from aggregates alone."""
+        visualizer = CyclisticVisualizer(aggregates=self.analyzer.get_aggregates(), headless=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            timings = visualizer.generate_all_visualizations(tmp)
+            self.assertEqual(len(list(Path(tmp).glob('*.png'))), 5)
+        
+        self.assertEqual(set(timings), set(CHARTS))
+        self.assertEqual(plt.get_fignums(), [])
+    
+    def test_chart_cache_skips_unchanged_charts(self):
+        """Test that unchanged charts are kept and changed inputs are redrawn."""
+        visualizer = CyclisticVisualizer(self.analyzer, headless=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            visualizer.generate_all_visualizations(tmp)
+            with mock.patch.object(CyclisticVisualizer, 'create_weekly_usage_chart') as render:
+                timings = visualizer.generate_all_visualizations(tmp)
+                render.assert_not_called()
+            self.assertEqual(set(timings.values()), {0.0})
+            
+            # A duration change redraws only the charts that show durations
+            self.analyzer.df_combined.loc[0, 'ride_length'] = 50.0
+            self.analyzer.mark_data_changed()
+            timings = visualizer.generate_all_visualizations(tmp)
+            redrawn = {name for name, seconds in timings.items() if seconds > 0}
+            self.assertEqual(redrawn, {'duration_comparison', 'comprehensive_dashboard'})
+    
+    def test_parallel_chart_rendering(self):
+        """Test that charts can be rendered in worker processes."""
+        with tempfile.TemporaryDirectory() as tmp:
+            timings = self.visualizer.generate_all_visualizations(tmp, parallel=True, max_workers=2)
+            for name in CHARTS:
+                self.assertTrue((Path(tmp) / f'{name}.png').exists())
+                self.assertGreater(timings[name], 0)
 
 
 class TestIntegration(unittest.TestCase):
@@ -154,6 +880,42 @@ class TestIntegration(unittest.TestCase):
         
         self.assertEqual(total, casual + member)
         self.assertGreater(total, 0)
+    
+    def test_watch_mode_processes_settled_files(self):
+        """Test that watch mode prepares each file once it stops changing."""
+        with tempfile.TemporaryDirectory() as tmp:
+            first = Path(tmp) / 'first.csv'
+            second = Path(tmp) / 'second.csv'
+            first.write_text('ride_id\n1\n')
+            
+            # Each fake sleep runs one step before the next poll: first.csv is
+            # seen and then settles, second.csv lands, grows once and settles,
+            # and the last poll finds nothing new
+            steps = iter([
+                lambda: None,
+                lambda: None,
+                lambda: second.write_text('ride_id\n1\n'),
+                lambda: second.write_text('ride_id\n1\n2\n'),
+                lambda: None,
+                lambda: None
+            ])
+            
+            def fake_sleep(seconds):
+                step = next(steps, None)
+                if step is None:
+                    raise KeyboardInterrupt
+                step()
+            
+            analyzer = mock.Mock()
+            analyzer.update_state.side_effect = lambda files, *args, **kwargs: [path.name for path in files]
+            args = mock.Mock(files=tmp, poll_interval=0, workers=1, chunksize=None)
+            with mock.patch.object(main_analysis.time, 'sleep', side_effect=fake_sleep), \
+                    mock.patch.object(main_analysis, 'publish_results') as publish:
+                main_analysis.watch_trip_files(analyzer, args, Path(tmp) / 'state.npz', Path(tmp))
+        
+        batches = [call.args[0] for call in analyzer.update_state.call_args_list]
+        self.assertEqual(batches, [[first], [second]])
+        self.assertEqual(publish.call_count, 2)
 
 
 if __name__ == '__main__':